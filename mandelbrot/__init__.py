@@ -1 +1,51 @@
+"""
 
+Package computing the Mandelbrot set using different optimisation techniques
+(see README.txt).
+
+The main function of the package is render() (see engines.py), which
+computes a view of the set with any of the methods of the package:
+
+    import mandelbrot
+    res = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), width = 1000, height = 1000)
+
+Deep zooms (views narrower than around 1e-13) are computed with render_deep()
+(see perturbation.py). TileCache (see tile_cache.py) caches the tiles of
+views, so overlapping views (e.g. when panning and zooming) are not computed
+again, and View (see view.py) only computes the values that are new when
+a view is panned or zoomed.
+
+Importing the package only imports numpy. The numpy-only methods from
+numpy_methods.py are available right away as mandelbrot.numpy_masked and
+mandelbrot.interior_mask, and the modules of the package are imported the
+first time they are accessed, e.g. mandelbrot.optimisation_methods or
+mandelbrot.tiled. numba is only imported once a numba-optimised function is
+used (see lazy_numba.py), and matplotlib and pandas only by the functions and
+scripts that plot or save results.
+
+"""
+
+import importlib
+
+from mandelbrot.numpy_methods import interior_mask, numpy_masked
+from mandelbrot.engines import render, render_progressive, register_engine, available_engines, choose_engine
+from mandelbrot.perturbation import render_deep
+from mandelbrot.tile_cache import TileCache
+from mandelbrot.view import View
+
+
+# modules that are imported when they are accessed as an attribute of the
+# package (run.py and plot_z_values.py are scripts, so they are not included)
+_MODULES = ['benchmark', 'distributed', 'engines', 'lazy_numba', 'load_test', 'mandelbrot_alg',
+            'multiprocessing_mandelbrot', 'numpy_methods', 'optimisation_methods', 'perturbation', 'server',
+            'threaded', 'tile_cache', 'tiled', 'view']
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        return importlib.import_module('mandelbrot.' + name)
+    raise AttributeError(f"module 'mandelbrot' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + _MODULES)
@@ -1,139 +1,984 @@
 """
 
-Profiling script. Calls the different methods in optimisation_methods.py, 
-evaluates and times them. Finally, it plots the results. Results for computing
-5000 x 5000 values of :math:`c` on my machine (2017 MacBook Pro with a 2.2 Ghz 
-Intel i7 processor) can be found in the benchmark_output folder.
+Benchmark suite. Times the different methods in optimisation_methods.py for a
+sweep over the detail, the maximum number of iterations :math:`I` and the
+threshold :math:`T`, reports the results and compares them against a stored
+baseline. Results for computing 5000 x 5000 values of :math:`c` on my machine
+(2017 MacBook Pro with a 2.2 Ghz Intel i7 processor) can be found in the
+benchmark_output folder.
 
+Run it from the root of the repository, for example:
 
-Every time a function is profiled, it is ran first to 'warm up the computer'
-(or something similar that Thomas said during the lecture). 
+    python -m mandelbrot.benchmark --detail 1000 --I 100 1000 --repeats 5
+        --csv benchmark_output/results.csv
+        --baseline mandelbrot/benchmark_output/methods_benchmark.csv
 
-Why I think it might be necessary (and correct me if I'm wrong) is that memory 
-allocation only happens the first time it is run. Then the second iteration, 
-the functionly only has to overwrite already allocated memory. As we want to 
-time the functionality of the various methods and not the time it takes to 
-allocate memory, we do it this way.
+The methods that are benchmarked are listed in RENDERERS. Every method is
+called as method(detail, rVals, iVals, res, I=I, T=T). The slow methods
+(naive() and vectorised()) are only included when --include-slow is given or
+when they are asked for explicitly using --methods.
+
+Every combination of method, detail, :math:`I` and :math:`T` is first run
+--warmup times without being timed. For the numba-optimised methods, the first
+run includes the compilation of the function. Furthermore, memory allocation
+only happens the first time the function is run. As we want to time the
+functionality of the various methods, and not the time it takes to compile
+them or to allocate memory, these runs are not measured. After that, the
+method is timed --repeats times using time.perf_counter_ns() and the median
+and interquartile range (IQR) of these times are reported, which are less
+sensitive to the odd slow run than the mean.
+
+The results can be saved to JSON (--json) and CSV (--csv). When a baseline is
+given (--baseline, either a CSV or JSON file saved by this script or the
+benchmark_output/methods_benchmark.csv file saved by the first version of this
+script), the median times are compared to the baseline for the same method,
+detail, :math:`I` and :math:`T`, and the script exits with exit code 1 if any
+method is more than --tolerance slower than the baseline. This way the script
+can be used as a performance regression check.
 
 Results and discussion:
-    
-    Results show that the naive implementation is by far the slowest (as 
-    expected). Vectorisation already helps quite a bit and causes a ca. 3.3x 
-    speedup when compared to the non-optimised method. The main speed-up, 
-    however, happens by using jit-compilation which speeds the naive 
-    implementation up by around x108.3!! Vectorisation after using jit 
-    compilation (using neither normal nor general ufuncs) does not change 
-    the speed by a significant amount. The parallelisation using 
+
+    Results show that the naive implementation is by far the slowest (as
+    expected). Vectorisation already helps quite a bit and causes a ca. 3.3x
+    speedup when compared to the non-optimised method. The main speed-up,
+    however, happens by using jit-compilation which speeds the naive
+    implementation up by around x108.3!! Vectorisation after using jit
+    compilation (using neither normal nor general ufuncs) does not change
+    the speed by a significant amount. The parallelisation using
     @njit(parallel=True) does improve the speed for a total x320.5 speed up!
-                      
+
+    The methods are also timed with the interior check (see interior() in
+    mandelbrot_alg.py) enabled, to show how much time is spent on values of
+    :math:`c` in the main cardioid and the period-2 bulb.
+
+    The --micro option runs a micro-benchmark that compares the time per
+    value of :math:`c` of M_jit (complex arithmetic, :math:`|z| > T`) and
+    M_jit_sq (split real and imaginary parts, :math:`|z|^2 > T^2`) from
+    mandelbrot_alg.py for I = 100 and I = 1000.
+
+    The --startup option measures the cold start of a new process: the time
+    from the start of the interpreter until the first frame has been rendered
+    with njit_par() (import of the package, compilation or loading of the
+    numba functions and the render itself). This is measured in a fresh
+    Python process with an empty numba cache (so everything is compiled) and
+    with a cache filled by a previous process (so the compiled functions are
+    loaded from disk, see warm_up() in optimisation_methods.py), which is the
+    situation of every render worker after the first one.
+
+    The --record-engines option times the engines of render() (see
+    engines.py) for a few sizes of the view and numbers of iterations and
+    saves the results to benchmark_output/engine_timings.json, which is used
+    by render(engine='auto') to pick the fastest engine for a view.
+
+    M_jit_sq() stops iterating a value of :math:`c` as soon as it crosses the
+    threshold, which is a branch that depends on the data, so numba cannot
+    turn the loop into SIMD instructions and jit_vectorised and 
+    gu_jit_vectorised are no faster than jit_func. njit_par_lanes iterates 16 
+    values of :math:`c` in lockstep with masked updates instead (see 
+    njit_par_lanes_tile() in optimisation_methods.py), which LLVM does 
+    vectorise: on an AVX-512 machine it is around 3.5 times faster than 
+    njit_par for I = 1000. The --lanes option compares different numbers of 
+    lanes, float64 and float32.
+
+    The --schedule option shows how evenly the work is divided over the 
+    threads when the rows are divided in contiguous blocks (like prange), 
+    cyclically, or by longest processing time first (see 
+    njit_par_balanced_tile() in optimisation_methods.py). For the default 
+    view with I = 1000 on 32 threads, the slowest thread of the contiguous 
+    blocks does 3.2 times the mean work, i.e. the render takes 3.2 times as 
+    long as it would when balanced, against 1.03 for the cyclic and 1.01 for
+    the lpt schedule.
+
+    The --threads option measures the number of small renders per second 
+    when several threads render at the same time, as the threads of a web 
+    server do, for the jit, njit_par and threads engines (see threaded.py).
+
+    The --deep option compares the time per value of :math:`c` of a deep zoom
+    computed with perturbation (see perturbation.py) to a float64 view of the
+    same size with njit_par, and to computing every value of :math:`c` in
+    arbitrary precision.
+
+    The --series option compares the number of iterations computed for a deep
+    zoom with and without series approximation (see perturbation.py).
+
+    The --import-time option measures how long importing the modules of the
+    package takes in a new Python process (using python -X importtime) and
+    lists the heavy dependencies (numba, matplotlib, pandas, h5py) that are
+    imported with them. None of them should be: they are only imported when
+    a numba-optimised function is called or results are plotted (see
+    lazy_numba.py).
+
 """
 
-import numpy as np
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import time
-import pandas as pd
-import matplotlib.pyplot as plt
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+from mandelbrot.lazy_numba import njit
+import mandelbrot.optimisation_methods as OM
+import mandelbrot.mandelbrot_alg as mb
+from mandelbrot.engines import count_dtype
+
+
+# A method to benchmark: its name, the function that is called as
+# func(detail, rVals, iVals, res, I=I, T=T), and whether it is slow
+Renderer = namedtuple('Renderer', ['name', 'func', 'slow'])
+
+
+def _jit_save_z(detail, rVals, iVals, res, I = 100, T = 2):
+
+    """
+
+    Calls jit_save_z() with the same arguments as the other methods.
+
+    """
+
+    z_res = np.zeros((detail, detail), dtype=np.complex128)
+    return OM.jit_save_z(detail, rVals, iVals, res, z_res, I, T)[1]
+
+
+def _njit_par_count(detail, rVals, iVals, res, I = 100, T = 2):
+
+    """
+
+    Calls njit_par_count_tile() with the same arguments as the other methods,
+    writing the numbers of iterations into the smallest unsigned integer type
+    that fits I instead of res.
+
+    """
+
+    counts = np.empty((detail, detail), dtype=count_dtype(I))
+    return OM.njit_par_count_tile(rVals, iVals, counts, I, float(T), False, 0.0)
+
+
+def _njit_par_lanes(detail, rVals, iVals, res, I = 100, T = 2, dtype = np.float64):
+
+    """
+
+    Calls njit_par_lanes_tile() with the same arguments as the other methods,
+    iterating in dtype.
+
+    """
+
+    return OM.njit_par_lanes_tile(rVals.astype(dtype), iVals.astype(dtype), res, I, float(T), 16, 8)
+
+
+RENDERERS = [Renderer('naive', OM.naive, True),
+             Renderer('jit_func', OM.jit_func, False),
+             Renderer('njit_par', OM.njit_par, False),
+             Renderer('vectorised', OM.vectorised, True),
+             Renderer('jit_vectorised', OM.jit_vectorised, False),
+             Renderer('gu_jit_vectorised', OM.gu_jit_vectorised, False),
+             Renderer('numpy_masked', OM.numpy_masked, False),
+             Renderer('njit_par_interior', partial(OM.njit_par, interior=True), False),
+             Renderer('numpy_masked_interior', partial(OM.numpy_masked, interior=True), False),
+             Renderer('mariani_silver', OM.mariani_silver, False),
+             Renderer('jit_save_z', _jit_save_z, False),
+             Renderer('njit_par_count', _njit_par_count, False),
+             Renderer('njit_par_lanes', _njit_par_lanes, False),
+             Renderer('njit_par_lanes_float32', partial(_njit_par_lanes, dtype=np.float32), False)]
+
+
+# Fields of a result, in the order they are saved to CSV
+FIELDS = ['method', 'detail', 'I', 'T', 'repeats', 'median_s', 'q1_s', 'q3_s', 'iqr_s',
+          'min_s', 'mean_s', 'ns_per_pixel']
+
+
+def get_renderers(names = None, include_slow = False):
+
+    """
+
+    Returns the renderers from RENDERERS with the given names (all of them if
+    names is None, leaving out the slow ones unless include_slow is True).
+
+    """
+
+    if names is None:
+        return [r for r in RENDERERS if include_slow or not r.slow]
+
+    by_name = {r.name : r for r in RENDERERS}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise ValueError(f'Unknown methods: {unknown}. Choose from {list(by_name)}')
+
+    return [by_name[n] for n in names]
+
+
+def time_renderer(renderer, detail, I = 100, T = 2, repeats = 5, warmup = 1):
+
+    """
+
+    Times a single renderer for detail x detail values of c in the default
+    view.
+
+    OUTPUT::
+
+        times : list of ints
+            The time of every repeat in nanoseconds.
+
+    """
+
+    rVals = np.linspace(-2.0, 1.0, detail)
+    iVals = np.linspace(-1.5, 1.5, detail)
+    res = np.zeros((detail, detail))
+
+    # warm up (compilation and memory allocation) without measuring
+    for _ in range(warmup):
+        renderer.func(detail, rVals, iVals, res, I=I, T=T)
+
+    times = []
+    for _ in range(repeats):
+        tic = time.perf_counter_ns()
+        renderer.func(detail, rVals, iVals, res, I=I, T=T)
+        times.append(time.perf_counter_ns() - tic)
+
+    return times
+
+
+def summarise(name, detail, I, T, times):
+
+    """
+
+    Computes the statistics of the times (in nanoseconds) of a single
+    benchmark and returns them as a dictionary with the keys in FIELDS.
+
+    """
+
+    seconds = np.array(times) / 1e9
+    q1, median, q3 = np.percentile(seconds, [25, 50, 75])
+
+    return {'method' : name, 'detail' : detail, 'I' : I, 'T' : T, 'repeats' : len(times),
+            'median_s' : median, 'q1_s' : q1, 'q3_s' : q3, 'iqr_s' : q3 - q1,
+            'min_s' : seconds.min(), 'mean_s' : seconds.mean(),
+            'ns_per_pixel' : median * 1e9 / detail**2}
+
+
+def run_suite(renderers, details = (1000,), Is = (100,), Ts = (2,), repeats = 5, warmup = 1,
+              verbose = True):
+
+    """
+
+    Runs the benchmark for every combination of renderer, detail, I and T.
+
+    OUTPUT::
+
+        results : list of dicts
+            The statistics of every benchmark (see summarise()).
+
+    """
+
+    results = []
+    for detail in details:
+        for I in Is:
+            for T in Ts:
+                for renderer in renderers:
+                    times = time_renderer(renderer, detail, I, T, repeats, warmup)
+                    result = summarise(renderer.name, detail, I, T, times)
+                    results.append(result)
+
+                    if verbose:
+                        print(f'{renderer.name:22s} detail = {detail:5d}, I = {I:5d}, T = {T:g} : '
+                              f'median {result["median_s"]:10.3e} [s], IQR {result["iqr_s"]:10.3e} [s], '
+                              f'{result["ns_per_pixel"]:8.2f} [ns / pixel]')
+
+    return results
+
+
+def print_speed_ups(results, reference = 'naive'):
+
+    """
+
+    Prints the speed up from the reference method to every other method for
+    every detail, I and T the reference method has been benchmarked for.
+
+    """
+
+    for ref in [r for r in results if r['method'] == reference]:
+        for result in results:
+            if result is ref or (result['detail'], result['I'], result['T']) != (ref['detail'], ref['I'], ref['T']):
+                continue
+            speed_up = ref['median_s'] / result['median_s']
+            print(f'Speed up from {reference} to {result["method"]} (detail = {ref["detail"]:d}, '
+                  f'I = {ref["I"]:d}) is x{speed_up:3.1f}')
+
+
+def save_json(results, file_name):
+
+    """
+
+    Saves the results to a JSON file.
+
+    """
+
+    with open(file_name, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def save_csv(results, file_name):
+
+    """
+
+    Saves the results to a CSV file with the columns in FIELDS.
+
+    """
+
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def load_baseline(file_name, detail = 5000, I = 100, T = 2):
+
+    """
+
+    Loads the median times of a baseline saved by save_json() or save_csv(),
+    or of the methods_benchmark.csv file saved by the first version of this
+    script (which only contains the method and the time for a single run, for
+    the given detail, I and T).
+
+    OUTPUT::
+
+        baseline : dict
+            Median time in seconds for every (method, detail, I, T).
+
+    """
+
+    if file_name.endswith('.json'):
+        with open(file_name) as f:
+            rows = json.load(f)
+    else:
+        with open(file_name, newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    baseline = {}
+    for row in rows:
+        if 'median_s' in row:
+            key = (row['method'], int(row['detail']), int(row['I']), float(row['T']))
+            baseline[key] = float(row['median_s'])
+        else:
+            baseline[(row['Method'], detail, I, float(T))] = float(row['Time [s]'])
+
+    return baseline
+
+
+def compare_to_baseline(results, baseline, tolerance = 0.1, verbose = True):
+
+    """
+
+    Compares the median times of the results to the baseline.
+
+    INPUT::
+
+        results : list of dicts
+            Results returned by run_suite().
+
+        baseline : dict
+            Baseline returned by load_baseline().
+
+        tolerance : float
+            A method counts as a regression if its median time is more than
+            (1 + tolerance) times the baseline.
+
+    OUTPUT::
+
+        regressions : list of dicts
+            The results that are regressions, with the baseline time and the
+            ratio to the baseline added.
+
+    """
+
+    regressions = []
+    for result in results:
+        key = (result['method'], result['detail'], result['I'], float(result['T']))
+        if key not in baseline:
+            continue
+
+        ratio = result['median_s'] / baseline[key]
+        if verbose:
+            print(f'{result["method"]:22s} detail = {result["detail"]:5d}, I = {result["I"]:5d} : '
+                  f'x{ratio:6.3f} of baseline' + ('  <-- REGRESSION' if ratio > 1 + tolerance else ''))
+
+        if ratio > 1 + tolerance:
+            regressions.append(dict(result, baseline_s=baseline[key], ratio=ratio))
+
+    return regressions
+
+
+def plot_results(results, save_files = False):
+
+    """
+
+    Plots the median time per method (linearly and logarithmically) for
+    every detail, I and T in the results, sorted from slow to fast, like the
+    plots in the benchmark_output folder.
+
+    """
+
+    import matplotlib.pyplot as plt
+
+    cases = sorted({(r['detail'], r['I'], r['T']) for r in results})
+    for detail, I, T in cases:
+        case = sorted([r for r in results if (r['detail'], r['I'], r['T']) == (detail, I, T)],
+                      key=lambda r: r['median_s'], reverse=True)
+        x_data = range(1, len(case) + 1)
+
+        for scale in ['linear', 'logarithmic']:
+            fig = plt.figure(figsize=(7,5))
+            fig.add_axes([0.1, 0.25, 0.85, 0.7])
+
+            plot = plt.plot if scale == 'linear' else plt.semilogy
+            plot(x_data, [r['median_s'] for r in case])
+            plt.xticks(x_data, [r['method'] for r in case], rotation=45)
+            plt.xlabel('Method')
+            plt.ylabel('Time [s]')
+            plt.grid()
+            plt.title(f'Time to compute {detail:d} x {detail:d} values of the Mandelbrot set '
+                      f'({scale[:3]})')
+            plt.show()
+
+            if save_files:
+                fig.savefig(f'benchmark_output/time_per_method_{scale}.pdf')
+
+
+@njit(cache=True)
+def _micro_M_jit(rVals, iVals, res, I):
+
+    """
+
+    Loops over all values of c with M_jit (without parallelisation, so that
+    the time per value of c can be computed) for the micro-benchmark.
+
+    """
+
+    for i in range(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M_jit(rVals[r] + iVals[i]*1j, I, 2)
+    return res
+
+
+@njit(cache=True)
+def _micro_M_jit_sq(rVals, iVals, res, I):
+
+    """
+
+    Identical to _micro_M_jit() but using M_jit_sq.
+
+    """
+
+    for i in range(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, 2)
+    return res
+
+
+def run_micro_benchmark(micro_detail = 500, Is = (100, 1000), repeats = 5):
+
+    """
+
+    Times M_jit and M_jit_sq for micro_detail x micro_detail values of c and
+    prints the (best out of repeats) time per value of c in nanoseconds for
+    every number of iterations in Is.
+
+    """
+
+    micro_rVals = np.linspace(-2.0, 1.0, micro_detail)
+    micro_iVals = np.linspace(-1.5, 1.5, micro_detail)
+    micro_res = np.zeros((micro_detail, micro_detail))
+
+    for I in Is:
+        for name, kernel in [('M_jit', _micro_M_jit), ('M_jit_sq', _micro_M_jit_sq)]:
+            # run once to compile
+            kernel(micro_rVals, micro_iVals, micro_res, I)
+
+            best = np.inf
+            for _ in range(repeats):
+                tic = time.perf_counter_ns()
+                kernel(micro_rVals, micro_iVals, micro_res, I)
+                best = min(best, time.perf_counter_ns() - tic)
+
+            print(f'{name:10s} I = {I:5d} : {best / micro_detail**2:8.2f} [ns / pixel]')
+
+
+# Script run in a fresh process by run_startup_benchmark(). The start of the
+# interpreter is taken from the parent, as it happens before this runs.
+_STARTUP_SCRIPT = '''
+import json, time
+tic = time.perf_counter()
+import numpy as np
 import mandelbrot.optimisation_methods as OM
+imported = time.perf_counter()
+rVals = np.linspace(-2.0, 1.0, {detail:d})
+iVals = np.linspace(-1.5, 1.5, {detail:d})
+res = np.zeros(({detail:d}, {detail:d}))
+OM.njit_par({detail:d}, rVals, iVals, res, {I:d}, {T!r}, False, 0.0)
+done = time.perf_counter()
+print(json.dumps({{'import' : imported - tic, 'first_frame' : done - imported}}))
+'''
+
+
+def _subprocess_env(**variables):
+
+    """
+
+    Internal function returning the environment for a new Python process that
+    can import the package, with the extra environment variables given.
+
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, **variables)
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+    return env
+
+
+def _time_startup(detail, I, T, cache_dir):
+
+    """
+
+    Internal function to be used by run_startup_benchmark(). Renders a single
+    frame in a new Python process using cache_dir as the numba cache and
+    returns the total time from starting the process until the frame was
+    rendered, the time spent importing the package and the time spent on
+    the first frame (both measured inside the process) in seconds.
+
+    """
+
+    env = _subprocess_env(NUMBA_CACHE_DIR=cache_dir)
+    script = _STARTUP_SCRIPT.format(detail=detail, I=I, T=float(T))
+
+    tic = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    total = time.perf_counter() - tic
+
+    times = json.loads(output.strip().splitlines()[-1])
+    return total, times['import'], times['first_frame']
+
+
+def run_startup_benchmark(detail = 200, I = 100, T = 2, repeats = 3):
+
+    """
+
+    Measures the cold import-to-first-frame latency of a new process, with an
+    empty numba cache and with a cache filled by an earlier process. Prints
+    the median times and returns them as a list of dictionaries.
+
+    """
+
+    results = []
+    for cache in ['empty', 'filled']:
+        runs = []
+        with tempfile.TemporaryDirectory() as shared_dir:
+            if cache == 'filled':
+                # fill the cache, without measuring
+                _time_startup(detail, I, T, shared_dir)
+            for _ in range(repeats):
+                if cache == 'empty':
+                    with tempfile.TemporaryDirectory() as empty_dir:
+                        runs.append(_time_startup(detail, I, T, empty_dir))
+                else:
+                    runs.append(_time_startup(detail, I, T, shared_dir))
+
+        total, imported, first_frame = np.median(np.array(runs), axis=0)
+        results.append({'cache' : cache, 'detail' : detail, 'I' : I, 'T' : T,
+                        'total' : total, 'import' : imported, 'first_frame' : first_frame})
+        print(f'numba cache {cache:6s} : {total:7.3f} [s] to the first frame '
+              f'(import {imported:6.3f} [s], first frame {first_frame:6.3f} [s])')
+
+    return results
+
+
+def record_engine_timings(sizes = (64, 256, 1024), Is = (100, 1000), repeats = 3, file_name = None):
+
+    """
+
+    Times every available engine of render() (see engines.py), except the
+    slow ones, for views of size x size values of c in the default region for
+    every size in sizes and number of iterations in Is, and saves the median
+    times to file_name (defaults to engines.TIMINGS_FILE). These are the
+    timings used by the 'auto' engine of render() to pick an engine.
+
+    """
+
+    from mandelbrot import engines
+
+    timings = []
+    for name in engines.available_engines():
+        if engines.ENGINES[name].slow:
+            continue
+        for size in sizes:
+            for I in Is:
+                # warm up (compilation and memory allocation) without measuring
+                engines.render(width=size, height=size, max_iter=I, engine=name)
+
+                times = []
+                for _ in range(repeats):
+                    tic = time.perf_counter_ns()
+                    engines.render(width=size, height=size, max_iter=I, engine=name)
+                    times.append(time.perf_counter_ns() - tic)
+
+                median = float(np.median(times)) * 1e-9
+                timings.append({'engine' : name, 'pixels' : size * size, 'I' : I, 'time' : median})
+                print(f'{name:16s} {size:5d} x {size:5d}, I = {I:5d} : {median:.3e} [s]')
+
+    file_name = engines.TIMINGS_FILE if file_name is None else file_name
+    with open(file_name, 'w') as f:
+        json.dump({'cpu_count' : os.cpu_count(), 'timings' : timings}, f, indent=1)
+
+    return timings
+
+
+def run_lanes_benchmark(detail = 1000, Is = (100, 1000), lanes = (4, 8, 16, 32), chunks = (8, 32), repeats = 3):
+
+    """
+
+    Compares njit_par_lanes_tile() for different numbers of lanes, numbers of
+    iterations between refilling the lanes (chunks) and float64 and float32
+    to njit_par_tile(), for detail x detail values of c in the default
+    region. Prints the time per value of c and the speed-up.
+
+    """
+
+    rVals = np.linspace(-2.0, 1.0, detail)
+    iVals = np.linspace(-1.5, 1.5, detail)
+    res = np.zeros((detail, detail))
+
+    def median_time(func):
+        func()
+        times = []
+        for _ in range(repeats):
+            tic = time.perf_counter_ns()
+            func()
+            times.append(time.perf_counter_ns() - tic)
+        return float(np.median(times))
+
+    results = []
+    for I in Is:
+        base = median_time(lambda: OM.njit_par_tile(rVals, iVals, res, I, 2.0, False, 0.0))
+        print(f'njit_par                          I = {I:5d} : {base / detail**2:8.2f} [ns / pixel]')
+        results.append({'method' : 'njit_par', 'I' : I, 'time' : base * 1e-9})
+
+        for dtype in (np.float64, np.float32):
+            r = rVals.astype(dtype)
+            i = iVals.astype(dtype)
+            for n_lanes in lanes:
+                for chunk in chunks:
+                    t = median_time(lambda: OM.njit_par_lanes_tile(r, i, res, I, 2.0, n_lanes, chunk))
+                    name = f'lanes {np.dtype(dtype).name} {n_lanes:2d} x {chunk:2d}'
+                    print(f'{name:33s} I = {I:5d} : {t / detail**2:8.2f} [ns / pixel], x{base / t:5.2f}')
+                    results.append({'method' : name, 'I' : I, 'time' : t * 1e-9})
+
+    return results
+
+
+def run_schedule_benchmark(detail = 1000, I = 1000, n_threads = (None, 32), repeats = 3):
+
+    """
+
+    Compares the schedules of njit_par_balanced_tile() (see
+    optimisation_methods.py) for detail x detail values of c in the default
+    region: the time the render takes with the threads numba uses, and the
+    imbalance of the work over the threads (the ratio of the largest and the
+    mean number of iterations done by a thread), also for more threads than
+    this machine has (None is the number of threads numba uses).
+
+    """
+
+    rVals = np.linspace(-2.0, 1.0, detail)
+    iVals = np.linspace(-1.5, 1.5, detail)
+    res = np.zeros((detail, detail))
+
+    results = []
+    for threads in n_threads:
+        for schedule in ['static', 'cyclic', 'lpt']:
+            # warm up (compilation) without measuring
+            _, work = OM.njit_par_balanced_tile(rVals, iVals, res, I, 2.0, schedule = schedule, n_threads = threads)
+
+            times = []
+            for _ in range(repeats):
+                tic = time.perf_counter_ns()
+                OM.njit_par_balanced_tile(rVals, iVals, res, I, 2.0, schedule = schedule, n_threads = threads)
+                times.append(time.perf_counter_ns() - tic)
+
+            median = float(np.median(times)) * 1e-9
+            results.append({'schedule' : schedule, 'threads' : len(work), 'time' : median,
+                             'imbalance' : OM.imbalance(work), 'work' : work.tolist()})
+            print(f'{schedule:6s} {len(work):3d} threads, I = {I:5d} : {median:.3e} [s], '
+                  f'imbalance {OM.imbalance(work):5.2f} (slowest thread / mean)')
+
+    return results
+
+
+def run_threads_benchmark(clients = (1, 4, 16), renders = 64, size = 128, I = 1000,
+                          engines = ('jit', 'njit_par', 'threads')):
+
+    """
+
+    Measures the number of renders per second of size x size values of c in
+    the default region when clients threads render at the same time (like the
+    threads of a web server), for the engines of render() in engines (see
+    threaded.py). njit_par is left out when numba uses the workqueue
+    threading layer, which does not support concurrent parallel regions.
+
+    """
+
+    import threading
+    from mandelbrot.engines import render
+    from mandelbrot.lazy_numba import load_numba
+
+    results = []
+    for engine in engines:
+        # warm up (compilation) without measuring
+        render(width = size, height = size, max_iter = I, engine = engine)
+        if engine == 'njit_par' and load_numba().threading_layer() == 'workqueue':
+            print('njit_par skipped: the workqueue threading layer does not support concurrent calls')
+            continue
+
+        for n_clients in clients:
+            def client(n):
+                for _ in range(n):
+                    render(width = size, height = size, max_iter = I, engine = engine)
+
+            threads = [threading.Thread(target = client, args = (renders // n_clients,)) for _ in range(n_clients)]
+            tic = time.perf_counter_ns()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = (time.perf_counter_ns() - tic) * 1e-9
+
+            done = n_clients * (renders // n_clients)
+            results.append({'engine' : engine, 'clients' : n_clients, 'renders' : done, 'time' : elapsed})
+            print(f'{engine:10s} {n_clients:3d} clients, {size} x {size}, I = {I:5d} : '
+                  f'{done / elapsed:8.1f} [renders / s]')
+
+    return results
+
+
+def run_deep_benchmark(size = 300, I = 2000, scale = 1e-30, repeats = 3):
+
+    """
+
+    Compares the time per value of c of a deep zoom (of width scale around
+    the Misiurewicz point c = i) computed with render_deep() (perturbation,
+    see perturbation.py) to njit_par_tile() for a float64 view of the same
+    size around the same point, and to computing a few values of c in
+    arbitrary precision (reference_orbit()) one by one.
+
+    """
+
+    from mandelbrot.perturbation import render_deep, reference_orbit, precision_for
+
+    # warm up (compilation) without measuring
+    render_deep('0', '1', scale, size, size, I)
+
+    float_scale = 1e-3
+    rVals = np.linspace(-float_scale / 2, float_scale / 2, size)
+    iVals = np.linspace(1 - float_scale / 2, 1 + float_scale / 2, size)
+    res = np.zeros((size, size))
+    OM.njit_par_tile(rVals, iVals, res, I, 2.0, False, 0.0)
+
+    times = {'perturbation' : [], 'njit_par (float64 view)' : []}
+    for _ in range(repeats):
+        tic = time.perf_counter_ns()
+        render_deep('0', '1', scale, size, size, I)
+        times['perturbation'].append(time.perf_counter_ns() - tic)
+
+        tic = time.perf_counter_ns()
+        OM.njit_par_tile(rVals, iVals, res, I, 2.0, False, 0.0)
+        times['njit_par (float64 view)'].append(time.perf_counter_ns() - tic)
+
+    # arbitrary precision for a few values of c
+    n_exact = 5
+    precision = precision_for(scale / size)
+    tic = time.perf_counter_ns()
+    for k in range(n_exact):
+        reference_orbit(f'{k * scale / n_exact:.3e}', '1', I, 2, precision)
+    times['arbitrary precision'] = [(time.perf_counter_ns() - tic) / n_exact * size**2]
+
+    for name, t in times.items():
+        print(f'{name:25s} {size:d} x {size:d}, I = {I:d} : {np.median(t) / size**2:10.1f} [ns / pixel]')
+
+    return {name : float(np.median(t)) * 1e-9 for name, t in times.items()}
+
+
+def run_series_benchmark(size = 200, I = 100000, scale = 1e-100, terms = (0, 4, 8, 16), repeats = 3):
+
+    """
+
+    Compares the number of iterations that are actually computed for a deep
+    zoom (of width scale around the Misiurewicz point c = i) with
+    render_deep() without (terms = 0) and with series approximation with
+    different numbers of terms (see perturbation.py), and the time this takes.
+
+    """
+
+    from mandelbrot.perturbation import render_deep
+
+    # warm up (compilation) without measuring
+    render_deep('0', '1', scale, 10, 10, I)
+    render_deep('0', '1', scale, 10, 10, I, terms = 0)
+
+    results = {}
+    for n_terms in terms:
+        times = []
+        for _ in range(repeats):
+            tic = time.perf_counter_ns()
+            _, stats = render_deep('0', '1', scale, size, size, I, terms = n_terms, return_stats = True)
+            times.append(time.perf_counter_ns() - tic)
+
+        results[n_terms] = dict(stats, time = float(np.median(times)) * 1e-9)
+        print(f'terms = {n_terms:2d}: skipped {stats["skip"]:6d}, computed {stats["iterations"]:12d} iterations '
+              f'({stats["iterations"] / size**2:10.1f} per pixel), {np.median(times) * 1e-6:10.1f} [ms]')
+
+    return results
+
+
+# modules whose import time is measured by run_import_benchmark(), and the
+# heavy dependencies that should only be imported when they are used
+IMPORT_MODULES = ['mandelbrot', 'mandelbrot.numpy_methods', 'mandelbrot.optimisation_methods', 'mandelbrot.engines',
+                  'mandelbrot.tiled', 'mandelbrot.multiprocessing_mandelbrot', 'mandelbrot.benchmark']
+HEAVY_MODULES = ['numba', 'llvmlite', 'matplotlib', 'pandas', 'h5py']
+
+
+def _import_time(module):
+
+    """
+
+    Internal function to be used by run_import_benchmark(). Imports module in
+    a new Python process with "python -X importtime" and returns the
+    cumulative import time of the module in seconds and the list of heavy
+    modules (see HEAVY_MODULES) that were imported along with it.
+
+    """
+
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            env=_subprocess_env(), check=True, capture_output=True, text=True).stderr
+
+    # every line reads "import time: self [us] | cumulative | imported package"
+    cumulative = {}
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, total, name = line[len('import time:'):].split('|')
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total) * 1e-6
+
+    return cumulative[module], [m for m in HEAVY_MODULES if m in cumulative]
+
+
+def run_import_benchmark(modules = None, repeats = 3):
+
+    """
+
+    Measures the time it takes to import every module in modules (defaults to
+    IMPORT_MODULES) in a new Python process. Prints the median import time
+    and the heavy dependencies (see HEAVY_MODULES) that were imported, and
+    returns them as a list of dictionaries.
+
+    """
+
+    results = []
+    for module in (IMPORT_MODULES if modules is None else modules):
+        runs = [_import_time(module) for _ in range(repeats)]
+        median = float(np.median([t for t, _ in runs]))
+        heavy = runs[-1][1]
+        results.append({'module' : module, 'import' : median, 'heavy' : heavy})
+        print(f'{module:40s} : {median * 1e3:8.1f} [ms]' + (f' (imports {", ".join(heavy)})' if heavy else ''))
+
+    return results
+
+
+def main(argv = None):
+
+    """
+
+    Command line interface of the benchmark suite. Returns the exit code.
+
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark the methods in optimisation_methods.py.')
+    parser.add_argument('--methods', nargs='+', default=None,
+                        help='names of the methods to benchmark (default: all but the slow ones)')
+    parser.add_argument('--include-slow', action='store_true', help='also benchmark naive and vectorised')
+    parser.add_argument('--detail', nargs='+', type=int, default=[1000], help='values of detail to sweep over')
+    parser.add_argument('--I', nargs='+', type=int, default=[100], help='maximum numbers of iterations to sweep over')
+    parser.add_argument('--T', nargs='+', type=float, default=[2.0], help='thresholds to sweep over')
+    parser.add_argument('--repeats', type=int, default=5, help='number of timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='number of untimed runs per benchmark')
+    parser.add_argument('--json', help='save the results to this JSON file')
+    parser.add_argument('--csv', help='save the results to this CSV file')
+    parser.add_argument('--baseline', help='CSV or JSON file with results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed relative slow-down compared to the baseline')
+    parser.add_argument('--plot', action='store_true', help='plot the results')
+    parser.add_argument('--micro', action='store_true', help='run the M_jit vs. M_jit_sq micro-benchmark')
+    parser.add_argument('--startup', action='store_true',
+                        help='measure the import-to-first-frame time of a new process')
+    parser.add_argument('--import-time', action='store_true',
+                        help='measure the import time of the modules of the package')
+    parser.add_argument('--lanes', action='store_true',
+                        help='compare the lane-batched (SIMD) kernel for different numbers of lanes to njit_par')
+    parser.add_argument('--schedule', action='store_true',
+                        help='compare the static, cyclic and lpt schedules of the rows over the threads')
+    parser.add_argument('--threads', action='store_true',
+                        help='compare the renders per second of the engines for concurrent renders from threads')
+    parser.add_argument('--deep', action='store_true',
+                        help='compare the perturbation deep-zoom engine to float64 and arbitrary precision')
+    parser.add_argument('--series', action='store_true',
+                        help='compare the iterations computed for deep zooms with and without series approximation')
+    parser.add_argument('--record-engines', action='store_true',
+                        help="record the engine timings used by render(engine='auto')")
+    args = parser.parse_args(argv)
+
+    if args.record_engines:
+        record_engine_timings()
+        return 0
+    if args.import_time:
+        run_import_benchmark()
+    if args.lanes:
+        run_lanes_benchmark()
+    if args.schedule:
+        run_schedule_benchmark()
+    if args.threads:
+        run_threads_benchmark()
+    if args.deep:
+        run_deep_benchmark()
+    if args.series:
+        run_series_benchmark()
+
+    if args.micro:
+        run_micro_benchmark()
+    if args.startup:
+        run_startup_benchmark()
+
+    renderers = get_renderers(args.methods, args.include_slow)
+    results = run_suite(renderers, args.detail, args.I, args.T, args.repeats, args.warmup)
+    print_speed_ups(results)
+
+    if args.json:
+        save_json(results, args.json)
+    if args.csv:
+        save_csv(results, args.csv)
+    if args.plot:
+        plot_results(results)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, load_baseline(args.baseline), args.tolerance)
+        if regressions:
+            print(f'{len(regressions):d} regression(s) compared to {args.baseline}')
+            return 1
+
+    return 0
+
 
-        
-# Initialise dataframe to save execution time per method
-dataframe = pd.DataFrame ([['', 0]], columns=['Method', 'Time [s]'])
-    
-# Initialise methods    
-methods = ['OM.naive(detail, rVals, iVals, res)',
-           'OM.jit_func(detail, rVals, iVals, res)',
-           'OM.njit_par(detail, rVals, iVals, res)',
-           'OM.vectorised(detail, rVals, iVals, res)',
-           'OM.jit_vectorised(detail, rVals, iVals, res)',
-           'OM.gu_jit_vectorised(detail, rVals, iVals, res)']
-
-# if we want to save the csv file containing the processing time for each
-# individual method and overwrite the current one
-save_csv = False
-
-# if we want to save the resulting plots as pdf and overwrite the current ones
-save_files = False
-
-# sepecify amount of detail
-detail = 5000
-
-# initialise real and imaginary values for c to loop over
-rVals = np.linspace(-2.0, 1.0, detail)
-iVals = np.linspace(-1.5, 1.5, detail)
-    
-# initialise results matrix
-res = np.zeros ((detail, detail))
-
-# output the detail used for the simulation
-print('detail = {}'.format(detail))
-
-for m in methods:
-    # run function once to 'warm up computer'
-    y = eval(m)
-    
-    # time the function
-    tic = time.time()
-    y = eval(m)
-    toc = time.time() - tic
-    
-    # print result
-    print(f'{m:30s} : {toc:10.2e} [s]')
-    
-    # save result to dataframe
-    method_name = m.replace('OM.', ''). replace('(detail, rVals, iVals, res)','')
-    data = {'Method' : method_name, 'Time [s]' : toc}
-    dataframe = dataframe.append(data, ignore_index=True) 
-
-    
-# remove the row used for initialising dataframe
-dataframe = dataframe.drop(0)
-
-# sort values from slow to fast
-dataframe = dataframe.sort_values('Time [s]', 0, False)
-
-# print speed up from naive to method
-for m in methods:
-    method_name = m.replace('OM.', ''). replace('(detail, rVals, iVals, res)','')
-    if method_name == 'naive':
-        continue
-    speed_up = dataframe.loc[dataframe.Method == 'naive', 'Time [s]'].values / dataframe.loc[dataframe.Method == method_name, 'Time [s]'].values
-    print('Speed up from naive to ' + method_name + f' is x{speed_up[0]:3.1f}')
-
-# create x data
-x_data = range(1,len(methods)+1)
-
-# plot results linearly
-fig = plt.figure(figsize=(7,5))
-fig.add_axes([0.1, 0.25, 0.85, 0.7])
-
-plt.plot(x_data, dataframe.loc[:,'Time [s]'])
-plt.xticks(x_data, dataframe.loc[:, 'Method'], rotation=45)
-plt.xlabel('Method')
-plt.ylabel('Time [s]')
-plt.grid()
-plt.title(f'Time to compute {detail:d} x {detail:d} values of the Mandelbrot set (lin)')
-plt.show()
-
-# save figure
-if save_files:
-    fig.savefig('benchmark_output/time_per_method_linear.pdf')
-
-
-# plot results logarithmically
-fig = plt.figure(figsize=(7,5))
-fig.add_axes([0.1, 0.25, 0.85, 0.7])
-
-plt.semilogy(x_data, dataframe.loc[:,'Time [s]'])
-plt.xticks(x_data,dataframe.loc[:, 'Method'], rotation=45)
-plt.xlabel('Method')
-plt.ylabel('Time [s]')
-plt.grid()
-plt.title(f'Time to compute {detail:d} x {detail:d} values of the Mandelbrot set (log)')
-plt.show()
-
-# save figure
-if save_files:
-    fig.savefig('benchmark_output/time_per_method_logarithmic.pdf')
-
-# overwrite the csv file if specified at the beginning
-if save_csv:
-    dataframe.to_csv('benchmark_output/methods_benchmark.csv')
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,482 @@
+"""
+
+This file renders the Mandelbrot set with worker processes that can run on
+other machines, for views too large for the cores of one machine (e.g.
+poster-size renders). multiprocessing_mandelbrot.py is limited to the
+processes of one machine, as the workers write into shared memory.
+
+A coordinator (render_distributed()) divides the view into tiles of
+tile_size x tile_size values of :math:`c` (see tile_bounds() in tiled.py) and
+listens for workers on a TCP address (or a Unix socket, if the address is a
+path) using multiprocessing.connection. Every worker (run_worker()) connects
+to it, receives the job (rVals, iVals, the number of iterations, threshold,
+output and engine) once, and then keeps asking for tiles. Every tile is
+computed with the engine of render() (see engines.py), njit_par by default, so
+a worker uses all cores of its machine, and its result is sent back to the
+coordinator, which writes it into res. When all tiles are done, the workers
+are told to stop.
+
+Workers can be started on any machine with
+
+    python -m mandelbrot.distributed worker coordinator-host:port --authkey secret
+
+and local workers (spawned processes on the machine of the coordinator) are
+started by render_distributed() itself with local_workers = n, which is how
+the tests run it.
+
+Failures:
+
+- A worker that dies (or whose machine or network connection fails) closes
+  its connection, or the connection is closed by the operating system. The
+  tiles it was computing go back to the front of the queue and are sent to
+  the next worker that asks for a tile.
+
+- A worker that is slow (e.g. an overloaded machine) still holds its tile
+  when the queue is empty. Workers that are idle then get a copy of the tile
+  that has been out for the longest, once it has been out for longer than
+  slow_after seconds (by default 3 times the median time of the tiles done so
+  far). Whichever copy finishes first is used, the other one is ignored.
+
+- If the render is not done after timeout seconds (e.g. because there are no
+  workers at all), a TimeoutError is raised.
+
+The connections are authenticated with authkey (HMAC, see the documentation
+of multiprocessing.connection) and the messages are pickled, so only run
+workers and coordinators on networks you trust and keep the key secret.
+
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+from mandelbrot.tiled import tile_bounds
+
+
+def _parse_address(address):
+
+    """
+
+    Internal function converting 'host:port' to a (host, port) tuple. Other
+    strings are Unix socket paths and tuples are returned as they are.
+
+    """
+
+    if isinstance(address, str) and ':' in address and not os.path.sep in address:
+        host, port = address.rsplit(':', 1)
+        return (host, int(port))
+    return address
+
+
+def _compute_tile(job, bounds):
+
+    """
+
+    Internal function computing the tile with bounds ((row start, row stop),
+    (column start, column stop)) of job in a worker.
+
+    """
+
+    from mandelbrot.engines import ENGINES
+
+    (r0, r1), (c0, c1) = bounds
+    sub = np.zeros((r1 - r0, c1 - c0), dtype=job['dtype'])
+    ENGINES[job['engine']].func(job['rVals'][c0:c1], job['iVals'][r0:r1], sub, job['I'], job['T'], **job['options'])
+    return sub
+
+
+def run_worker(address, authkey, connect_timeout = 30.0, crash_after = None, delay = 0.0):
+
+    """
+
+    Runs a worker: connects to the coordinator at address, computes the tiles
+    it is given until it is told to stop, and returns the number of tiles it
+    has computed.
+
+    INPUT::
+
+        address : str or tuple
+            'host:port', (host, port) or the path of a Unix socket.
+
+        authkey : bytes or str
+            Key shared with the coordinator.
+
+        connect_timeout : float
+            Number of seconds to keep trying to connect (the coordinator may
+            not be listening yet).
+
+        crash_after, delay :
+            For testing the coordinator: exit the process abruptly after
+            receiving crash_after tiles (without returning the last one), and
+            sleep delay seconds before returning every tile.
+
+    """
+
+    address = _parse_address(address)
+    authkey = authkey.encode() if isinstance(authkey, str) else authkey
+
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+    computed = 0
+    with conn:
+        try:
+            job = conn.recv()
+            conn.send(('ready', None, None))
+            while True:
+                message, tile, bounds = conn.recv()
+                if message == 'stop':
+                    break
+
+                if crash_after is not None and computed + 1 >= crash_after:
+                    os._exit(1)
+
+                sub = _compute_tile(job, bounds)
+                if delay:
+                    time.sleep(delay)
+                conn.send(('result', tile, sub))
+                computed += 1
+        except EOFError:
+            # the coordinator has finished (or gone away)
+            pass
+
+    return computed
+
+
+class _Coordinator:
+
+    """
+
+    Internal class keeping track of the tiles of a render_distributed() call:
+    which tiles are waiting, which worker is computing which tile since when,
+    and which tiles are done. All methods are called from the threads
+    handling the connections with the workers.
+
+    """
+
+    def __init__(self, bounds, res, slow_after):
+        self.bounds = bounds
+        self.res = res
+        self.slow_after = slow_after
+
+        self.pending = deque(range(len(bounds)))
+        self.out = {}                   # tile -> {worker : start time}
+        self.done = np.zeros(len(bounds), dtype=np.bool_)
+        self.n_done = 0
+        self.durations = []
+        self.cond = threading.Condition()
+
+        self.stats = {'reissued_dead' : 0, 'reissued_slow' : 0, 'duplicates' : 0, 'workers' : 0, 'lost' : 0,
+                      'tiles_per_worker' : {}}
+
+    def finished(self):
+        return self.n_done == len(self.bounds)
+
+    def _slow_after(self):
+        if self.slow_after is not None:
+            return self.slow_after
+        if not self.durations:
+            return None
+        return 3 * float(np.median(self.durations))
+
+    def next_tile(self, worker, stop):
+
+        """
+
+        Returns the next tile for worker (waiting until there is one), or None
+        if all tiles are done or stop is set.
+
+        """
+
+        with self.cond:
+            while not self.finished() and not stop.is_set():
+                if self.pending:
+                    tile = self.pending.popleft()
+                    self.out.setdefault(tile, {})[worker] = time.monotonic()
+                    return tile
+
+                # re-issue the tile that has been out the longest, if it is
+                # slow and not already being computed by this worker
+                limit = self._slow_after()
+                now = time.monotonic()
+                candidates = [(min(workers.values()), tile) for tile, workers in self.out.items()
+                              if worker not in workers and len(workers) < 2]
+                if limit is not None and candidates:
+                    started, tile = min(candidates)
+                    if now - started > limit:
+                        self.out[tile][worker] = now
+                        self.stats['reissued_slow'] += 1
+                        return tile
+
+                self.cond.wait(0.05)
+            return None
+
+    def complete(self, worker, tile, sub):
+
+        """
+
+        Writes the result of tile computed by worker into res, unless another
+        worker has done it already.
+
+        """
+
+        with self.cond:
+            started = self.out.get(tile, {}).get(worker)
+            if self.done[tile]:
+                self.stats['duplicates'] += 1
+            else:
+                (r0, r1), (c0, c1) = self.bounds[tile]
+                self.res[r0:r1, c0:c1] = sub
+                self.done[tile] = True
+                self.n_done += 1
+                self.out.pop(tile, None)
+                if started is not None:
+                    self.durations.append(time.monotonic() - started)
+            tiles = self.stats['tiles_per_worker']
+            tiles[worker] = tiles.get(worker, 0) + 1
+            self.cond.notify_all()
+
+    def lost(self, worker):
+
+        """
+
+        Puts the tiles worker was computing back in the queue, when its
+        connection is lost.
+
+        """
+
+        with self.cond:
+            self.stats['lost'] += 1
+            for tile in list(self.out):
+                workers = self.out[tile]
+                if workers.pop(worker, None) is not None and not workers:
+                    del self.out[tile]
+                    if not self.done[tile]:
+                        self.pending.appendleft(tile)
+                        self.stats['reissued_dead'] += 1
+            self.cond.notify_all()
+
+
+def _serve(conn, worker, coordinator, job, stop):
+
+    """
+
+    Internal function handling the connection with one worker (in its own
+    thread) for render_distributed().
+
+    """
+
+    try:
+        with conn:
+            conn.send(job)
+            while True:
+                message, tile, sub = conn.recv()
+                if message == 'result':
+                    coordinator.complete(worker, tile, sub)
+
+                tile = coordinator.next_tile(worker, stop)
+                if tile is None:
+                    conn.send(('stop', None, None))
+                    return
+                conn.send(('tile', tile, coordinator.bounds[tile]))
+    except (EOFError, OSError):
+        coordinator.lost(worker)
+
+
+def render_distributed(rVals, iVals, res, I = 100, T = 2, address = ('localhost', 0), authkey = None,
+                       tile_size = 256, local_workers = 0, engine = 'njit_par', output = 'ratio',
+                       slow_after = None, timeout = None, return_stats = False, worker_options = None, **options):
+
+    """
+
+    Computes the grid spanned by rVals and iVals with workers connecting over
+    the network (see the description at the top of this file).
+
+    INPUT::
+
+        rVals, iVals, res, I, T :
+            See njit_par_tile() in optimisation_methods.py. res can have any
+            data type the engine can write (e.g. unsigned integers for
+            output = 'count').
+
+        address : str or tuple
+            Address to listen on for workers: (host, port), 'host:port' or
+            the path of a Unix socket. Port 0 picks a free port.
+
+        authkey : bytes or str
+            Key the workers need to connect, random if None (only useful with
+            local workers).
+
+        tile_size : int
+            Number of rows and columns of the tiles.
+
+        local_workers : int
+            Number of worker processes to start on this machine.
+
+        engine, output, options :
+            The engine of render() the workers use, and the output and
+            options passed on to it (see engines.py).
+
+        slow_after : float or None
+            Number of seconds after which a tile is given to another idle
+            worker as well (see the description at the top of this file).
+
+        timeout : float or None
+            Number of seconds after which to give up and raise a TimeoutError.
+
+        return_stats : bool
+            Also return a dictionary with the number of workers that
+            connected and were lost, the number of tiles re-issued because
+            their worker died or was slow, the number of duplicate results
+            and the number of tiles computed by every worker.
+
+        worker_options : list of dicts
+            Keyword arguments of run_worker() for every local worker (for
+            testing, e.g. crash_after or delay), one per local worker.
+
+    OUTPUT::
+
+        res : Numpy array of size (len(iVals), len(rVals))
+            The result.
+
+    """
+
+    from mandelbrot.engines import ENGINES, OUTPUTS, check_options
+
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine}, choose from {list(ENGINES)}')
+    if output not in OUTPUTS:
+        raise ValueError(f'Unknown output {output}, choose from {OUTPUTS}')
+    check_options(engine, options)
+    if output != 'ratio':
+        options['output'] = output
+    worker_options = [{}] * local_workers if worker_options is None else list(worker_options)
+    if len(worker_options) != local_workers:
+        raise ValueError(f'worker_options has {len(worker_options)} entries for {local_workers} local workers')
+
+    authkey = os.urandom(16) if authkey is None else authkey
+    authkey = authkey.encode() if isinstance(authkey, str) else authkey
+
+    bounds = [(rows, cols) for rows in tile_bounds(iVals.shape[0], tile_size)
+              for cols in tile_bounds(rVals.shape[0], tile_size)]
+    coordinator = _Coordinator(bounds, res, slow_after)
+    job = {'rVals' : np.ascontiguousarray(rVals, dtype=np.float64),
+           'iVals' : np.ascontiguousarray(iVals, dtype=np.float64),
+           'I' : int(I), 'T' : float(T), 'dtype' : res.dtype, 'engine' : engine, 'options' : options}
+
+    stop = threading.Event()
+    listener = Listener(_parse_address(address), authkey=authkey)
+    handlers = []
+
+    def accept():
+        # accepts workers until the render is done (or stopped)
+        while not stop.is_set():
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, mp.AuthenticationError):
+                if stop.is_set():
+                    return
+                continue
+            if stop.is_set():
+                conn.close()
+                return
+            with coordinator.cond:
+                worker = coordinator.stats['workers']
+                coordinator.stats['workers'] += 1
+            handler = threading.Thread(target=_serve, args=(conn, worker, coordinator, job, stop), daemon=True)
+            handler.start()
+            handlers.append(handler)
+
+    acceptor = threading.Thread(target=accept, daemon=True)
+    acceptor.start()
+
+    processes = []
+    try:
+        # local workers are spawned, like in multiprocessing_mandelbrot.py
+        for k in range(local_workers):
+            process = mp.get_context('spawn').Process(target=run_worker, args=(listener.address, authkey),
+                                                      kwargs=worker_options[k], daemon=True)
+            process.start()
+            processes.append(process)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with coordinator.cond:
+            while not coordinator.finished():
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f'{coordinator.n_done} of {len(bounds)} tiles done after {timeout} s')
+                coordinator.cond.wait(0.1)
+    finally:
+        stop.set()
+        with coordinator.cond:
+            coordinator.cond.notify_all()
+
+        # wake up the accepting thread with a connection of our own
+        try:
+            Client(listener.address, authkey=authkey).close()
+        except OSError:
+            pass
+        acceptor.join(5)
+        listener.close()
+
+        # the threads of workers that are still computing a copy of a tile
+        # that is done already are not waited for (they are daemon threads),
+        # and local workers that do not stop are terminated
+        for handler in handlers:
+            handler.join(0.1)
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+
+    if return_stats:
+        return res, coordinator.stats
+    return res
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Distributed rendering of the Mandelbrot set')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    worker_parser = subparsers.add_parser('worker', help='run a worker')
+    worker_parser.add_argument('address', help='address of the coordinator, host:port or a Unix socket path')
+    worker_parser.add_argument('--authkey', required=True, help='key shared with the coordinator')
+
+    render_parser = subparsers.add_parser('render', help='run a coordinator and save the result as .npy')
+    render_parser.add_argument('output_file')
+    render_parser.add_argument('--address', default='0.0.0.0:6000', help='address to listen on (host:port)')
+    render_parser.add_argument('--authkey', required=True, help='key shared with the workers')
+    render_parser.add_argument('--width', type=int, default=10000)
+    render_parser.add_argument('--height', type=int, default=10000)
+    render_parser.add_argument('--region', type=float, nargs=4, default=[-2.0, 1.0, -1.5, 1.5])
+    render_parser.add_argument('--I', type=int, default=100)
+    render_parser.add_argument('--tile-size', type=int, default=1024)
+    render_parser.add_argument('--local-workers', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == 'worker':
+        print(f'computed {run_worker(args.address, args.authkey)} tiles')
+        sys.exit()
+
+    re_min, re_max, im_min, im_max = args.region
+    rVals = np.linspace(re_min, re_max, args.width)
+    iVals = np.linspace(im_min, im_max, args.height)
+    res = np.lib.format.open_memmap(args.output_file, mode='w+', dtype=np.float64, shape=(args.height, args.width))
+    tic = time.time()
+    _, stats = render_distributed(rVals, iVals, res, args.I, address=args.address, authkey=args.authkey,
+                                  tile_size=args.tile_size, local_workers=args.local_workers, return_stats=True)
+    res.flush()
+    print(f'rendered in {time.time() - tic:.3f} s: {stats}')
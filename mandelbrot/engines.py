@@ -0,0 +1,633 @@
+"""
+
+This file contains render(), a single function to compute any (possibly
+non-square) view of the Mandelbrot set with any of the methods in
+optimisation_methods.py and numpy_methods.py, e.g.
+
+    res = mandelbrot.render((-0.75, -0.73, 0.1, 0.12), 1920, 1080, max_iter = 1000)
+
+The methods are registered as engines in ENGINES. An engine is a function
+func(rVals, iVals, res, I, T, **options) that fills res, a matrix of size
+(len(iVals), len(rVals)), with the result of the function generating the
+Mandelbrot set and returns it. New engines can be added with
+register_engine(). The following engines are registered:
+
+- 'naive': naive_tile() (pure Python, very slow)
+- 'vectorised': vectorised() (numba ufunc calling the non-optimised M())
+- 'numpy': numpy_masked_tile() (only needs numpy)
+- 'jit': jit_func_tile()
+- 'jit_vectorised': jit_vectorised()
+- 'njit_par': njit_par_tile()
+- 'threads': render_threaded() in threaded.py (bands of rows computed by a
+  pool of threads, for concurrent renders in one process)
+- 'njit_lanes': njit_par_lanes_tile() (njit_par with the values of c of every
+  row iterated in SIMD lanes)
+- 'perturbation': perturbation_engine() in perturbation.py (the deep-zoom
+  method, for views given as float64 regions; use render_deep() for deeper
+  zooms)
+
+gu_jit_vectorised() and mariani_silver() only work for square grids, so they
+are not registered (mariani_silver() is not exact either).
+
+Every engine lists the modules it needs (e.g. numba). Engines of which the
+modules are not installed are not available. Every engine also lists the
+options it supports (e.g. interior and cycle_tol, see ENGINE_OPTIONS);
+render() raises a ValueError for an option the engine does not support
+instead of passing it on, and 'auto' only picks engines that support all
+options that are given. The 'auto' engine picks the
+available engine that is expected to be fastest for the size of the view and
+the maximum number of iterations, based on the timings recorded by the
+benchmark suite in benchmark_output/engine_timings.json (run
+"python -m mandelbrot.benchmark --record-engines" from the root of the
+repository to record them). The timings depend on the machine (e.g. the
+number of cores and the SIMD instructions), so the file is not part of the
+repository (see .gitignore): every machine records its own. The engine that was fastest for
+the recorded size and number of iterations closest to the requested ones is
+chosen. If no timings are recorded, the first available engine of
+AUTO_PREFERENCE is used.
+
+Besides the ratio of iterations, render() can compute the continuous
+iteration count (output = 'smooth') and the exterior distance estimate
+(output = 'distance') described in mandelbrot_alg.py. Only the njit_par and
+threads engines compute these.
+
+Progressive rendering:
+
+render() only returns once the whole view has been computed. For interactive
+use, render_progressive() first computes a coarse grid of values of c (every
+8th row and column by default, 64 times fewer values), yields it as a preview
+and then refines it in passes (every 4th, 2nd and finally every row and
+column), only computing the values of c that were not computed in the
+previous passes, so the whole view takes as long as render() (apart from the
+overhead of calling the engine a few more times). With skip_uniform = True,
+values of c of which the surrounding values of the previous pass are all the
+same are not computed but filled in, like mariani_silver() does for
+rectangles, which is faster but not exact. render(..., callback = f) calls
+f(step, res) with every pass instead.
+
+Compact results:
+
+The ratio of iterations is stored as a float64 (8 bytes per value of c),
+while it only takes :math:`I` different values. With output = 'count',
+render() stores the number of iterations instead, in the smallest unsigned
+integer type that fits :math:`I` (see count_dtype(): 1 byte per value of
+:math:`c` for :math:`I < 256`, 2 bytes for :math:`I < 65536`), which takes
+4 to 8 times less memory and makes the parallel writers in njit_par write
+4 to 8 times less data. The result is returned as a CountArray, which
+computes the ratio count / I (exactly the value the other outputs would
+have returned) only for the part of the matrix that is read. tiled.py can
+store its results this way as well.
+
+"""
+
+import os
+import json
+import importlib.util
+from collections import namedtuple
+
+import numpy as np
+import mandelbrot.optimisation_methods as OM
+from mandelbrot.numpy_methods import numpy_masked_tile
+from mandelbrot.perturbation import perturbation_engine
+from mandelbrot.threaded import render_threaded
+
+
+# An engine: its name, the function computing a grid, the modules it needs,
+# whether it should be left out of the recorded timings (and so of 'auto'),
+# e.g. because it is far too slow, the outputs it can compute (see OUTPUTS), a
+# short description and the names of the options (keyword arguments other
+# than output) it supports
+Engine = namedtuple('Engine', ['name', 'func', 'requires', 'slow', 'outputs', 'description', 'options'])
+
+# what render() can compute for every value of c: the ratio of the iteration
+# at which |z| crossed the threshold (M_jit_sq()), the continuous iteration
+# count (M_smooth_sq()), the distance estimate (M_distance_sq()) or the
+# number of iterations (M_count_sq())
+OUTPUTS = ['ratio', 'smooth', 'distance', 'count']
+
+ENGINES = {}
+
+# file with the timings used by the 'auto' engine (see benchmark.py)
+TIMINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_output',
+                            'engine_timings.json')
+
+# the options of the engines that iterate M_jit_sq() (see njit_par_tile() in
+# optimisation_methods.py)
+ENGINE_OPTIONS = ('interior', 'cycle_tol')
+
+# engines tried by 'auto' (in this order) if there are no recorded timings
+AUTO_PREFERENCE = ['njit_par', 'jit', 'jit_vectorised', 'numpy', 'vectorised', 'naive']
+
+# the default region: the whole Mandelbrot set, as in the other scripts
+DEFAULT_REGION = (-2.0, 1.0, -1.5, 1.5)
+
+_timings = None
+
+
+def count_dtype(I):
+
+    """
+
+    Returns the smallest unsigned integer numpy dtype that can store the
+    numbers of iterations 0, ..., I.
+
+    """
+
+    for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
+        if I <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+
+    raise ValueError(f'I = {I} is too large')
+
+
+class CountArray:
+
+    """
+
+    Matrix of numbers of iterations (counts, e.g. a numpy array or a
+    numpy.memmap of unsigned integers) that reads as the matrix of ratios 
+    count / I returned by the other methods. The ratios are only computed for
+    the part of the matrix that is indexed, e.g. counts_array[:100, :] only
+    reads and converts the first 100 rows, and numpy.asarray(counts_array)
+    converts the whole matrix.
+
+    """
+
+    def __init__(self, counts, I):
+        self.counts = counts
+        self.I = I
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    @property
+    def ndim(self):
+        return self.counts.ndim
+
+    @property
+    def dtype(self):
+        # the dtype of the ratios, not of the counts
+        return np.dtype(np.float64)
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, key):
+        return np.true_divide(self.counts[key], self.I)
+
+    def __array__(self, dtype = None):
+        ratio = self[...]
+        return ratio if dtype is None else ratio.astype(dtype)
+
+    def ratio(self):
+
+        """
+
+        Returns the whole matrix of ratios as a float64 numpy array.
+
+        """
+
+        return self[...]
+
+    def __repr__(self):
+        return f'CountArray(shape={self.shape}, I={self.I}, counts dtype={self.counts.dtype})'
+
+
+def register_engine(name, func, requires = (), slow = False, outputs = ('ratio',), description = '', options = ()):
+
+    """
+
+    Registers the function func as an engine for render(). func is called as
+    func(rVals, iVals, res, I, T, **options) and fills res (of size
+    (len(iVals), len(rVals))). requires lists the modules the engine needs,
+    and options the names of the keyword arguments it supports (e.g.
+    ['interior', 'cycle_tol']). Engines that can compute other outputs than
+    'ratio' (see OUTPUTS) get the output as the keyword argument output.
+    Registering an engine with an existing name replaces it.
+
+    """
+
+    if name == 'auto':
+        raise ValueError("'auto' is not a valid engine name")
+
+    unknown = [o for o in outputs if o not in OUTPUTS]
+    if unknown:
+        raise ValueError(f'Unknown outputs {unknown}, choose from {OUTPUTS}')
+
+    ENGINES[name] = Engine(name, func, tuple(requires), slow, tuple(outputs), description, tuple(options))
+
+
+def available_engines():
+
+    """
+
+    Returns the names of the registered engines of which all required modules
+    are installed (without importing them).
+
+    """
+
+    return [name for name, engine in ENGINES.items()
+            if all(importlib.util.find_spec(module) is not None for module in engine.requires)]
+
+
+def load_timings(file_name = None):
+
+    """
+
+    Loads the timings recorded by the benchmark suite (see
+    record_engine_timings() in benchmark.py) that are used by the 'auto'
+    engine. Returns a list of dictionaries with keys 'engine', 'pixels', 'I'
+    and 'time', or an empty list if there is no file. Without a file name,
+    TIMINGS_FILE is loaded once and kept.
+
+    """
+
+    global _timings
+
+    if file_name is None and _timings is not None:
+        return _timings
+
+    path = TIMINGS_FILE if file_name is None else file_name
+    timings = []
+    if os.path.exists(path):
+        with open(path) as f:
+            timings = json.load(f)['timings']
+
+    if file_name is None:
+        _timings = timings
+    return timings
+
+
+def choose_engine(width, height, max_iter, timings = None, output = 'ratio', options = ()):
+
+    """
+
+    Returns the name of the engine that 'auto' uses for a view of width x
+    height values of c and max_iter iterations: the available engine that 
+    can compute output, supports all options (names of keyword arguments for
+    the engine) and was fastest in the recorded timings for the number of
+    values of c and number of iterations closest (on a log scale) to the
+    requested ones.
+
+    """
+
+    if timings is None:
+        timings = load_timings()
+
+    available = [name for name in available_engines() if output in ENGINES[name].outputs]
+    supported = [name for name in available if all(o in ENGINES[name].options for o in options)]
+    if available and not supported:
+        known = {o for name in available for o in ENGINES[name].options}
+        unknown = [o for o in options if o not in known]
+        if unknown:
+            raise ValueError(f'Unknown option(s) {unknown}, the engines support {sorted(known)}')
+        raise ValueError(f'No engine supports the options {list(options)} together')
+    available = supported
+    timings = [t for t in timings if t['engine'] in available]
+
+    if not timings:
+        for name in AUTO_PREFERENCE:
+            if name in available:
+                return name
+        raise RuntimeError(f'No engine is available that can compute {output}')
+
+    # closest recorded problem size
+    def distance(t):
+        return abs(np.log(t['pixels'] / (width * height))) + abs(np.log(t['I'] / max_iter))
+
+    closest = min(timings, key=distance)
+    candidates = [t for t in timings if t['pixels'] == closest['pixels'] and t['I'] == closest['I']]
+
+    return min(candidates, key=lambda t: t['time'])['engine']
+
+
+def render(region = DEFAULT_REGION, width = 1000, height = 1000, max_iter = 100, threshold = 2,
+           engine = 'auto', dtype = np.float64, output = 'ratio', callback = None, **options):
+
+    """
+
+    Computes a view of the Mandelbrot set.
+
+    INPUT::
+
+        region : tuple of 4 floats
+            (minimum real value, maximum real value, minimum imaginary value,
+            maximum imaginary value) of c, like the extent argument of
+            matplotlib's imshow().
+
+        width : int
+            Number of values for the real component of c.
+
+        height : int
+            Number of values for the imaginary component of c.
+
+        max_iter : int
+            Maximum number of iterations.
+
+        threshold : float
+            Threshold value, larger than 1 for output = 'smooth'.
+
+        engine : str
+            Name of the engine to use (see ENGINES), or 'auto' to pick the
+            fastest available engine.
+
+        dtype : numpy dtype
+            Data type of the result. For output = 'count', the unsigned 
+            integer type of the counts, which defaults to the smallest type
+            that fits max_iter (see count_dtype()) if dtype is not an 
+            unsigned integer type.
+
+        output : str
+            What to compute for every value of c (see OUTPUTS): 'ratio' (the
+            ratio of the iteration at which |z| crossed the threshold and
+            max_iter, 1 for the values in the set), 'smooth' (the continuous 
+            iteration count divided by max_iter) or 'distance' (the estimated 
+            distance to the set, 0 for the values in the set) or 'count'
+            (the number of iterations, see the description at the top of
+            this file). See mandelbrot_alg.py.
+
+        callback : function
+            If given, the view is computed progressively (see
+            render_progressive()) and callback(step, res) is called with
+            every refinement pass, e.g. to show a preview.
+
+        options :
+            Passed on to the engine, e.g. interior = True or cycle_tol for
+            the engines that support them (see njit_par() in
+            optimisation_methods.py).
+
+    OUTPUT::
+
+        res : Numpy array of size (height, width)
+            Matrix containing the result of the function generating the
+            Mandelbrot set, where the rows are the imaginary values of c
+            (from the minimum to the maximum) and the columns the real values.
+            A CountArray for output = 'count'.
+
+    """
+
+    if callback is not None:
+        for step, res, _ in render_progressive(region, width, height, max_iter, threshold, engine, dtype, output,
+                                               **options):
+            callback(step, res)
+        return res
+
+    func, rVals, iVals, res, options = _prepare(region, width, height, max_iter, threshold, engine, dtype, output, options)
+
+    # the types of the numba signatures in optimisation_methods.SIGNATURES
+    func(rVals, iVals, res, int(max_iter), float(threshold), **options)
+
+    if output == 'count':
+        return CountArray(res, int(max_iter))
+
+    return res
+
+
+def _prepare(region, width, height, max_iter, threshold, engine, dtype, output, options):
+
+    """
+
+    Internal function checking the arguments of render() and
+    render_progressive(), and returning the function of the engine, the
+    values of c, the (empty) result matrix and the options for the engine.
+
+    """
+
+    if width < 1 or height < 1:
+        raise ValueError(f'width and height must be positive, got {width} x {height}')
+
+    if output not in OUTPUTS:
+        raise ValueError(f'Unknown output {output}, choose from {OUTPUTS}')
+    check_threshold(threshold, output)
+
+    if engine == 'auto':
+        engine = choose_engine(width, height, max_iter, output=output, options=list(options))
+    elif engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine}, choose from {["auto"] + list(ENGINES)}')
+    elif engine not in available_engines():
+        raise ValueError(f'Engine {engine} needs {", ".join(ENGINES[engine].requires)}, which is not installed')
+    elif output not in ENGINES[engine].outputs:
+        raise ValueError(f'Engine {engine} cannot compute {output}, only {list(ENGINES[engine].outputs)}')
+    check_options(engine, options)
+
+    options = dict(options)
+    if output != 'ratio':
+        options['output'] = output
+
+    re_min, re_max, im_min, im_max = region
+    rVals = np.linspace(re_min, re_max, width)
+    iVals = np.linspace(im_min, im_max, height)
+    # the result is written by the engine in its final data type, so there is
+    # no float64 copy of the result
+    if output == 'count':
+        if not np.issubdtype(dtype, np.unsignedinteger):
+            dtype = count_dtype(max_iter)
+        elif max_iter > np.iinfo(dtype).max:
+            raise ValueError(f'max_iter = {max_iter} does not fit in {np.dtype(dtype).name}')
+    elif not np.issubdtype(dtype, np.floating):
+        raise ValueError(f'dtype must be a floating point type for output {output}, not {np.dtype(dtype).name}')
+
+    res = np.zeros((height, width), dtype=dtype)
+
+    return ENGINES[engine].func, rVals, iVals, res, options
+
+
+def check_threshold(threshold, output):
+
+    """
+
+    Raises a ValueError if the threshold cannot be used for the output: the
+    continuous iteration count (output = 'smooth') divides by log(threshold),
+    so the threshold has to be larger than 1.
+
+    """
+
+    if output == 'smooth' and not threshold > 1:
+        raise ValueError(f"The threshold must be larger than 1 for output 'smooth', got {threshold}")
+
+
+def check_options(engine, options):
+
+    """
+
+    Raises a ValueError if the engine does not support one of the options
+    (names of keyword arguments, see register_engine()).
+
+    """
+
+    unsupported = [o for o in options if o not in ENGINES[engine].options]
+    if unsupported:
+        raise ValueError(f'Engine {engine} does not support the option(s) {unsupported}, only '
+                         f'{list(ENGINES[engine].options)}')
+
+
+def render_progressive(region = DEFAULT_REGION, width = 1000, height = 1000, max_iter = 100, threshold = 2,
+                       engine = 'auto', dtype = np.float64, output = 'ratio', steps = (8, 4, 2, 1),
+                       skip_uniform = False, **options):
+
+    """
+
+    Computes a view of the Mandelbrot set progressively (see the description
+    at the top of this file). This is a generator: every refinement pass is
+    yielded as soon as it is done, e.g.
+
+        for step, res, computed in render_progressive(region, 1920, 1080):
+            show(res)
+
+    INPUT::
+
+        region, width, height, max_iter, threshold, engine, dtype, output,
+        options :
+            See render().
+
+        steps : sequence of ints
+            Distance between the values of c computed in every pass, from
+            coarse to fine. Every step has to divide the previous one, and
+            the last step has to be 1.
+
+        skip_uniform : bool
+            Do not compute the values of c of which the (up to 4) values
+            computed in the previous pass around them are all the same, but
+            give them that value. This is not exact: thin details that fall
+            between the values of the previous pass are missed.
+
+    OUTPUT (every pass)::
+
+        step : int
+            The step of the pass.
+
+        res : Numpy array of size (height, width)
+            Matrix containing the result so far, where every value of c that
+            has not been computed yet has the value of the nearest computed
+            value of c above and to the left of it (so the image can be shown
+            as is). A CountArray for output = 'count'. The result of the last
+            pass is the same as the result of render() (with skip_uniform =
+            False).
+
+        computed : int
+            Number of values of c computed so far.
+
+    """
+
+    steps = [int(step) for step in steps]
+    if not steps or steps[-1] != 1 or any(step < 1 for step in steps) or \
+            any(prev % step or prev == step for prev, step in zip(steps, steps[1:])):
+        raise ValueError(f'steps must be decreasing, divide each other and end with 1, got {steps}')
+
+    func, rVals, iVals, res, options = _prepare(region, width, height, max_iter, threshold, engine, dtype, output, options)
+    I = int(max_iter)
+    T = float(threshold)
+
+    def compute(rows, cols):
+        # computes the grid of values of c rows x cols into res
+        if len(rows) and len(cols):
+            sub = np.zeros((len(rows), len(cols)), dtype=res.dtype)
+            func(rVals[cols], iVals[rows], sub, I, T, **options)
+            res[np.ix_(rows, cols)] = sub
+        return len(rows) * len(cols)
+
+    def preview(step):
+        # every value of c gets the value of the nearest computed one
+        if step == 1:
+            image = res
+        else:
+            image = res[np.ix_((np.arange(height) // step) * step, (np.arange(width) // step) * step)]
+        return CountArray(image, I) if output == 'count' else image
+
+    # first pass: a coarse grid
+    step = steps[0]
+    computed = compute(np.arange(0, height, step), np.arange(0, width, step))
+    yield step, preview(step), computed
+
+    for prev, step in zip(steps, steps[1:]):
+        rows = np.arange(0, height, step)
+        cols = np.arange(0, width, step)
+        new_rows = rows[rows % prev != 0]
+        new_cols = cols[cols % prev != 0]
+        old_rows = rows[rows % prev == 0]
+
+        if not skip_uniform:
+            # the new values of c are on the new rows, or on the rows of the
+            # previous pass between its columns
+            computed += compute(new_rows, cols)
+            computed += compute(old_rows, new_cols)
+        else:
+            # the values of the previous pass at the corners of the cell of
+            # the previous pass that every value of c on the new grid is in
+            r0 = (rows // prev) * prev
+            r1 = np.where(r0 + prev < height, r0 + prev, r0)
+            c0 = (cols // prev) * prev
+            c1 = np.where(c0 + prev < width, c0 + prev, c0)
+            corner = res[np.ix_(r0, c0)]
+            uniform = (corner == res[np.ix_(r0, c1)]) & (corner == res[np.ix_(r1, c0)]) & \
+                      (corner == res[np.ix_(r1, c1)])
+
+            # new values of c only, skipping the uniform ones
+            todo = ~uniform
+            todo[np.ix_(rows % prev == 0, cols % prev == 0)] = False
+            res[np.ix_(rows, cols)] = np.where(uniform, corner, res[np.ix_(rows, cols)])
+
+            # one row at a time, as the values of c left differ per row
+            for k in np.nonzero(todo.any(axis=1))[0]:
+                computed += compute(rows[k:k + 1], cols[todo[k]])
+
+        yield step, preview(step), computed
+
+
+def _vectorised(rVals, iVals, res, I, T):
+    # vectorised() only loops over detail rows, every row can have any length
+    return OM.vectorised(iVals.shape[0], rVals, iVals, res, I, T)
+
+
+def _jit_vectorised(rVals, iVals, res, I, T):
+    return OM.jit_vectorised(iVals.shape[0], rVals, iVals, res, I, T)
+
+
+def _jit(rVals, iVals, res, I, T, interior = False, cycle_tol = 0.0):
+    return OM.jit_func_tile(rVals, iVals, res, I, T, bool(interior), float(cycle_tol))
+
+
+def _njit_lanes(rVals, iVals, res, I, T, interior = False, cycle_tol = 0.0, lanes = 16, chunk = 8, single = False):
+    # single = True iterates in float32 (not exact near the boundary)
+    if single:
+        rVals = rVals.astype(np.float32)
+        iVals = iVals.astype(np.float32)
+    return OM.njit_par_lanes_tile(rVals, iVals, res, I, T, int(lanes), int(chunk), bool(interior), float(cycle_tol))
+
+
+def _njit_par(rVals, iVals, res, I, T, interior = False, cycle_tol = 0.0, output = 'ratio', schedule = None):
+    # schedule = 'cyclic' or 'lpt' divides the rows over the threads with
+    # njit_par_balanced_tile() (only for the ratio of iterations)
+    if schedule is not None:
+        if output != 'ratio':
+            raise ValueError(f'A schedule can only be used for output ratio, not {output}')
+        return OM.njit_par_balanced_tile(rVals, iVals, res, I, T, interior, cycle_tol, schedule)[0]
+    func = getattr(OM, OM.PAR_TILE_FUNCTIONS[output])
+    return func(rVals, iVals, res, I, T, bool(interior), float(cycle_tol))
+
+
+register_engine('naive', OM.naive_tile, slow = True, description = 'pure Python, for reference',
+                options = ['interior'])
+register_engine('vectorised', _vectorised, requires = ['numba'], slow = True,
+                description = 'numba ufunc calling the non-optimised M()')
+register_engine('numpy', numpy_masked_tile, description = 'numpy arrays, only bounded values iterated',
+                options = ['interior'])
+register_engine('jit', _jit, requires = ['numba'], description = 'numba @jit', options = ENGINE_OPTIONS)
+register_engine('jit_vectorised', _jit_vectorised, requires = ['numba'], description = 'numba @jit ufunc')
+register_engine('njit_par', _njit_par, requires = ['numba'], outputs = OUTPUTS,
+                description = 'numba @njit(parallel=True)', options = ENGINE_OPTIONS + ('schedule',))
+register_engine('threads', render_threaded, requires = ['numba'], outputs = OUTPUTS,
+                description = 'numba @njit(nogil=True) on bands of rows in a shared pool of threads',
+                options = ENGINE_OPTIONS + ('band', 'executor'))
+register_engine('njit_lanes', _njit_lanes, requires = ['numba'],
+                description = 'numba @njit(parallel=True), values of c iterated in SIMD lanes',
+                options = ENGINE_OPTIONS + ('lanes', 'chunk', 'single'))
+# not used by 'auto': it is only faster for deep zooms, which cannot be given
+# as float64 regions anyway
+register_engine('perturbation', perturbation_engine, requires = ['numba'], slow = True,
+                description = 'float64 perturbation around an arbitrary precision reference orbit')
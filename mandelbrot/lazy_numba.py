@@ -0,0 +1,197 @@
+"""
+
+This file contains stand-ins for the numba decorators (jit, njit, vectorize
+and guvectorize) and prange that do not import numba until one of the
+decorated functions is actually used.
+
+Importing numba takes longer than importing everything else in the package
+together (run "python -m mandelbrot.benchmark --import-time" from the root of
+the repository), while a lot of the code in the package does not need it at
+all: numpy_masked(), the tiling and multiprocessing code, the benchmark
+harness, or the scripts when they only plot results that have been saved
+before. mandelbrot_alg.py, optimisation_methods.py and benchmark.py use the
+decorators in this file, so importing them only imports numpy.
+
+How it works:
+
+- Decorating a function returns a LazyDispatcher, which remembers the
+  function and the arguments given to the decorator.
+
+- The first time any LazyDispatcher is called (or an attribute such as
+  .compile() or .signatures is accessed), load_numba() imports numba and
+  applies the real decorators to all functions decorated so far. The module
+  attributes pointing to the LazyDispatchers are replaced by the real numba
+  dispatchers, as are the module attributes named prange. This is needed
+  because numba looks up the functions called by a numba-optimised function
+  (e.g. mb.M_jit_sq in njit_par()) and prange in the globals of its module
+  when compiling it, and it does not know what to do with a LazyDispatcher.
+  The jit and njit functions are created before the vectorize and
+  guvectorize functions, because the latter are compiled right away and may
+  call the former.
+
+- Functions that are decorated after numba has been imported get the real
+  numba decorator right away.
+
+Until numba is loaded, prange is simply range, so the code in the
+numba-optimised functions stays valid Python.
+
+"""
+
+import functools
+import importlib
+import sys
+import threading
+
+
+# numba itself, once it has been imported
+_numba = None
+
+# LazyDispatchers that have not been replaced by numba dispatchers yet
+_pending = []
+
+# load_numba() can be called from several threads (see warm_up() in
+# optimisation_methods.py)
+_lock = threading.RLock()
+
+# decorators whose functions are compiled when they are created
+_EAGER = ('vectorize', 'guvectorize')
+
+prange = range
+
+
+class LazyDispatcher:
+
+    """
+
+    Stand-in for a numba-optimised function that has not been created yet.
+    Calling it (or accessing an attribute of the numba dispatcher, such as
+    compile or signatures) imports numba and creates all pending numba
+    functions first.
+
+    """
+
+    def __init__(self, decorator, args, kwargs, func):
+        self._decorator = decorator
+        self._args = args
+        self._kwargs = kwargs
+        self._func = func
+        self._module = sys.modules[func.__module__]
+        self._dispatcher = None
+        functools.update_wrapper(self, func)
+
+    def _create(self):
+
+        """
+
+        Applies the numba decorator to the function and replaces the
+        LazyDispatcher by the result in the module it was defined in.
+
+        """
+
+        self._dispatcher = getattr(_numba, self._decorator)(*self._args, **self._kwargs)(self._func)
+        for name, value in list(vars(self._module).items()):
+            if value is self:
+                setattr(self._module, name, self._dispatcher)
+            elif value is range and name == 'prange':
+                setattr(self._module, name, _numba.prange)
+
+    def dispatcher(self):
+
+        """
+
+        Returns the numba dispatcher (or ufunc) of this function, importing
+        numba if needed.
+
+        """
+
+        if self._dispatcher is None:
+            load_numba()
+        return self._dispatcher
+
+    def __call__(self, *args, **kwargs):
+        return self.dispatcher()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # only called for attributes not set in __init__
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.dispatcher(), name)
+
+    def __repr__(self):
+        return f'<LazyDispatcher {self._decorator} of {self.__qualname__}>'
+
+
+def load_numba():
+
+    """
+
+    Imports numba and creates the numba functions for all LazyDispatchers.
+    Does nothing if this has been done already.
+
+    OUTPUT::
+
+        numba : module
+            The numba module.
+
+    """
+
+    global _numba
+
+    with _lock:
+        if _numba is None:
+            _numba = importlib.import_module('numba')
+
+        lazy = [l for l in _pending if l._decorator not in _EAGER]
+        lazy += [l for l in _pending if l._decorator in _EAGER]
+        _pending.clear()
+        for l in lazy:
+            l._create()
+
+    return _numba
+
+
+def numba_loaded():
+
+    """
+
+    Returns whether numba has been imported by load_numba().
+
+    """
+
+    return _numba is not None
+
+
+def _lazy_decorator(decorator):
+
+    """
+
+    Internal function creating the stand-in for the numba decorator with the
+    name decorator. Like the numba decorators, jit and njit can be used both
+    with and without arguments.
+
+    """
+
+    def wrap(*args, **kwargs):
+        # used without arguments, e.g. @jit
+        if decorator not in _EAGER and len(args) == 1 and not kwargs and callable(args[0]):
+            return wrap()(args[0])
+
+        def decorate(func):
+            with _lock:
+                if _numba is not None:
+                    return getattr(_numba, decorator)(*args, **kwargs)(func)
+                lazy = LazyDispatcher(decorator, args, kwargs, func)
+                _pending.append(lazy)
+                return lazy
+
+        return decorate
+
+    wrap.__name__ = wrap.__qualname__ = decorator
+    wrap.__doc__ = f'Lazy version of numba.{decorator}, see the description of lazy_numba.py.'
+    return wrap
+
+
+jit = _lazy_decorator('jit')
+njit = _lazy_decorator('njit')
+vectorize = _lazy_decorator('vectorize')
+guvectorize = _lazy_decorator('guvectorize')
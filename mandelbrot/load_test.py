@@ -0,0 +1,215 @@
+"""
+
+This script measures the latency of the tiles served by server.py under load.
+
+A number of clients (asyncio tasks, each with its own keep-alive connection)
+request tiles at the same time, as a map viewer does when a page is opened
+or zoomed: every client walks over the tiles of a few zoom levels in a random
+order, so that different clients often ask for the same tile at nearly the
+same time (which exercises the request coalescing of the server) and the
+later requests for a tile are served from the tile cache. The latency of
+every request (from sending it to having read the whole response) is
+recorded, and the median (p50), the 99th percentile (p99) and the maximum
+are reported separately for the responses with status 200 and the number of
+responses with status 503 (back-pressure), together with the counters of the
+server (/stats).
+
+Run it against a running server:
+
+    python -m mandelbrot.server --port 8000 &
+    python -m mandelbrot.load_test --url http://localhost:8000 --clients 32
+
+or let it start a server in the same process (--serve), e.g. to compare the
+executors:
+
+    python -m mandelbrot.load_test --serve --executor process --clients 32
+
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+async def _request(reader, writer, host, path):
+
+    """
+
+    Internal function sending a GET request over an open connection and
+    reading the response. Returns (status, body).
+
+    """
+
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+
+    return status, await reader.readexactly(length)
+
+
+async def fetch(host, port, path):
+
+    """
+
+    Requests path from the server at host:port over a new connection and
+    returns (status, body).
+
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await _request(reader, writer, host, path)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def _client(host, port, paths, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            status, _ = await _request(reader, writer, host, path)
+            latencies.setdefault(status, []).append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def load_test(url = 'http://localhost:8000', clients = 16, zooms = (0, 1, 2, 3), requests = 50,
+                    kind = 'png', max_iter = None, seed = 0):
+
+    """
+
+    Runs the load test against the server at url (see the description at the
+    top of this file).
+
+    INPUT::
+
+        url : str
+            Address of the server.
+
+        clients : int
+            Number of clients requesting tiles at the same time.
+
+        zooms : iterable of int
+            Zoom levels of the tiles the clients request.
+
+        requests : int
+            Number of requests per client.
+
+        kind : str
+            'png' or 'npy'.
+
+        max_iter : int
+            Number of iterations of the tiles (the default of the server if
+            None).
+
+        seed : int
+            Seed of the order of the tiles.
+
+    OUTPUT::
+
+        result : dict
+            The number of requests and responses per status, the time taken,
+            the number of requests per second, p50, p99 and maximum latency
+            (in seconds) of the responses with status 200, and the counters
+            of the server.
+
+    """
+
+    url = urlsplit(url)
+    host, port = url.hostname, url.port or 80
+    query = '' if max_iter is None else f'?max_iter={int(max_iter)}'
+    tiles = [(z, x, y) for z in zooms for x in range(2**z) for y in range(2**z)]
+
+    rng = random.Random(seed)
+    paths = [[f'/{z}/{x}/{y}.{kind}{query}' for z, x, y in rng.choices(tiles, k=requests)]
+             for _ in range(clients)]
+
+    latencies = {}
+    statuses = {}
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(host, port, client_paths, latencies, statuses) for client_paths in paths])
+    elapsed = time.perf_counter() - start
+
+    _, body = await fetch(host, port, '/stats')
+    ok = np.array(latencies.get(200, [np.nan]))
+
+    return {'requests' : clients * requests, 'statuses' : statuses, 'time' : elapsed,
+            'requests_per_second' : clients * requests / elapsed,
+            'p50' : float(np.percentile(ok, 50)), 'p99' : float(np.percentile(ok, 99)), 'max' : float(ok.max()),
+            'server' : json.loads(body)}
+
+
+def print_result(result):
+    print(f'{result["requests"]} requests in {result["time"]:.2f} s ({result["requests_per_second"]:.1f} / s)')
+    print('statuses: ' + ', '.join(f'{status}: {n}' for status, n in sorted(result['statuses'].items())))
+    print(f'latency of the tiles: p50 {1e3 * result["p50"]:.2f} ms, p99 {1e3 * result["p99"]:.2f} ms, '
+          f'max {1e3 * result["max"]:.2f} ms')
+    server = result['server']
+    print(f'server: {server["computed"]} computed, {server["coalesced"]} coalesced, {server["rejected"]} rejected')
+    if 'cache' in server:
+        cache = server['cache']
+        print(f'cache: {cache["hits"]} hits, {cache["misses"]} misses, {cache["evictions"]} evictions')
+
+
+async def _main(args):
+    url = args.url
+    server = None
+    if args.serve:
+        from mandelbrot.server import TileServer
+        server = TileServer('localhost', 0, args.max_iter or 100, executor=args.executor, workers=args.workers,
+                            max_pending=args.max_pending)
+        await server.start()
+        url = f'http://localhost:{server.port}'
+
+    try:
+        result = await load_test(url, args.clients, range(args.min_zoom, args.max_zoom + 1), args.requests,
+                                 args.kind, args.max_iter, args.seed)
+    finally:
+        if server is not None:
+            await server.close()
+
+    print_result(result)
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Load test of the tile server (server.py)')
+    parser.add_argument('--url', default='http://localhost:8000', help='address of the server')
+    parser.add_argument('--serve', action='store_true', help='start a server in this process')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                        help='executor of the server started with --serve')
+    parser.add_argument('--workers', type=int, default=None, help='workers of the server started with --serve')
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='max_pending of the server started with --serve')
+    parser.add_argument('--clients', type=int, default=16, help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=50, help='number of requests per client')
+    parser.add_argument('--min-zoom', type=int, default=0)
+    parser.add_argument('--max-zoom', type=int, default=3)
+    parser.add_argument('--kind', choices=['png', 'npy'], default='png')
+    parser.add_argument('--max-iter', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        sys.exit()
@@ -10,22 +10,104 @@ part of the Mandelbrot set. The following functions are implemented:
 - M_save_z: numba-optimised version using the @jit decorator that also
     returns the last value of :math:`z` before the iteration returns.
 
+M_jit and M_save_z can optionally detect periodic orbits of :math:`z`
+(cycle_tol argument). Values of :math:`c` inside the set never cross the
+threshold, so without this they always run all :math:`I` iterations, which
+is where almost all the time goes for large values of :math:`I`.
+
+- M_jit_sq: numba-optimised version using the @jit decorator that keeps the
+    real and imaginary parts of :math:`z` as separate floats and compares 
+    :math:`|z|^2` to :math:`T^2` (see below).
+
+- M_save_z_sq: M_save_z using the same arithmetic as M_jit_sq.
+
+- M_count_sq and M_save_z_count_sq: M_jit_sq and M_save_z_sq returning the
+    number of iterations :math:`i + 1` (or :math:`I` for values in the set)
+    as an integer instead of the ratio :math:`(i + 1) / I`. The ratio is 
+    exactly count / I, so it can be computed when the result is read, while 
+    the counts can be stored in small unsigned integer types (see 
+    count_dtype() in engines.py).
+
+- M_smooth_sq: M_jit_sq returning a continuous (smooth) iteration count 
+    instead of the ratio of the iteration at which :math:`|z|` crossed the
+    threshold (see below).
+
+- M_distance_sq: M_jit_sq returning an estimate of the distance from 
+    :math:`c` to the Mandelbrot set (see below).
+
+- interior: analytic test whether :math:`c` lies in the main cardioid or the
+    period-2 bulb of the Mandelbrot set (interior_jit is the numba-optimised
+    version).
+
+All functions computing the Mandelbrot set take an optional check_interior
+argument. If it is set to True, values of :math:`c` for which interior()
+returns True return 1 right away, rather than going through all :math:`I`
+iterations first. This gives the same output, as these values of :math:`c`
+never cross the threshold, but saves a lot of time for views that contain a
+large part of the set. This only holds for :math:`T \geq 2` (:math:`|z|` can
+exceed a smaller threshold for these values of :math:`c`, e.g. for
+:math:`c = -1` and :math:`T = 0.5`), so the check is skipped for smaller
+thresholds.
+
 The functions are called from the functions in optimisation_methods.py.
 
 The @profile decorator has been added to the non-optimised version of the 
 Mandelbrot calculation to see what lines of code are heaviest. It turns out
 that (on my machine) the if-statement requires the most computation, around 
 38.5% of the total and the calculation of :math:`z` takes aaround 33.2% of the 
-processing power. From what I see, there is not much we can do to optimise the
-code itself further.
+processing power. One thing that can be done for the if-statement is to get rid of 
+the square root in :math:`|z| = \\sqrt{x^2 + y^2}` (with :math:`z = x + iy`) 
+by comparing :math:`x^2 + y^2` to :math:`T^2` instead. Furthermore, the values
+for :math:`x^2` and :math:`y^2` are needed for the calculation of :math:`z`
+in the next iteration as well
+
+    :math:`x_{i+1} = x_i^2 - y_i^2 + \\mathfrak{R}(c)`, 
+    :math:`y_{i+1} = 2 x_i y_i + \\mathfrak{I}(c)`,
+
+so they only have to be computed once per iteration. This is what M_jit_sq 
+and M_save_z_sq do, and these are the functions used by the numba-optimised
+methods in optimisation_methods.py.
 
 For some reason the multiprocessing_mandelbrot.py file does not run when the 
 profiling functionality is enabled. This is why it is commented out. For 
 profiling the code, uncomment this section.
 
+Shading:
+
+The ratio returned by M_jit_sq only takes :math:`I` different values, which
+gives visible bands in the plots. The values of :math:`z` at the moment the
+threshold is crossed (M_save_z_sq, used by plot_z_values.py) can be used to
+shade the bands, but that means saving a complex matrix of :math:`z` for the
+whole view and going through it again afterwards. M_smooth_sq and
+M_distance_sq compute the shading in the loop itself:
+
+- M_smooth_sq returns the normalised continuous iteration count
+
+    :math:`\\nu / I = (i + 1 - \\log_2(\\log|z| / \\log T)) / I`,
+
+  where :math:`i + 1` is the iteration at which :math:`|z|` crossed the 
+  threshold. :math:`\\nu` changes continuously from one band to the next, as 
+  :math:`\\log|z|` roughly doubles every iteration once :math:`|z|` is large. 
+  Values of :math:`c` in the set return 1, like M_jit_sq. This needs 
+  :math:`T > 1`, and the larger :math:`T` the smoother the result.
+
+- M_distance_sq iterates the derivative :math:`dz/dc` along with :math:`z`
+
+    :math:`dz_{i+1} = 2 z_i dz_i + 1`, :math:`dz_0 = 0`,
+
+  and returns the exterior distance estimate 
+
+    :math:`b = 2 |z| \\log|z| / |dz|`,
+
+  for which the distance from :math:`c` to the set lies between :math:`b/4`
+  and :math:`b`. Values of :math:`c` in the set return 0. The estimate is 
+  only accurate for a large threshold (e.g. :math:`T = 1000`).
+
 """
 
-from numba import jit, njit, prange
+import math
+
+from mandelbrot.lazy_numba import jit, njit, prange
 
 
 # Took the following from Thomas' example to avoid errors when trying to run 
@@ -47,8 +129,54 @@ from numba import jit, njit, prange
 #             return func(*args, **kwargs)
 #         return inner
 
+def interior(c):
+    
+    """
+    
+    Analytic test whether :math:`c` lies in the main cardioid or in the 
+    period-2 bulb of the Mandelbrot set. With :math:`x = \\mathfrak{R}(c)` and 
+    :math:`y = \\mathfrak{I}(c)`, :math:`c` is in the main cardioid if
+    
+        :math:`q(q + x - \\frac{1}{4}) \\leq \\frac{y^2}{4}`, with 
+        :math:`q = (x - \\frac{1}{4})^2 + y^2`
+        
+    and in the period-2 bulb if
+    
+        :math:`(x + 1)^2 + y^2 \\leq \\frac{1}{16}`.
+    
+    All values of :math:`c` in these regions are part of the Mandelbrot set.
+
+    INPUT::
+        
+        c : complex float
+            Value to check.
+
+    OUTPUT::
+        
+        True if c lies in the main cardioid or the period-2 bulb, False 
+        otherwise.
+
+    """
+    
+    x = c.real - 0.25
+    y2 = c.imag * c.imag
+    
+    # main cardioid
+    q = x*x + y2
+    if q * (q + x) <= 0.25 * y2:
+        return True
+    
+    # period-2 bulb
+    x = c.real + 1
+    return x*x + y2 <= 0.0625
+
+
+# numba-optimised version of interior() to be called from the @jit functions
+interior_jit = njit(cache=True)(interior)
+
+
 # @profile      ####
-def M(c, I = 100, T = 2):
+def M(c, I = 100, T = 2, check_interior = False):
     
     """
     
@@ -83,6 +211,10 @@ def M(c, I = 100, T = 2):
             
         T : float
             Threshold value.
+            
+        check_interior : bool
+            If True, return 1 right away if c lies in the main cardioid or
+            the period-2 bulb (see interior()). Ignored if T < 2.
 
     OUTPUT::
         
@@ -92,6 +224,10 @@ def M(c, I = 100, T = 2):
 
     """
     
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior(c):
+        return 1
+    
     # initialise z
     z = 0
     
@@ -107,17 +243,44 @@ def M(c, I = 100, T = 2):
     # if |z| has not exceeded threshold T, return I / I = 1
     return 1
 
-@jit
-def M_jit(c, I = 100, T = 2):
+@jit(cache=True)
+def M_jit(c, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
     
     """
     
-    Identical function to M(c, I, T) (function above) but with the jit decorator
+    Identical function to M(c, I, T, check_interior) (function above) but 
+    with the jit decorator. 
+    
+    On top of that, the function can detect whether the orbit of :math:`z` 
+    has settled into a periodic cycle (Brent's algorithm). Every time the 
+    number of iterations since the last save reaches a power of two, the 
+    current value of :math:`z` is saved. If a later value of :math:`z` comes
+    within cycle_tol of the saved value, the orbit is periodic and :math:`c` 
+    is part of the Mandelbrot set, so the function returns 1 without running 
+    all :math:`I` iterations. The threshold is checked before the cycle, so
+    values of :math:`c` that cross the threshold are not affected by this.
+    
+    INPUT::
+        
+        cycle_tol : float
+            Tolerance for the cycle detection. The detection is disabled if
+            cycle_tol is 0 (default).
     
     """
     
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(c):
+        return 1
+    
     # initialise z
-    z = 0
+    z = 0j
+    
+    # saved value of z to detect cycles, the number of iterations since it 
+    # was saved and the number of iterations after which it is saved again
+    z_saved = 0j
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
     
     # main loop
     for i in range(I):
@@ -127,23 +290,51 @@ def M_jit(c, I = 100, T = 2):
         # current iteration and the total.
         if abs(z) > T:
             return(i+1) / I
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            d = z - z_saved
+            if d.real*d.real + d.imag*d.imag < tol2:
+                return 1
+            
+            steps += 1
+            if steps == next_save:
+                z_saved = z
+                steps = 0
+                next_save *= 2
     
     # if |z| has not exceeded threshold T, return I / I = 1
     return 1
 
 
-@jit
-def M_save_z(c, I = 100, T = 2):
+@jit(cache=True)
+def M_save_z(c, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
     
     """
         
-    Identical function to M_jit(c, I, T), but also returns the current value 
-    for :math:`z`. Used by plot_z_values.py.
+    Identical function to M_jit(c, I, T, check_interior, cycle_tol), but also 
+    returns the current value for :math:`z`. Used by plot_z_values.py. 
+    
+    If check_interior is True and c lies in the main cardioid or the period-2
+    bulb, the iterations are skipped and :math:`z` is returned at its initial
+    value 0. If a cycle is detected, the value of :math:`z` at the moment of 
+    detection is returned.
     
     """
     
     # initialise z
-    z = 0
+    z = 0j
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(c):
+        return z, 1
+    
+    # variables for the cycle detection (see M_jit())
+    z_saved = 0j
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
     
     # main loop
     for i in range(I):
@@ -153,6 +344,401 @@ def M_save_z(c, I = 100, T = 2):
         # current iteration and the total.
         if abs(z) > T:
             return z, (i+1) / I
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            d = z - z_saved
+            if d.real*d.real + d.imag*d.imag < tol2:
+                return z, 1
+            
+            steps += 1
+            if steps == next_save:
+                z_saved = z
+                steps = 0
+                next_save *= 2
+    
+    # if |z| has not exceeded threshold T, return I / I = 1
+    return z, 1
+
+
+@jit(cache=True)
+def M_jit_sq(cr, ci, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical function to M_jit(c, I, T, check_interior, cycle_tol), but 
+    with the real and imaginary parts of :math:`c` and :math:`z` as separate
+    floating point values. The squares of the real and imaginary parts of 
+    :math:`z` are computed once per iteration and used both for comparing 
+    :math:`|z|^2` to :math:`T^2` (no square root needed) and for computing 
+    the next value of :math:`z`.
+    
+    INPUT::
+        
+        cr : float
+            Real part of the starting point of the iterative algorithm.
+            
+        ci : float
+            Imaginary part of the starting point of the iterative algorithm.
+    
+    """
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(complex(cr, ci)):
+        return 1
+    
+    # initialise z = x + iy and its squares
+    x = 0.0
+    y = 0.0
+    x2 = 0.0
+    y2 = 0.0
+    T2 = T * T
+    
+    # variables for the cycle detection (see M_jit())
+    x_saved = 0.0
+    y_saved = 0.0
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
+    
+    # main loop
+    for i in range(I):
+        y = 2*x*y + ci
+        x = x2 - y2 + cr
+        x2 = x*x
+        y2 = y*y
+        
+        # If the squared magnitude exceeds the squared threshold return the 
+        # ratio of the current iteration and the total.
+        if x2 + y2 > T2:
+            return(i+1) / I
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            dx = x - x_saved
+            dy = y - y_saved
+            if dx*dx + dy*dy < tol2:
+                return 1
+            
+            steps += 1
+            if steps == next_save:
+                x_saved = x
+                y_saved = y
+                steps = 0
+                next_save *= 2
+    
+    # if |z| has not exceeded threshold T, return I / I = 1
+    return 1
+
+
+@jit(cache=True)
+def M_save_z_sq(cr, ci, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
+    
+    """
+        
+    Identical function to M_jit_sq(cr, ci, I, T, check_interior, cycle_tol), 
+    but also returns the current value for :math:`z` (as a complex number), 
+    like M_save_z().
+    
+    """
+    
+    # initialise z = x + iy and its squares
+    x = 0.0
+    y = 0.0
+    x2 = 0.0
+    y2 = 0.0
+    T2 = T * T
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(complex(cr, ci)):
+        return complex(x, y), 1
+    
+    # variables for the cycle detection (see M_jit())
+    x_saved = 0.0
+    y_saved = 0.0
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
+    
+    # main loop
+    for i in range(I):
+        y = 2*x*y + ci
+        x = x2 - y2 + cr
+        x2 = x*x
+        y2 = y*y
+        
+        # If the squared magnitude exceeds the squared threshold return the 
+        # ratio of the current iteration and the total.
+        if x2 + y2 > T2:
+            return complex(x, y), (i+1) / I
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            dx = x - x_saved
+            dy = y - y_saved
+            if dx*dx + dy*dy < tol2:
+                return complex(x, y), 1
+            
+            steps += 1
+            if steps == next_save:
+                x_saved = x
+                y_saved = y
+                steps = 0
+                next_save *= 2
     
     # if |z| has not exceeded threshold T, return I / I = 1
-    return z, 1
\ No newline at end of file
+    return complex(x, y), 1
+
+
+@jit(cache=True)
+def M_smooth_sq(cr, ci, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
+    
+    """
+        
+    Identical function to M_jit_sq(cr, ci, I, T, check_interior, cycle_tol), 
+    but returns the normalised continuous iteration count (see the 
+    description at the top of this file) for the values of c that cross the
+    threshold.
+    
+    """
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(complex(cr, ci)):
+        return 1
+    
+    # initialise z = x + iy and its squares
+    x = 0.0
+    y = 0.0
+    x2 = 0.0
+    y2 = 0.0
+    T2 = T * T
+    log_T = math.log(T)
+    
+    # variables for the cycle detection (see M_jit())
+    x_saved = 0.0
+    y_saved = 0.0
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
+    
+    # main loop
+    for i in range(I):
+        y = 2*x*y + ci
+        x = x2 - y2 + cr
+        x2 = x*x
+        y2 = y*y
+        
+        # If the squared magnitude exceeds the squared threshold return the 
+        # continuous iteration count, which is at least 0 (for values of c
+        # far outside the threshold)
+        if x2 + y2 > T2:
+            log_z = 0.5 * math.log(x2 + y2)
+            nu = (i + 1) - math.log(log_z / log_T) / math.log(2.0)
+            return max(nu, 0.0) / I
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            dx = x - x_saved
+            dy = y - y_saved
+            if dx*dx + dy*dy < tol2:
+                return 1
+            
+            steps += 1
+            if steps == next_save:
+                x_saved = x
+                y_saved = y
+                steps = 0
+                next_save *= 2
+    
+    # if |z| has not exceeded threshold T, return 1
+    return 1
+
+
+@jit(cache=True)
+def M_distance_sq(cr, ci, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
+    
+    """
+        
+    Identical function to M_jit_sq(cr, ci, I, T, check_interior, cycle_tol), 
+    but returns the exterior distance estimate (see the description at the 
+    top of this file) for the values of c that cross the threshold, and 0 for
+    the values of c in the set.
+    
+    """
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(complex(cr, ci)):
+        return 0.0
+    
+    # initialise z = x + iy, its squares and dz = dx + i dy
+    x = 0.0
+    y = 0.0
+    x2 = 0.0
+    y2 = 0.0
+    dx = 0.0
+    dy = 0.0
+    T2 = T * T
+    
+    # variables for the cycle detection (see M_jit())
+    x_saved = 0.0
+    y_saved = 0.0
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
+    
+    # main loop
+    for i in range(I):
+        # dz = 2 z dz + 1, using z of the previous iteration
+        dx, dy = 2*(x*dx - y*dy) + 1, 2*(x*dy + y*dx)
+        y = 2*x*y + ci
+        x = x2 - y2 + cr
+        x2 = x*x
+        y2 = y*y
+        
+        # If the squared magnitude exceeds the squared threshold return the 
+        # distance estimate 2 |z| log|z| / |dz|
+        if x2 + y2 > T2:
+            abs_z = math.sqrt(x2 + y2)
+            return 2 * abs_z * math.log(abs_z) / math.sqrt(dx*dx + dy*dy)
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            ex = x - x_saved
+            ey = y - y_saved
+            if ex*ex + ey*ey < tol2:
+                return 0.0
+            
+            steps += 1
+            if steps == next_save:
+                x_saved = x
+                y_saved = y
+                steps = 0
+                next_save *= 2
+    
+    # if |z| has not exceeded threshold T, c is (as far as we know) in the set
+    return 0.0
+
+
+@jit(cache=True)
+def M_count_sq(cr, ci, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
+    
+    """
+        
+    Identical function to M_jit_sq(cr, ci, I, T, check_interior, cycle_tol), 
+    but returns the number of iterations after which |z| crossed the 
+    threshold (and I for the values of c in the set) as an integer, rather
+    than its ratio with I.
+    
+    """
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(complex(cr, ci)):
+        return I
+    
+    # initialise z = x + iy and its squares
+    x = 0.0
+    y = 0.0
+    x2 = 0.0
+    y2 = 0.0
+    T2 = T * T
+    
+    # variables for the cycle detection (see M_jit())
+    x_saved = 0.0
+    y_saved = 0.0
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
+    
+    # main loop
+    for i in range(I):
+        y = 2*x*y + ci
+        x = x2 - y2 + cr
+        x2 = x*x
+        y2 = y*y
+        
+        # If the squared magnitude exceeds the squared threshold return the 
+        # current iteration
+        if x2 + y2 > T2:
+            return i + 1
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            dx = x - x_saved
+            dy = y - y_saved
+            if dx*dx + dy*dy < tol2:
+                return I
+            
+            steps += 1
+            if steps == next_save:
+                x_saved = x
+                y_saved = y
+                steps = 0
+                next_save *= 2
+    
+    # if |z| has not exceeded threshold T, return I
+    return I
+
+
+@jit(cache=True)
+def M_save_z_count_sq(cr, ci, I = 100, T = 2, check_interior = False, cycle_tol = 0.0):
+    
+    """
+        
+    Identical function to M_save_z_sq(cr, ci, I, T, check_interior, 
+    cycle_tol), but returns the number of iterations like M_count_sq().
+    
+    """
+    
+    # initialise z = x + iy and its squares
+    x = 0.0
+    y = 0.0
+    x2 = 0.0
+    y2 = 0.0
+    T2 = T * T
+    
+    # skip the iterations if c is known to be part of the set
+    if check_interior and T >= 2 and interior_jit(complex(cr, ci)):
+        return complex(x, y), I
+    
+    # variables for the cycle detection (see M_jit())
+    x_saved = 0.0
+    y_saved = 0.0
+    steps = 0
+    next_save = 1
+    tol2 = cycle_tol * cycle_tol
+    
+    # main loop
+    for i in range(I):
+        y = 2*x*y + ci
+        x = x2 - y2 + cr
+        x2 = x*x
+        y2 = y*y
+        
+        # If the squared magnitude exceeds the squared threshold return the 
+        # current iteration
+        if x2 + y2 > T2:
+            return complex(x, y), i + 1
+        
+        # If z has returned to the saved value, the orbit is periodic and 
+        # will never exceed the threshold
+        if cycle_tol > 0:
+            dx = x - x_saved
+            dy = y - y_saved
+            if dx*dx + dy*dy < tol2:
+                return complex(x, y), I
+            
+            steps += 1
+            if steps == next_save:
+                x_saved = x
+                y_saved = y
+                steps = 0
+                next_save *= 2
+    
+    # if |z| has not exceeded threshold T, return I
+    return complex(x, y), I
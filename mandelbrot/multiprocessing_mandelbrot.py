@@ -1,98 +1,488 @@
 """
 
-This file uses the multiprocessing module to divide the tasks when computing 
+This file uses the multiprocessing module to divide the tasks when computing
 the Mandelbrot set over several processing units.
 
-As opposed to the other optimisation techniques, all values of :math:`c` are
-initialised in a numpy array after which its rows are used for multiprocessing.
-Similar to what has been discussed in optimisation_methods.py, rows are chosen
-rather than columns as the array is C-contiguous.
+The rows of the grid of values of :math:`c` are divided over the processing
+units. Similar to what has been discussed in optimisation_methods.py, rows are
+chosen rather than columns as the array is C-contiguous.
+
+The first version of this file looped over the rows and called
+pool.map_async(M, c[i, :]).get() for every row. This sends every value of
+:math:`c` to a worker as a separate Python complex number, computes it with
+the non-optimised M() and waits for the whole row to finish before sending the
+next one. This is why the computation time did not decrease anymore for more
+than 4 processing units (see multiprocessing_output/plot_csv_results.py).
+
+multiprocessing_render() does this differently:
+
+- The rows are divided over a number of tasks in an interleaved way, i.e.,
+  task t computes rows t, t + n, t + 2n, ... for n tasks. Rows that go
+  through the set (which take a lot longer) are divided evenly over the tasks
+  this way. There are a few tasks per process, so that processes that finish
+  early can pick up another task.
+
+- Every task is computed by jit_func_tile() from optimisation_methods.py 
+  (the numba-optimised function) on all its rows at once. It is compiled 
+  with cache=True, so the spawned workers load the compiled function from 
+  disk instead of compiling it again in every worker.
+
+- The values of :math:`c` are not created as a matrix (the first version 
+  created three detail x detail matrices using numpy.matlib.repmat before 
+  any work started, around 1 GB for a detail of 5000). Instead, the workers
+  receive rVals and iVals once and create the values of :math:`c` for their 
+  rows on the fly, like the numba-optimised methods do.
+
+- The result matrix is put in shared memory (multiprocessing.shared_memory,
+  see SharedArray), so the workers write their results directly into memory
+  shared with the parent process. Nothing but the row numbers of a task has
+  to be sent to the workers, and no lists of results have to be sent back. 
+  If the result matrix is created as a SharedArray by the caller, it is not
+  even copied.
+
+- All tasks are sent to the pool at once (using map or map_async), so the
+  parent does not wait for every row.
+
+- The parent waits for the tasks in short steps (see _wait_for_tasks()),
+  checking whether any worker has died (e.g. killed by the out-of-memory 
+  killer or a segmentation fault). multiprocessing.Pool replaces such a
+  worker, but the task it was computing is lost and pool.map() would wait
+  for it forever. Instead, a RuntimeError is raised (or a
+  multiprocessing.TimeoutError after timeout seconds), and the shared 
+  memory is removed. With calc_async = False the tasks are sent with
+  pool.imap() rather than pool.map(): the same ordered map, but its results
+  can be waited for with a timeout.
+
+The workers have to run on the same machine, as they write into shared
+memory. distributed.py divides a view over worker processes on several
+machines instead.
 
 The explanation of the code can be found in the comments in-code.
 
 """
 
-import os, sys, time 
-   
+import os, sys, time
+import tracemalloc
+
 import numpy as np
-from numpy import matlib as ml
 import multiprocessing as mp
-import matplotlib.pyplot as plt
-from mandelbrot.mandelbrot_alg import M
-import pandas as pd
+from multiprocessing import shared_memory
+import mandelbrot.optimisation_methods as OM
 
 
-if __name__ == '__main__': # Necessary to make multiprocessing work
+class SharedArray:
+
+    """
+
+    Numpy array in shared memory (multiprocessing.shared_memory), so that
+    worker processes can read from and write into the same array as the
+    parent process without pickling or copying it.
+
+    The process that creates the array owns it and is responsible for
+    removing the shared memory when it is done with it, using release() or
+    by using the SharedArray as a context manager. Worker processes attach to
+    an existing array using SharedArray.attach(spec), where spec is the
+    (picklable) tuple returned by the spec property of the original array.
+
+    INPUT::
+
+        shape : tuple of ints
+            Shape of the array.
+
+        dtype : numpy dtype
+            Data type of the array.
+
+        name : str or None
+            Name of existing shared memory to attach to. If None, new shared
+            memory is created.
+
+    """
+
+    def __init__(self, shape, dtype = np.float64, name = None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        if self.owner:
+            size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def attach(cls, spec):
+
+        """
+
+        Attaches to an existing SharedArray using its spec.
+
+        """
+
+        name, shape, dtype = spec
+        return cls(shape, dtype, name)
+
+    @classmethod
+    def from_array(cls, array):
+
+        """
+
+        Creates a new SharedArray containing a copy of array.
+
+        """
+
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def spec(self):
+
+        """
+
+        Picklable tuple (name, shape, dtype) used to attach to the array.
+
+        """
+
+        return (self.shm.name, self.shape, self.dtype.str)
+
+    def close(self):
+
+        """
+
+        Detaches this process from the shared memory. The array cannot be used
+        afterwards, and there should be no other references to it left.
+
+        """
+
+        if self.array is not None:
+            self.array = None
+            self.shm.close()
+
+    def release(self):
+
+        """
+
+        Closes the shared memory and, if this process owns it, removes it.
+
+        """
+
+        self.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+# result matrix in shared memory, real and imaginary values of c and 
+# parameters of the Mandelbrot function, set in every worker by _init_worker()
+_worker_res = None
+_worker_rVals = None
+_worker_iVals = None
+_worker_I = 100
+_worker_T = 2
+
+
+def _init_worker(res_spec, rVals, iVals, I, T):
+
+    """
+
+    Internal function that initialises a worker process of the pool. It
+    attaches to the shared memory containing the result matrix and saves the
+    real and imaginary values of c and the parameters of the Mandelbrot 
+    function. jit_func_tile() is loaded from the numba cache (or compiled 
+    the first time) here, before the worker receives its first task.
+
+    """
+
+    global _worker_res, _worker_rVals, _worker_iVals, _worker_I, _worker_T
+    _worker_res = SharedArray.attach(res_spec)
+    _worker_rVals = rVals
+    _worker_iVals = iVals
+    _worker_I = I
+    _worker_T = float(T)
+
+    OM.warm_up(['jit_func_tile'])
+
+
+def _render_rows(task):
+
+    """
+
+    Internal function computing a single task in a worker process. A task is
+    a tuple (first row, step): the task computes the rows first row,
+    first row + step, ... of the grid and writes the result directly into the
+    result matrix in shared memory. The values of c are created from rVals 
+    and iVals on the fly.
+
+    """
+
+    first_row, step = task
+    OM.jit_func_tile(_worker_rVals, _worker_iVals[first_row::step], 
+                     _worker_res.array[first_row::step, :], _worker_I, _worker_T, False, 0.0)
+
+    return first_row
+
+
+def _wait_for_tasks(calc_async, pool, tasks, workers, timeout = None, poll = 0.1):
+
+    """
+
+    Internal function sending the tasks to the pool with map_async() 
+    (calc_async = True) or imap() (calc_async = False) and waiting for them.
+    Raises a RuntimeError if one of the worker processes (workers) has died,
+    a multiprocessing.TimeoutError after timeout seconds (if not None), or 
+    the exception raised by a task.
+
+    """
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def check():
+        dead = [p for p in workers if p.exitcode not in (None, 0)]
+        if dead:
+            raise RuntimeError(f'Worker process {dead[0].pid} died with exit code {dead[0].exitcode}')
+        if deadline is not None and time.monotonic() > deadline:
+            raise mp.TimeoutError(f'The workers did not finish within {timeout} seconds')
+
+    if calc_async:
+        result = pool.map_async(_render_rows, tasks, chunksize=1)
+        while not result.ready():
+            result.wait(poll)
+            check()
+        result.get()
+    else:
+        results = pool.imap(_render_rows, tasks, chunksize=1)
+        for _ in tasks:
+            while True:
+                try:
+                    results.next(poll)
+                    break
+                except mp.TimeoutError:
+                    check()
+
+
+def multiprocessing_render(rVals, iVals, res, processes = None, calc_async = True, 
+                           tasks_per_process = 4, I = 100, T = 2, timeout = None):
+
+    """
+
+    Computes the Mandelbrot set for the grid of values of c spanned by rVals
+    and iVals using a pool of worker processes.
 
-    # indicate number of processing units you want to use for calculating the mandelbrot set
-    number_of_processing_units = 8
+    res can be given as a SharedArray, in which case the workers write into 
+    it directly. Otherwise it is copied out of shared memory once. All 
+    shared memory created by this function is removed again, also if a 
+    worker fails.
 
-    # Raise an exception if the number of processing units defined exceeds the 
+    INPUT::
+
+        rVals : Numpy array of size (n,)
+            The values for the real component of c to iterate over.
+            
+        iVals : Numpy array of size (m,)
+            The values for the imaginary component of c to iterate over.
+
+        res : Numpy array or SharedArray of float64 of size (m, n)
+            Matrix that will be filled with outputs of the function
+            generating the Mandelbrot set.
+
+        processes : int
+            Number of worker processes. Defaults to os.cpu_count().
+
+        calc_async : bool
+            Whether to send the tasks to the pool using map_async (True) or
+            map (False, using imap, see the description at the top of this
+            file).
+
+        tasks_per_process : int
+            Number of (interleaved) tasks the rows are divided into per
+            process.
+
+        I : int
+            Maximum number of iterations.
+
+        T : float
+            Threshold value.
+
+        timeout : float or None
+            Number of seconds after which to stop waiting for the workers 
+            and raise a multiprocessing.TimeoutError. A RuntimeError is 
+            raised right away if a worker dies.
+
+    OUTPUT::
+
+        res : Numpy array of size (m, n)
+            Matrix containing the result of the function generating the
+            Mandelbrot set for all values of c (the array of the SharedArray
+            if res is a SharedArray).
+
+    """
+
+    if processes is None:
+        processes = os.cpu_count()
+
+    # Raise an exception if the number of processing units defined exceeds the
     # number of units available
-    if number_of_processing_units > mp.cpu_count():
+    if processes > mp.cpu_count():
         raise Exception('Number of processing units wanted exceeds number units available')
-    
-    # define whether to process asynchronously or not 
+
+    # divide the rows over the tasks in an interleaved way
+    n_tasks = min(processes * tasks_per_process, iVals.shape[0])
+    tasks = [(t, n_tasks) for t in range(n_tasks)]
+
+    # shared memory created here, which is removed again in the end
+    created = []
+
+    try:
+        # put res in shared memory if it is not already
+        if isinstance(res, SharedArray):
+            res_shared = res
+        else:
+            res_shared = SharedArray(res.shape, np.float64)
+            created.append(res_shared)
+
+        # The workers are spawned rather than forked: forking a process in
+        # which numba has already started its threads (e.g. after njit_par()
+        # has been called) can cause the workers to hang.
+        children = set(mp.active_children())
+        pool = mp.get_context('spawn').Pool(processes=processes, initializer=_init_worker,
+                                            initargs=(res_shared.spec, rVals, iVals, I, T))
+        try:
+            # the worker processes of this pool, to check whether they die
+            workers = [p for p in mp.active_children() if p not in children]
+            _wait_for_tasks(calc_async, pool, tasks, workers, timeout)
+        finally:
+            # also join the pool (not only terminate it like "with pool"), so
+            # that its threads and queues are gone when this function returns
+            pool.terminate()
+            pool.join()
+
+        # copy the result out of shared memory if needed
+        if res_shared is res:
+            return res.array
+        res[...] = res_shared.array
+
+    finally:
+        for shared in created:
+            shared.release()
+
+    return res
+
+
+def scaling_benchmark(detail = 5000, processes_list = None, calc_async = True, I = 100, T = 2):
+
+    """
+
+    Times multiprocessing_render() for every number of processes in
+    processes_list (defaults to 1, ..., os.cpu_count()) for detail x detail
+    values of c in the default view. Every configuration is run once before
+    it is timed, so that the time it takes to compile the numba-optimised
+    function in the workers is not included.
+
+    Apart from the time, the peak memory allocated by the parent process 
+    (measured using tracemalloc) and the size of the result matrix in shared 
+    memory are saved. Creating the full c matrix as in the first version of
+    this file would add 3 x 16 x detail^2 bytes (1.2 GB for a detail of 5000)
+    to the peak memory.
+
+    OUTPUT::
+
+        dataframe : pandas.DataFrame
+            DataFrame with columns 'Processors', 'Time [s]', 'Asynchronously',
+            'Peak memory [MB]' and 'Shared memory [MB]' in the same format as
+            multiprocessing_output/time_processors.csv.
+
+    """
+
+    import pandas as pd
+
+    if processes_list is None:
+        processes_list = range(1, os.cpu_count() + 1)
+
+    rows = []
+    for processes in processes_list:
+        # warm up, without measuring
+        with SharedArray((detail, detail)) as res:
+            multiprocessing_render(np.linspace(-2.0, 1.0, detail), np.linspace(-1.5, 1.5, detail), 
+                                   res, processes, calc_async, I=I, T=T)
+        
+        # measure everything from creating the inputs onwards
+        tracemalloc.start()
+        tic = time.time()
+        
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        with SharedArray((detail, detail)) as res:
+            multiprocessing_render(rVals, iVals, res, processes, calc_async, I=I, T=T)
+            shared_bytes = res.array.nbytes
+            
+        toc = time.time() - tic
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print(f'{processes:3d} processes: {toc:8.3f} seconds, peak memory {peak_bytes / 1e6:8.3f} MB '
+              f'(+ {shared_bytes / 1e6:8.3f} MB shared)')
+        rows.append([processes, toc, int(calc_async), peak_bytes / 1e6, shared_bytes / 1e6])
+
+    return pd.DataFrame(rows, columns=['Processors', 'Time [s]', 'Asynchronously', 
+                                       'Peak memory [MB]', 'Shared memory [MB]'])
+
+
+if __name__ == '__main__': # Necessary to make multiprocessing work
+
+    # only needed for plotting and saving the results, so not imported by
+    # the workers or when this file is imported
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    # indicate number of processing units you want to use for calculating the
+    # mandelbrot set (defaults to all available units)
+    number_of_processing_units = os.cpu_count()
+
+    # define whether to process asynchronously or not
     calc_async = True;
-    
-    # If we want to save time it took to run the simulation
+
+    # If we want to save time it took to run the simulation for 1 up to
+    # os.cpu_count() processes, both synchronously and asynchronously
     save_to_csv = False
-    
-    # decide whether to reset the csv file
-    reset_csv = False;
-    
-    # Create worker pool
+
     print("Parent process id: {:7d}".format(os.getpid()))
-    pool = mp.Pool(processes=number_of_processing_units)
-    
+
     # set how detailed the Mandelbrot set should be
     detail = 5000
-    
-    # initialise the resulting set
-    res = np.zeros ((detail, detail))
-    
-    # create all used values for c
-    print('Creating c matrix...')
 
-    # initialise real and imaginary values to use for c    
+    # initialise the resulting set in shared memory, so the workers write 
+    # into it directly
+    res_shared = SharedArray((detail, detail))
+
+    # initialise real and imaginary values to use for c (the values of c 
+    # themselves are created by the workers)
     rVals = np.linspace(-2.0, 1.0, detail)
     iVals = np.linspace(-1.5, 1.5, detail)
-    
-    # create matrices containing the real and imaginary parts of the values for c...
-    real_part = ml.repmat(rVals, detail, 1)
-    imag_part = ml.repmat(iVals.T, detail, 1).T
-
-    # ... and add them together
-    c = real_part + imag_part * 1j
-    print('c matrix created!')
 
     # calculate the Mandelbrot set
-    if calc_async:
-        
-        print('Calculate Mandelbrot set asychronously...')
-        tic = time.time()
-        for i in range(detail):
-            res[i, :] = pool.map_async(M, c[i,:]).get()
-            
-        toc = time.time() - tic
-        print(f'Calculated Mandelbrot asynchronously set in {toc:5.3} seconds!')
-        
-    else:
-    
-        print('Calculate Mandelbrot set...')
-        tic = time.time()
-        for i in range(detail):
-            res[i, :] = pool.map(M, c[i,:])        
+    print('Calculate Mandelbrot set' + (' asychronously' if calc_async else '') + '...')
+    tic = time.time()
+    multiprocessing_render(rVals, iVals, res_shared, number_of_processing_units, calc_async)
+    toc = time.time() - tic
+    print(f'Calculated Mandelbrot set in {toc:5.3} seconds!')
     
-        toc = time.time() - tic
-        print(f'Calculated Mandelbrot set in {toc:5.3} seconds!')
+    # the shared memory is not needed anymore after copying the result
+    res = res_shared.array.copy()
+    res_shared.release()
 
-    # finalise the pool
-    pool.close()
-    pool.join()
-    
     # plot the results
-    
+
     fig = plt.figure(figsize=(10,10))
     print('Plotting result...')
     ax = plt.imshow (res, cmap='hot', extent=[-2.0, 1.0, -1.5, 1.5])
@@ -104,24 +494,14 @@ if __name__ == '__main__': # Necessary to make multiprocessing work
     print('Result plotted!')
 
 
-    # only runs when we want to generate data to plot later (this has already
-    # been done on my machine, but I wanted to leave this in)
-    
+    # only runs when we want to generate data to plot later using
+    # multiprocessing_output/plot_csv_results.py
+
     if save_to_csv:
-        # if we want to reset the csv file
-        if reset_csv:
-            # initialise dataframe
-            first_entry = [[number_of_processing_units, toc]]
-        
-            # put variables in a pandas.DataFrame
-            dataframe = pd.DataFrame (first_entry, columns=['Processors', 'Time [s]', 'Asynchronously'])
-        else:
-        # otherwise, append the already existing dataset
-            dataframe = pd.read_csv('time_processors.csv', usecols=['Processors', 'Time [s]', 'Asynchronously'])
-            data = {'Processors' : number_of_processing_units, 'Time [s]' : toc, 'Asynchronously' : calc_async}
-            dataframe = dataframe.append(data, ignore_index=True) 
-        
+        dataframe = pd.concat([scaling_benchmark(detail, calc_async = False),
+                               scaling_benchmark(detail, calc_async = True)], ignore_index = True)
+
         # save dataframe to .csv
-        dataframe.to_csv('time_processors.csv')
+        dataframe.to_csv('multiprocessing_output/time_processors.csv')
+
 
-    
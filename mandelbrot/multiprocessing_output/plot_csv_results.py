@@ -2,7 +2,9 @@
 
 Script to plot the results saved in the time_processors.csv file. The .csv 
 file was generated from the multiprocessingMandelbrot.py file and the plot is 
-saved in this folder as multiprocessing_time_results.pdf
+saved in this folder as multiprocessing_time_results.pdf. The .csv file can be
+regenerated using scaling_benchmark() in multiprocessing_mandelbrot.py (set
+save_to_csv to True in that file).
 
 
 Discussion and Conclusion:
@@ -30,16 +32,13 @@ import matplotlib.pyplot as plt
 data = pd.read_csv('time_processors.csv', usecols=['Processors', 'Time [s]', 'Asynchronously'])
 
 # retrieve data from multiprocessing synchronously and asynchronously
-sync_data = data.loc[data.Asynchronously == 0, 'Time [s]']
-async_data = data.loc[data.Asynchronously == 1, 'Time [s]']
-
-# initialise x data
-x_data = range(1,9)
+sync_data = data.loc[data.Asynchronously == 0]
+async_data = data.loc[data.Asynchronously == 1]
 
 # plot figure
 fig = plt.figure()
-plt.plot(x_data, async_data)
-plt.plot(x_data, sync_data)
+plt.plot(sync_data['Processors'], sync_data['Time [s]'])
+plt.plot(async_data['Processors'], async_data['Time [s]'])
 plt.title('Time to generate $5000 \\times 5000 $ values of the Mandelbrot set')
 plt.xlabel('Number of processing units')
 plt.ylabel('Time [s]')
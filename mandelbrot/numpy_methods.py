@@ -0,0 +1,172 @@
+"""
+
+This file contains methods to compute the Mandelbrot set that only depend on
+numpy. As opposed to the functions in optimisation_methods.py, nothing here
+needs numba, so these are the methods to fall back to on machines where numba
+is not installed or where the time it takes to jit-compile the functions is
+not acceptable.
+
+NumPy, masked arrays:
+- numpy_masked() iterates :math:`z_{i+1} = z_i^2 + c` for all values of
+:math:`c` in the grid at the same time. After every iteration the values of
+:math:`c` for which :math:`|z|` has crossed the threshold are written to the
+result and removed from the working set (using boolean-mask compaction), so
+that every iteration only computes the values that are still bounded.
+
+- numpy_masked_tile() is identical to numpy_masked(), but computes a
+(possibly non-square) grid. It is used by the 'numpy' engine of render() (see
+engines.py).
+
+- interior_mask() returns a boolean mask of the values of :math:`c` in the
+grid that lie in the main cardioid or the period-2 bulb of the Mandelbrot
+set. These values are part of the set, so the grid methods can set their
+result to 1 without iterating them.
+
+The outputs are identical to the ones of naive() in optimisation_methods.py,
+as the same operations are performed in the same order, only for many values
+of :math:`c` at once.
+
+"""
+
+import numpy as np
+
+
+def interior_mask(rVals, iVals):
+
+    """
+
+    Whole-array version of interior() in mandelbrot_alg.py. Checks for all
+    values of :math:`c` in the grid spanned by rVals and iVals whether they lie
+    in the main cardioid or the period-2 bulb of the Mandelbrot set.
+
+    INPUT::
+
+        rVals : Numpy array of size (n,)
+            The values for the real component of c.
+
+        iVals : Numpy array of size (m,)
+            The values for the imaginary component of c.
+
+    OUTPUT::
+
+        mask : Numpy array of bools of size (m, n)
+            True for the values of c that are known to be part of the
+            Mandelbrot set.
+
+    """
+
+    x = rVals[np.newaxis, :] - 0.25
+    y2 = iVals[:, np.newaxis] * iVals[:, np.newaxis]
+
+    # main cardioid
+    q = x*x + y2
+    mask = q * (q + x) <= 0.25 * y2
+
+    # period-2 bulb
+    x = rVals[np.newaxis, :] + 1
+    mask |= x*x + y2 <= 0.0625
+
+    return mask
+
+
+def numpy_masked(detail, rVals, iVals, res, I = 100, T = 2, interior = False):
+
+    """
+
+    Computes the Mandelbrot set for the full grid of values for :math:`c` at
+    the same time using numpy arrays. Every iteration, the values of
+    :math:`c` that are still bounded are compacted into smaller arrays, so
+    that values that have escaped are not computed anymore.
+
+    INPUT::
+
+        detail : int
+            How detailed should the simulation be.
+
+        rVals : Numpy array of size (detail,)
+            The values for the real component of c to iterate over.
+
+        iVals : Numpy array of size (detail,)
+            The values for the imaginary component of c to iterate over.
+
+        res : Numpy array of size (detail, detail)
+            Matrix of zeros that will be filled with outputs of the function
+            generating the Mandelbrot set.
+
+        I : int
+            Maximum number of iterations.
+
+        T : float
+            Threshold value.
+
+        interior : bool
+            If True, the values of c in the main cardioid and the period-2
+            bulb (see interior_mask()) are removed from the working set before
+            iterating. Ignored if T < 2.
+
+    OUTPUT::
+
+        res : Numpy array of size (detail, detail)
+            Matrix containing the result of the function generating the
+            Mandelbrot set for all values of c that this function has iterated
+            over.
+
+    """
+
+    # res[:detail, :detail] is a view, so the result is written into res
+    numpy_masked_tile(rVals[:detail], iVals[:detail], res[:detail, :detail], I, T, interior)
+
+    return res
+
+
+def numpy_masked_tile(rVals, iVals, res, I = 100, T = 2, interior = False):
+
+    """
+
+    Identical to numpy_masked(), but for a (possibly non-square) grid: res has
+    size (len(iVals), len(rVals)).
+
+    """
+
+    # create all values for c as a flat array (rows are imaginary values,
+    # columns are real values, identical to the other methods)
+    c = (rVals[np.newaxis, :] + iVals[:, np.newaxis]*1j).ravel()
+
+    # flat indices into res of the values that are still bounded
+    idx = np.arange(c.size)
+
+    # values that never cross the threshold are part of the set
+    out = np.ones(c.size)
+
+    # values known to be part of the set do not need to be iterated (they
+    # only never cross the threshold if T >= 2)
+    if interior and T >= 2:
+        bounded = ~interior_mask(rVals, iVals).ravel()
+        c = c[bounded]
+        idx = idx[bounded]
+
+    # initialise z
+    z = np.zeros_like(c)
+
+    # main loop
+    for i in range(I):
+        np.multiply(z, z, out=z)
+        np.add(z, c, out=z)
+
+        # save the ratio for the values that have just crossed the threshold
+        escaped = np.abs(z) > T
+        out[idx[escaped]] = (i+1) / I
+
+        # only keep the values that are still bounded
+        bounded = ~escaped
+        z = z[bounded]
+        c = c[bounded]
+        idx = idx[bounded]
+
+        # stop if all values have escaped
+        if idx.size == 0:
+            break
+
+    res[...] = out.reshape(res.shape)
+
+    return res
@@ -39,6 +39,27 @@ being numba-optimised itself using the @jit decorator
 - gu_jit_vectorised() attempts to use general ufuncs to implement 
 vectorisation. 
 
+NumPy, masked arrays:
+- numpy_masked() computes the whole grid at once using numpy arrays and only
+keeps iterating the values of :math:`c` that are still bounded. It does not
+need numba and is implemented in numpy_methods.py. It is imported here so it
+can be used alongside the other methods.
+
+
+Interior check:
+- naive(), jit_func(), njit_par(), numpy_masked() and jit_save_z() take an 
+optional interior argument. If it is set to True, values of :math:`c` that lie
+in the main cardioid or the period-2 bulb are set to 1 without iterating them
+(see interior() in mandelbrot_alg.py). The output stays identical, but views
+that contain a large part of the set are computed much faster.
+
+Cycle detection:
+- jit_func(), njit_par() and jit_save_z() take the maximum number of 
+iterations I and threshold T, as well as a tolerance cycle_tol for detecting
+periodic orbits of :math:`z` (see M_jit() in mandelbrot_alg.py). Values of 
+:math:`c` whose orbit is periodic return 1 right away instead of running all
+:math:`I` iterations.
+
 
 The non-optimised functions (naive() and vectorised()) have an @profile 
 decorator so that we can see what lines of code are heaviest. To profile the
@@ -46,6 +67,84 @@ functions run "kernprof -l -v mandelbrot/run.py" from the root of the
 repository.
 
 
+All numba-optimised methods use M_jit_sq() (or M_save_z_sq()) from 
+mandelbrot_alg.py, which avoids the square root in :math:`|z|` and keeps the
+real and imaginary parts of :math:`z` as separate floating-point values.
+
+
+Mariani-Silver:
+- mariani_silver() recursively subdivides the grid into rectangles and only
+computes the border of each rectangle. Rectangles with the same value on the
+whole border are filled without iterating (the Mandelbrot set is connected).
+check_mariani_silver() compares its output to njit_par().
+
+Tiles:
+- njit_par_tile() and jit_save_z_tile() are identical to njit_par() and 
+jit_save_z(), but compute a (possibly non-square) tile of the grid. These are
+used by tiled.py to render views that do not fit in memory.
+
+- jit_func_tile() is identical to njit_par_tile(), but not parallelised. It 
+is used by the workers in multiprocessing_mandelbrot.py.
+
+- naive_tile() is identical to naive() for a (possibly non-square) tile.
+
+- njit_par_count_tile() and jit_save_z_count_tile() are identical to 
+njit_par_tile() and jit_save_z_tile(), but write the number of iterations
+into a matrix of unsigned integers (and :math:`z` into a matrix of complex64
+or complex128), which takes 2 to 8 times less memory than the float64 ratio.
+
+- njit_par_smooth_tile() and njit_par_distance_tile() are identical to 
+njit_par_tile(), but compute the continuous iteration count and the distance
+estimate of M_smooth_sq() and M_distance_sq() (see mandelbrot_alg.py), which
+are used for shading the plots without saving the values of :math:`z`.
+
+Lanes (SIMD):
+- njit_par_lanes_tile() is identical to njit_par_tile(), but iterates the 
+values of :math:`c` of a row in batches of lanes values in lockstep instead of
+one at a time. M_jit_sq() returns as soon as :math:`z` crosses the threshold,
+which is the branch that stops numba (LLVM) from vectorising the iterations,
+and why jit_vectorised() and gu_jit_vectorised() are not faster than 
+jit_func(). In njit_par_lanes_tile() every lane does chunk iterations with
+masked updates instead (a lane that has crossed the threshold or done 
+:math:`I` iterations keeps its value of :math:`z` and its count), which LLVM
+compiles to SIMD instructions, e.g. 8 float64 values per AVX-512 
+instruction. After every chunk of iterations, the lanes that are done are 
+written to res and refilled with the next value of :math:`c` of the row 
+(with interior = True, the values of :math:`c` in the main cardioid or the
+period-2 bulb are set to 1 instead of being put in a lane; the cycle 
+detection is done with masked updates as well). The
+results are identical to njit_par_tile() for float64 (the same operations
+are done in the same order). With float32 values of :math:`c` twice as many 
+lanes fit in a register, but the results differ near the boundary of the 
+set (and the counts are only exact up to :math:`2^{24}` iterations). Run 
+"python -m mandelbrot.benchmark --lanes" to compare the numbers of lanes.
+
+Scheduling:
+- njit_par() and njit_par_tile() use prange over the rows, which numba 
+divides over the threads in contiguous blocks of rows. The values of 
+:math:`c` in the set take all :math:`I` iterations while most others take a 
+few, so the threads that get the rows through the middle of the set finish
+long after the others, which sit idle. njit_par_balanced_tile() divides the
+rows over the threads with schedule_rows() instead: 'cyclic' gives thread
+:math:`k` the rows :math:`k, k + n, k + 2n, ...` (for :math:`n` threads), so 
+every thread gets rows from every part of the view; 'lpt' estimates the cost
+of every row from a coarse pre-pass (estimate_row_cost(), every 8th row and
+column) and assigns the rows from the most to the least expensive to the 
+thread with the least work so far. 'static' divides the rows like prange, 
+for comparison. The number of iterations done by every thread is returned, 
+and imbalance() gives the ratio of the largest and the mean work, i.e. how 
+much longer the render takes than a perfectly balanced one (run 
+"python -m mandelbrot.benchmark --schedule").
+
+Threads:
+- jit_nogil_tile() computes a tile like jit_func_tile() (or any other output
+of render()), but is compiled with nogil=True, so that it can run in several
+Python threads at the same time (see threaded.py).
+
+The tile functions are the ones used by the engines of render() in 
+engines.py, which computes any (possibly non-square) view of the set.
+
+
 Finally, the jit_save_z() function returns -- on top of the numpy array 
 containing the outputs of the Mandelbrot functions -- the values of :math: `z` 
 from the last iteration in that function. To optimise the function, we use 
@@ -54,26 +153,51 @@ True as this optimisation technique was found to speed up the algorithm most
 (see benchmark.py). The jit_save_z() method is only used by plot_z_values.py. 
 
 
+Compilation:
+- All numba-optimised functions are compiled with cache=True, so the compiled
+machine code is saved to disk (in __pycache__, or in NUMBA_CACHE_DIR if it is
+set) and only the first process that calls a function pays for compiling it.
+This matters most for the short-lived workers in multiprocessing_mandelbrot.py,
+where compiling the functions takes longer than rendering a small tile.
+
+- SIGNATURES lists explicit type signatures for the functions that are called
+with all their arguments given, as done by tiled.py and
+multiprocessing_mandelbrot.py (I an int, T a float, interior a bool and
+cycle_tol a float). warm_up() compiles (or loads from the cache) these
+signatures ahead of the first call, optionally in a background thread so
+that this overlaps with whatever else the program does at start-up. Setting
+the environment variable MANDELBROT_WARM_UP=1 starts this thread when the
+module is imported. Calls that leave out the optional arguments (or pass T
+as an int) still compile their own version on first use, which is cached as
+well.
+
+
 """
 
+import os
+import heapq
+import threading
+from itertools import product
+
+import numpy as np
 import mandelbrot.mandelbrot_alg as mb
-from numba import jit, njit, prange, vectorize, guvectorize, float64, int64
+from mandelbrot.numpy_methods import numpy_masked
+from mandelbrot.lazy_numba import jit, njit, prange, vectorize, guvectorize, load_numba
 
 
 # Took the following from Thomas' example to avoid errors when trying to run files
     
-# No-op for use with profiling and test 
+# No-op for use with profiling and test. kernprof puts profile in the
+# builtins; otherwise the function itself is returned, so that calling it
+# does not go through an extra wrapper.
 try:
-    @profile
-    def f(x): return x
-except:
+    profile
+except NameError:
     def profile(func):
-        def inner(*args, **kwargs):
-            return func(*args, **kwargs)
-        return inner
+        return func
 
 @profile
-def naive(detail, rVals, iVals, res):
+def naive(detail, rVals, iVals, res, I = 100, T = 2, interior = False):
     
     """
     
@@ -93,6 +217,16 @@ def naive(detail, rVals, iVals, res):
         res : Numpy array of size (detail, detail)
             Matrix of zeros that will be filled with outputs of the function 
             generating the Mandelbrot set.
+            
+        I : int
+            Maximum number of iterations.
+            
+        T : float
+            Threshold value.
+            
+        interior : bool
+            If True, skip the iterations for values of c that lie in the main 
+            cardioid or the period-2 bulb.
 
     OUTPUT::
         
@@ -105,28 +239,32 @@ def naive(detail, rVals, iVals, res):
     
     for i in range(detail):
         for r in range(detail):
-            res[i, r] = mb.M(rVals[r] + iVals[i]*1j)
+            res[i, r] = mb.M(rVals[r] + iVals[i]*1j, I, T, check_interior = interior)
         
     return res
             
-@jit
-def jit_func(detail, rVals, iVals, res):
+@jit(cache=True)
+def jit_func(detail, rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
    
     """
     
     The same 'naive' solution as naive() but optimised with numba using the 
-    @jit decorator
+    @jit decorator. 
+    
+    The maximum number of iterations I and threshold T can be changed, and 
+    the cycle detection of M_jit() is enabled by setting cycle_tol to a 
+    positive value (e.g. 1e-12). This is worth it for large values of I.
     
     """
    
     for i in range(detail):
         for r in range(detail):
-            res[i, r] = mb.M_jit(rVals[r] + iVals[i]*1j)
+            res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
         
     return res
 
-@njit(parallel=True)
-def njit_par(detail, rVals, iVals, res):
+@njit(parallel=True, cache=True)
+def njit_par(detail, rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
     
     """
     
@@ -134,32 +272,34 @@ def njit_par(detail, rVals, iVals, res):
     parallelisation with the @njit decorator and the parallel flag set to True.
     
     The 'range' funtions have been replaced by 'prange' to tell the compiler
-    that these loops can be parallelised.
+    that these loops can be parallelised. I, T and cycle_tol are the same as
+    for jit_func().
     
     """
     
     for i in prange(detail):
         for r in prange(detail):
-            res[i, r] = mb.M_jit(rVals[r] + iVals[i]*1j)
+            res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
 
     return res 
 
 
-@vectorize(['float32(float32, float32)', 'float64(float64, float64)'])
-def _vectorised_loop(r, i):
+@vectorize(['float32(float32, float32, int64, float64)', 'float64(float64, float64, int64, float64)'])
+def _vectorised_loop(r, i, I, T):
    
     """
     
     Internal function to be used by vectorised(). The function is vectorised
-    using the @vectorise decorator and takes in two floating-point values and
-    returns a floating-point value.
+    using the @vectorise decorator and takes in two floating-point values (and
+    the maximum number of iterations and threshold) and returns a 
+    floating-point value.
 
     """
     
-    return mb.M(r + i*1j)
+    return mb.M(r + i*1j, I, T)
    
 @profile 
-def vectorised(detail, rVals, iVals, res):
+def vectorised(detail, rVals, iVals, res, I = 100, T = 2):
     
     """
     
@@ -174,27 +314,27 @@ def vectorised(detail, rVals, iVals, res):
     """
     
     for i in range(detail):
-        res[i, :] = _vectorised_loop(rVals, iVals[i])
+        res[i, :] = _vectorised_loop(rVals, iVals[i], I, T)
 
     return res 
 
 
-@vectorize(['float32(float32, float32)', 'float64(float64, float64)'])
-def _jit_vectorised_loop(r, i):
+@vectorize(['float32(float32, float32, int64, float64)', 'float64(float64, float64, int64, float64)'], cache=True)
+def _jit_vectorised_loop(r, i, I, T):
    
     """
     
     Internal function to be used by jit_vectorised(). Identical to
     _vectorised_loop(), but uses the @jit version of the function calculating
-    the Mandelbrot set.
+    the Mandelbrot set (with the real and imaginary parts split).
 
     """
     
-    return mb.M_jit(r + i*1j)
+    return mb.M_jit_sq(r, i, I, T)
 
 
-@jit
-def jit_vectorised(detail, rVals, iVals, res):
+@jit(cache=True)
+def jit_vectorised(detail, rVals, iVals, res, I = 100, T = 2):
     
     """
     
@@ -205,13 +345,13 @@ def jit_vectorised(detail, rVals, iVals, res):
     """
     
     for i in range(detail):
-        res[i, :] = _jit_vectorised_loop(rVals, iVals[i])
+        res[i, :] = _jit_vectorised_loop(rVals, iVals[i], I, T)
 
     return res 
 
 
-@guvectorize(['void(int64, float64[:], float64[:], float64[:, :])'], '(), (n),(n)->(n,n)', target='cpu')
-def gu_jit_vectorised(detail, rVals, iVals, res):
+@guvectorize(['void(int64, float64[:], float64[:], int64, float64, float64[:, :])'], '(),(n),(n),(),()->(n,n)', target='cpu', cache=True)
+def _gu_jit_vectorised_loop(detail, rVals, iVals, I, T, res):
     
     """
     
@@ -220,21 +360,37 @@ def gu_jit_vectorised(detail, rVals, iVals, res):
     result, it is saved in the last input argument of the function: res. This 
     denoted by the mapping in the argument of the decorator:
         
-        (), (n),(n)->(n,n)
+        (),(n),(n),(),()->(n,n)
         
-    which essentially says that it creates a n x n array from a scalar and two
-    n x 1 arrays.
+    which essentially says that it creates a n x n array from a scalar, two
+    n x 1 arrays and two more scalars (the maximum number of iterations and 
+    the threshold).
     
     """
     
     for i in range(detail):
         for r in range(detail):
-            res[i, r] = mb.M_jit(rVals[r] + iVals[i]*1j)
+            res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T)
 
 
+def gu_jit_vectorised(detail, rVals, iVals, res, I = 100, T = 2):
+    
+    """
+    
+    Calls the general ufunc _gu_jit_vectorised_loop(), which saves its result 
+    in res. General ufuncs do not support default arguments, which is why 
+    this function is needed. 
+    
+    """
+    
+    _gu_jit_vectorised_loop(detail, rVals, iVals, I, T, res)
+    
+    return res
+
 
-@njit(parallel=True)
-def jit_save_z(detail, rVals, iVals, res, z_res, I, T):
+
+@njit(parallel=True, cache=True)
+def jit_save_z(detail, rVals, iVals, res, z_res, I, T, interior = False, cycle_tol = 0.0):
     
     """
     
@@ -263,6 +419,15 @@ def jit_save_z(detail, rVals, iVals, res, z_res, I, T):
         T : float
             Threshold value.
             
+        interior : bool
+            If True, skip the iterations for values of c that lie in the main 
+            cardioid or the period-2 bulb. The value of z for these values of
+            c is left at 0.
+            
+        cycle_tol : float
+            Tolerance for detecting periodic orbits of z (see M_jit() in
+            mandelbrot_alg.py). Disabled if 0.
+            
      OUTPUT::
        
         
@@ -278,6 +443,792 @@ def jit_save_z(detail, rVals, iVals, res, z_res, I, T):
     """
     for i in prange(detail):
         for r in prange(detail):
-            z_res[i, r], res[i, r] = mb.M_save_z(rVals[r] + iVals[i]*1j, I, T)
+            z_res[i, r], res[i, r] = mb.M_save_z_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+        
+    return z_res, res
+
+@njit(cache=True)
+def _ms_pixel(i, r, rVals, iVals, res, computed, I, T):
+    
+    """
+    
+    Internal function to be used by _mariani_silver(). Computes the value for
+    pixel (i, r) if it has not been computed yet, and returns it.
+    
+    """
+    
+    if not computed[i, r]:
+        res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T)
+        computed[i, r] = True
+        
+    return res[i, r]
+
+
+@njit(parallel=True, cache=True)
+def _mariani_silver(detail, rVals, iVals, res, computed, I, T, block_size, min_size):
+    
+    """
+    
+    Internal function to be used by mariani_silver(). The grid is divided 
+    into blocks of block_size x block_size values of c that are processed in
+    parallel using prange. Every block is subdivided using a stack of 
+    rectangles (numba does not do recursion in parallel loops very well), 
+    where a rectangle is stored as (first row, last row, first column, last
+    column).
+    
+    The pixels that are actually iterated are set to True in computed.
+    
+    """
+    
+    n_blocks = (detail + block_size - 1) // block_size
+    
+    for b in prange(n_blocks * n_blocks):
+        
+        # rectangle covering this block
+        i0 = (b // n_blocks) * block_size
+        r0 = (b % n_blocks) * block_size
+        i1 = min(i0 + block_size, detail) - 1
+        r1 = min(r0 + block_size, detail) - 1
+        
+        # every subdivision adds at most 4 rectangles to the stack
+        stack = np.empty((4 * (block_size + 1), 4), dtype=np.int64)
+        stack[0, 0] = i0
+        stack[0, 1] = i1
+        stack[0, 2] = r0
+        stack[0, 3] = r1
+        n = 1
+        
+        while n > 0:
+            n -= 1
+            i0 = stack[n, 0]
+            i1 = stack[n, 1]
+            r0 = stack[n, 2]
+            r1 = stack[n, 3]
+            
+            # compute the border and check whether it has the same value 
+            # everywhere
+            value = _ms_pixel(i0, r0, rVals, iVals, res, computed, I, T)
+            uniform = True
+            for r in range(r0, r1 + 1):
+                if _ms_pixel(i0, r, rVals, iVals, res, computed, I, T) != value:
+                    uniform = False
+                if _ms_pixel(i1, r, rVals, iVals, res, computed, I, T) != value:
+                    uniform = False
+            for i in range(i0 + 1, i1):
+                if _ms_pixel(i, r0, rVals, iVals, res, computed, I, T) != value:
+                    uniform = False
+                if _ms_pixel(i, r1, rVals, iVals, res, computed, I, T) != value:
+                    uniform = False
+            
+            if uniform:
+                # the Mandelbrot set is connected, so nothing different can
+                # be inside a border with the same value everywhere
+                for i in range(i0 + 1, i1):
+                    for r in range(r0 + 1, r1):
+                        res[i, r] = value
+                        
+            elif i1 - i0 <= min_size or r1 - r0 <= min_size:
+                # small rectangles are computed pixel by pixel
+                for i in range(i0 + 1, i1):
+                    for r in range(r0 + 1, r1):
+                        _ms_pixel(i, r, rVals, iVals, res, computed, I, T)
+                        
+            else:
+                # split the rectangle into four rectangles that share their
+                # borders (which are computed only once)
+                im = (i0 + i1) // 2
+                rm = (r0 + r1) // 2
+                stack[n] = (i0, im, r0, rm)
+                stack[n + 1] = (i0, im, rm, r1)
+                stack[n + 2] = (im, i1, r0, rm)
+                stack[n + 3] = (im, i1, rm, r1)
+                n += 4
+                
+    return res
+
+
+def mariani_silver(detail, rVals, iVals, res, I = 100, T = 2, block_size = 64, min_size = 4):
+    
+    """
+    
+    Computes the Mandelbrot set using the Mariani-Silver algorithm (also 
+    called boundary tracing by rectangle subdivision). Only the border of a 
+    rectangle of values of :math:`c` is computed. If all values on the 
+    border are the same, all values inside the rectangle are the same as 
+    well, as the Mandelbrot set is connected, and the rectangle is filled 
+    with that value without iterating. Otherwise, the rectangle is divided 
+    into four smaller rectangles and the same is done for those. This way, 
+    large parts of the set as well as large parts far away from the set are 
+    never iterated. 
+    
+    The blocks of block_size x block_size values of c that the grid is 
+    divided into initially are computed in parallel. The output is 
+    identical to njit_par() as long as no detail of the set falls completely
+    within a rectangle with a uniform border (use check_mariani_silver() to
+    verify this for a given view).
+
+    INPUT::
+        
+        detail : int
+            How detailed should the simulation be.
+            
+        rVals : Numpy array of size (detail,)
+            The values for the real component of c to iterate over.
+            
+        iVals : Numpy array of size (detail,)
+            The values for the imaginary component of c to iterate over.
+            
+        res : Numpy array of size (detail, detail)
+            Matrix of zeros that will be filled with outputs of the function 
+            generating the Mandelbrot set.
+        
+        I : int
+            Maximum number of iterations.
+            
+        T : float
+            Threshold value.
+            
+        block_size : int
+            Size of the blocks that are computed in parallel.
+            
+        min_size : int
+            Rectangles with a height or width smaller than or equal to this 
+            value are not subdivided further, but computed pixel by pixel.
+
+    OUTPUT::
+        
+        res : Numpy array of size (detail, detail)
+            Matrix containing the result of the function generating the
+            Mandelbrot set for all values of c.
+
+    """
+    
+    computed = np.zeros((detail, detail), dtype=np.bool_)
+    
+    return _mariani_silver(detail, rVals, iVals, res, computed, I, T, block_size, min_size)
+
+
+def check_mariani_silver(detail, rVals, iVals, I = 100, T = 2, block_size = 64, min_size = 4):
+    
+    """
+    
+    Exactness check of mariani_silver() against njit_par() for a view. 
+
+    OUTPUT::
+        
+        mismatches : int
+            Number of values of c for which the outputs of mariani_silver()
+            and njit_par() differ.
+            
+        fraction_iterated : float
+            Fraction of the values of c that mariani_silver() has actually
+            iterated.
+
+    """
+    
+    res = np.zeros((detail, detail))
+    computed = np.zeros((detail, detail), dtype=np.bool_)
+    _mariani_silver(detail, rVals, iVals, res, computed, I, T, block_size, min_size)
+    
+    true_res = njit_par(detail, rVals, iVals, np.zeros((detail, detail)), I, T)
+    
+    return int(np.sum(res != true_res)), computed.mean()
+
+
+@njit(parallel=True, cache=True)
+def njit_par_tile(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par(), but for a (possibly non-square) tile of the grid:
+    res has size (len(iVals), len(rVals)). Used by tiled.py.
+    
+    """
+    
+    for i in prange(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+
+    return res
+
+
+@njit(parallel=True, cache=True)
+def jit_save_z_tile(rVals, iVals, res, z_res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to jit_save_z(), but for a (possibly non-square) tile of the 
+    grid: res and z_res have size (len(iVals), len(rVals)). Used by tiled.py.
+    
+    """
+    
+    for i in prange(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            z_res[i, r], res[i, r] = mb.M_save_z_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+        
+    return z_res, res
+
+
+@jit(nopython=True, cache=True)
+def jit_func_tile(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par_tile(), but not parallelised. Used by the workers in
+    multiprocessing_mandelbrot.py, which are parallel processes already.
+    
+    """
+    
+    for i in range(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+            
+    return res
+
+
+@njit(parallel=True, cache=True)
+def njit_par_smooth_tile(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par_tile(), but fills res with the normalised 
+    continuous iteration count of M_smooth_sq() in mandelbrot_alg.py instead
+    of the ratio of iterations.
+    
+    """
+    
+    for i in prange(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M_smooth_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+
+    return res
+
+
+@njit(parallel=True, cache=True)
+def njit_par_distance_tile(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par_tile(), but fills res with the exterior distance
+    estimate of M_distance_sq() in mandelbrot_alg.py (0 for the values of c
+    in the set) instead of the ratio of iterations.
+    
+    """
+    
+    for i in prange(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M_distance_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+
+    return res
+
+
+@njit(parallel=True, cache=True)
+def njit_par_count_tile(rVals, iVals, counts, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par_tile(), but fills counts (a matrix of unsigned 
+    integers, see count_dtype() in engines.py) with the number of iterations
+    of M_count_sq() in mandelbrot_alg.py instead of the ratio of iterations.
+    
+    """
+    
+    for i in prange(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            counts[i, r] = mb.M_count_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+
+    return counts
+
+
+@njit(parallel=True, cache=True)
+def jit_save_z_count_tile(rVals, iVals, counts, z_res, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to jit_save_z_tile(), but fills counts with the number of 
+    iterations like njit_par_count_tile(). z_res can be a complex64 matrix,
+    in which case the values of z are rounded when they are written.
+    
+    """
+    
+    for i in prange(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            z_res[i, r], counts[i, r] = mb.M_save_z_count_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+        
+    return z_res, counts
+
+
+@njit(cache=True)
+def _next_lane_column(rVals, ci, res_row, column, interior):
+    
+    """
+    
+    Internal function returning the first column from column on of which the
+    value of c has to be iterated by _lanes_row(). With interior = True, the
+    values of c in the main cardioid or the period-2 bulb are set to 1 and 
+    skipped, so they never take up a lane.
+    
+    """
+    
+    if interior:
+        while column < rVals.shape[0] and mb.interior_jit(complex(rVals[column], ci)):
+            res_row[column] = 1
+            column += 1
+    return column
+
+
+@njit(cache=True)
+def _lanes_row(rVals, ci, res_row, I, T2, lanes, chunk, interior, tol2):
+    
+    """
+    
+    Internal function computing one row of njit_par_lanes_tile(): the values
+    of c = rVals + i ci, lanes at a time.
+    
+    """
+    
+    # the state of every lane: c, z, the number of iterations (as the same 
+    # floating point type, so the counts do not take twice as many SIMD 
+    # registers for float32) and the column of the value of c (-1 if none is
+    # left). The squares of z are computed
+    # again every iteration instead of being kept: with fewer arrays to write 
+    # to, LLVM vectorises the loop over the lanes.
+    cr = np.zeros(lanes, dtype=rVals.dtype)
+    x = np.zeros(lanes, dtype=rVals.dtype)
+    y = np.zeros(lanes, dtype=rVals.dtype)
+    n = np.full(lanes, I, dtype=rVals.dtype)
+    column = np.full(lanes, -1, dtype=np.int64)
+    
+    # the state of the cycle detection of every lane (see M_jit() in 
+    # mandelbrot_alg.py), only used if tol2 > 0
+    x_saved = np.zeros(lanes, dtype=rVals.dtype)
+    y_saved = np.zeros(lanes, dtype=rVals.dtype)
+    steps = np.zeros(lanes, dtype=rVals.dtype)
+    next_save = np.ones(lanes, dtype=rVals.dtype)
+    
+    next_column = _next_lane_column(rVals, ci, res_row, 0, interior)
+    busy = 0
+    for l in range(lanes):
+        if next_column < rVals.shape[0]:
+            cr[l] = rVals[next_column]
+            n[l] = 0
+            column[l] = next_column
+            next_column = _next_lane_column(rVals, ci, res_row, next_column + 1, interior)
+            busy += 1
+    
+    while busy > 0:
+        # masked iterations of all lanes, without branches: lanes that have
+        # crossed the threshold or done I iterations keep their z
+        if tol2 > 0:
+            for _ in range(chunk):
+                for l in range(lanes):
+                    x2 = x[l] * x[l]
+                    y2 = y[l] * y[l]
+                    active = (x2 + y2 <= T2) & (n[l] < I)
+                    xy = x[l] * y[l]
+                    new_y = xy + xy + ci
+                    new_x = x2 - y2 + cr[l]
+                    x[l] = new_x if active else x[l]
+                    y[l] = new_y if active else y[l]
+                    n[l] += active
+                    
+                    # the same order as M_jit_sq(): a value of z that has 
+                    # not crossed the threshold and has returned to the saved
+                    # value ends the iterations with the result 1
+                    dx = x[l] - x_saved[l]
+                    dy = y[l] - y_saved[l]
+                    bounded = x[l] * x[l] + y[l] * y[l] <= T2
+                    n[l] = I if active & bounded & (dx*dx + dy*dy < tol2) else n[l]
+                    steps[l] += active
+                    save = active & (steps[l] == next_save[l])
+                    x_saved[l] = x[l] if save else x_saved[l]
+                    y_saved[l] = y[l] if save else y_saved[l]
+                    steps[l] = 0 if save else steps[l]
+                    next_save[l] = 2 * next_save[l] if save else next_save[l]
+        else:
+            for _ in range(chunk):
+                for l in range(lanes):
+                    x2 = x[l] * x[l]
+                    y2 = y[l] * y[l]
+                    active = (x2 + y2 <= T2) & (n[l] < I)
+                    xy = x[l] * y[l]
+                    new_y = xy + xy + ci
+                    new_x = x2 - y2 + cr[l]
+                    x[l] = new_x if active else x[l]
+                    y[l] = new_y if active else y[l]
+                    n[l] += active
+        
+        # write the values of c that are done and refill their lanes
+        for l in range(lanes):
+            escaped = x[l] * x[l] + y[l] * y[l] > T2
+            if column[l] >= 0 and (escaped or n[l] >= I):
+                res_row[column[l]] = n[l] / I if escaped else 1
+                if next_column < rVals.shape[0]:
+                    cr[l] = rVals[next_column]
+                    x[l] = 0
+                    y[l] = 0
+                    n[l] = 0
+                    x_saved[l] = 0
+                    y_saved[l] = 0
+                    steps[l] = 0
+                    next_save[l] = 1
+                    column[l] = next_column
+                    next_column = _next_lane_column(rVals, ci, res_row, next_column + 1, interior)
+                else:
+                    n[l] = I
+                    column[l] = -1
+                    busy -= 1
+
+
+@njit(parallel=True, cache=True)
+def njit_par_lanes_tile(rVals, iVals, res, I = 100, T = 2, lanes = 8, chunk = 16, interior = False, 
+                        cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par_tile(), but iterates lanes values of c of a row in
+    lockstep, so that the inner loop can be compiled to SIMD instructions
+    (see the description at the top of this file). The iterations are done
+    in the floating point type of rVals and iVals, e.g. float32 to fit twice
+    as many lanes in a SIMD register (the result differs from float64 for 
+    values of c close to the boundary of the set).
+    
+    INPUT::
         
-    return z_res, res
\ No newline at end of file
+        lanes : int
+            Number of values of c that are iterated at the same time.
+            
+        chunk : int
+            Number of iterations between checking for (and replacing) the
+            values of c that are done.
+        
+        interior, cycle_tol :
+            See njit_par_tile(). Values of c in the main cardioid or the 
+            period-2 bulb are skipped before they are put in a lane, and the
+            cycle detection is done every iteration (like M_jit_sq()), so the
+            result stays identical to njit_par_tile().
+    
+    """
+    
+    # T^2 and cycle_tol^2 in the floating point type of the values of c
+    T2 = np.empty(2, dtype=rVals.dtype)
+    T2[0] = T * T
+    T2[1] = cycle_tol * cycle_tol
+    
+    # the interior check is only exact for T >= 2 (see mandelbrot_alg.py)
+    skip_interior = interior and T >= 2
+    
+    for i in prange(iVals.shape[0]):
+        _lanes_row(rVals, iVals[i], res[i], I, T2[0], lanes, chunk, skip_interior, T2[1])
+    
+    return res
+
+
+@njit(parallel=True, cache=True)
+def njit_par_scheduled_tile(rVals, iVals, res, order, offsets, I = 100, T = 2, interior = False, cycle_tol = 0.0):
+    
+    """
+    
+    Identical to njit_par_tile(), but the rows are divided over the threads 
+    by a schedule (see schedule_rows()): thread k computes the rows 
+    order[offsets[k]:offsets[k + 1]]. 
+    
+    OUTPUT::
+        
+        work : Numpy array of int64 of size (len(offsets) - 1,)
+            Number of iterations done by every thread (counting I iterations
+            for values of c in the set, also when they are detected by the
+            interior check or the cycle detection).
+    
+    """
+    
+    n_threads = offsets.shape[0] - 1
+    work = np.zeros(n_threads, dtype=np.int64)
+    
+    # one task per thread, so numba's static division of the prange gives 
+    # every thread exactly its own rows
+    for k in prange(n_threads):
+        for j in range(offsets[k], offsets[k + 1]):
+            i = order[j]
+            for r in range(rVals.shape[0]):
+                value = mb.M_jit_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+                res[i, r] = value
+                work[k] += round(value * I)
+    
+    return work
+
+
+def estimate_row_cost(rVals, iVals, I = 100, T = 2, step = 8):
+    
+    """
+    
+    Estimates the number of iterations needed for every row of the grid 
+    spanned by rVals and iVals from a coarse pre-pass that only computes 
+    every step-th row and column (1 / step^2 of the values of c). Every row
+    gets the cost of the nearest computed row.
+    
+    OUTPUT::
+        
+        cost : Numpy array of size (len(iVals),)
+            Estimated number of iterations of every row.
+    
+    """
+    
+    coarse_rows = np.arange(0, iVals.shape[0], step)
+    coarse = njit_par_tile(rVals[::step].copy(), iVals[coarse_rows], 
+                           np.zeros((coarse_rows.shape[0], rVals[::step].shape[0])), int(I), float(T), False, 0.0)
+    
+    # iterations of the coarse rows, scaled to the full number of columns
+    coarse_cost = coarse.sum(axis=1) * I * rVals.shape[0] / coarse.shape[1]
+    nearest = np.minimum((np.arange(iVals.shape[0]) + step // 2) // step, coarse_rows.shape[0] - 1)
+    
+    return coarse_cost[nearest]
+
+
+def schedule_rows(n_rows, n_threads, schedule = 'cyclic', cost = None):
+    
+    """
+    
+    Divides n_rows rows over n_threads threads (see the description at the
+    top of this file).
+    
+    INPUT::
+        
+        schedule : str
+            'static' (contiguous blocks of rows, like prange), 'cyclic' 
+            (row i is computed by thread i % n_threads) or 'lpt' (longest
+            processing time first: the rows are assigned from the most to 
+            the least expensive to the thread with the least work so far,
+            using cost).
+            
+        cost : Numpy array of size (n_rows,)
+            Estimated cost of every row, needed for 'lpt' (see 
+            estimate_row_cost()).
+    
+    OUTPUT::
+        
+        order : Numpy array of int64 of size (n_rows,)
+            The rows, grouped per thread.
+            
+        offsets : Numpy array of int64 of size (n_threads + 1,)
+            Thread k computes the rows order[offsets[k]:offsets[k + 1]].
+    
+    """
+    
+    rows = np.arange(n_rows, dtype=np.int64)
+    if schedule == 'static':
+        blocks = np.array_split(rows, n_threads)
+    elif schedule == 'cyclic':
+        blocks = [rows[k::n_threads] for k in range(n_threads)]
+    elif schedule == 'lpt':
+        if cost is None:
+            raise ValueError('The lpt schedule needs the cost of every row')
+        
+        # heap of (work so far, thread)
+        threads = [(0.0, k) for k in range(n_threads)]
+        assigned = [[] for _ in range(n_threads)]
+        for i in np.argsort(-np.asarray(cost), kind='stable'):
+            load, k = heapq.heappop(threads)
+            assigned[k].append(i)
+            heapq.heappush(threads, (load + cost[i], k))
+        blocks = [np.sort(np.array(rows, dtype=np.int64)) for rows in assigned]
+    else:
+        raise ValueError(f"Unknown schedule {schedule}, choose from ['static', 'cyclic', 'lpt']")
+    
+    offsets = np.zeros(n_threads + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(block) for block in blocks])
+    order = np.concatenate(blocks).astype(np.int64) if n_rows else rows
+    
+    return order, offsets
+
+
+def njit_par_balanced_tile(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0,
+                           schedule = 'cyclic', n_threads = None, step = 8):
+    
+    """
+    
+    Identical to njit_par_tile(), but with the rows divided over the threads
+    by schedule_rows() (for 'lpt', the cost of the rows is estimated with
+    estimate_row_cost() first).
+    
+    INPUT::
+        
+        n_threads : int
+            Number of threads to divide the rows over, by default the number
+            of threads numba uses. Giving a larger number shows how the work 
+            would be divided on a machine with more cores.
+    
+    OUTPUT::
+        
+        res : Numpy array of size (len(iVals), len(rVals))
+            The result.
+            
+        work : Numpy array of int64 of size (n_threads,)
+            Number of iterations done by every thread (see 
+            njit_par_scheduled_tile() and imbalance()).
+    
+    """
+    
+    if n_threads is None:
+        n_threads = load_numba().get_num_threads()
+    
+    cost = estimate_row_cost(rVals, iVals, I, T, step) if schedule == 'lpt' else None
+    order, offsets = schedule_rows(iVals.shape[0], n_threads, schedule, cost)
+    work = njit_par_scheduled_tile(rVals, iVals, res, order, offsets, int(I), float(T), bool(interior), 
+                                   float(cycle_tol))
+    
+    return res, work
+
+
+def imbalance(work):
+    
+    """
+    
+    Returns the ratio of the largest and the mean work of the threads (1 for 
+    perfectly balanced work, n_threads if one thread does all the work): the 
+    time the render takes compared to a perfectly balanced render, if the
+    time is proportional to the number of iterations.
+    
+    """
+    
+    work = np.asarray(work, dtype=np.float64)
+    return float(work.max() / work.mean()) if work.sum() > 0 else 1.0
+
+
+# the codes of the outputs of render() (see engines.py) for jit_nogil_tile()
+NOGIL_OUTPUTS = {'ratio' : 0, 'smooth' : 1, 'distance' : 2, 'count' : 3}
+
+
+@njit(nogil=True, cache=True)
+def jit_nogil_tile(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0, output = 0):
+    
+    """
+    
+    Identical to jit_func_tile() (or, depending on output, the tile functions
+    for the other outputs of render(), see NOGIL_OUTPUTS), but compiled with
+    nogil=True: numba releases the GIL while the function runs, so several 
+    Python threads can run it at the same time (see threaded.py). It is not
+    parallelised itself, so it does not use numba's threading layer either.
+    
+    """
+    
+    for i in range(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            if output == 0:
+                res[i, r] = mb.M_jit_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+            elif output == 1:
+                res[i, r] = mb.M_smooth_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+            elif output == 2:
+                res[i, r] = mb.M_distance_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+            else:
+                res[i, r] = mb.M_count_sq(rVals[r], iVals[i], I, T, interior, cycle_tol)
+    
+    return res
+
+
+# the parallel tile function computing every output of render() (see 
+# engines.py), by name as the functions are only created when numba is loaded
+PAR_TILE_FUNCTIONS = {'ratio' : 'njit_par_tile', 'smooth' : 'njit_par_smooth_tile',
+                      'distance' : 'njit_par_distance_tile', 'count' : 'njit_par_count_tile'}
+
+
+def naive_tile(rVals, iVals, res, I = 100, T = 2, interior = False):
+
+    """
+
+    Identical to naive(), but for a (possibly non-square) tile of the grid:
+    res has size (len(iVals), len(rVals)). Used by the 'naive' engine of
+    render() (see engines.py).
+
+    """
+
+    for i in range(iVals.shape[0]):
+        for r in range(rVals.shape[0]):
+            res[i, r] = mb.M(rVals[r] + iVals[i]*1j, I, T, check_interior = interior)
+
+    return res
+
+
+# Explicit signatures of the functions that are compiled by warm_up(). Arrays
+# passed as slices (the tiles in tiled.py and the interleaved rows of the
+# workers in multiprocessing_mandelbrot.py) are not always C-contiguous, so
+# both layouts are listed for those. The signatures are strings, so numba
+# does not have to be imported to define them.
+_options = 'int64, float64, boolean, float64'
+_layouts_1d = ['float64[::1]', 'float64[:]']
+_layouts_2d = ['float64[:, ::1]', 'float64[:, :]']
+# render(..., dtype = np.float32) lets the njit_par engine write float32
+# results (when 'auto' picks it, which it does when there are no timings)
+_render_layouts_2d = _layouts_2d + ['float32[:, ::1]']
+
+SIGNATURES = {
+    'jit_func' : [f'(int64, float64[::1], float64[::1], float64[:, ::1], {_options})'],
+    'njit_par' : [f'(int64, float64[::1], float64[::1], float64[:, ::1], {_options})'],
+    'jit_save_z' : [f'(int64, float64[::1], float64[::1], float64[:, ::1], complex128[:, ::1], {_options})'],
+    'njit_par_tile' : [f'(float64[::1], float64[::1], {res}, {_options})' for res in _render_layouts_2d],
+    'njit_par_smooth_tile' : [f'(float64[::1], float64[::1], {res}, {_options})' for res in _render_layouts_2d],
+    'njit_par_distance_tile' : [f'(float64[::1], float64[::1], {res}, {_options})' for res in _render_layouts_2d],
+    'njit_par_count_tile' : [f'(float64[::1], float64[::1], {counts.replace("float64", dtype)}, {_options})'
+                             for dtype in ['uint8', 'uint16', 'uint32'] for counts in _layouts_2d],
+    'jit_save_z_tile' : [f'(float64[::1], float64[::1], {res}, {z_res}, {_options})'
+                         for res, z_res in zip(_layouts_2d, ['complex128[:, ::1]', 'complex128[:, :]'])],
+    'njit_par_lanes_tile' : [f'({vals}, {vals}, {res}, int64, float64, int64, int64, boolean, float64)'
+                             for vals in ['float64[::1]', 'float32[::1]'] for res in _layouts_2d],
+    'njit_par_scheduled_tile' : [f'(float64[::1], float64[::1], {res}, int64[::1], int64[::1], {_options})'
+                                 for res in _layouts_2d],
+    'jit_nogil_tile' : [f'(float64[::1], float64[::1], {res}, {_options}, int64)'
+                        for res in ['float64[:, ::1]', 'uint8[:, ::1]', 'uint16[:, ::1]', 'uint32[:, ::1]']],
+    'jit_func_tile' : [f'(float64[::1], {iVals}, {res}, {_options})'
+                       for iVals, res in product(_layouts_1d, _layouts_2d)],
+}
+
+
+def warm_up(functions = None, background = False):
+
+    """
+
+    Compiles the numba-optimised functions for the signatures in SIGNATURES,
+    or loads them from the on-disk cache if they have been compiled before.
+
+    INPUT::
+
+        functions : list of str or None
+            Names of the functions to compile (keys of SIGNATURES). All
+            functions are compiled if None.
+
+        background : bool
+            If True, the functions are compiled in a (daemon) background
+            thread and the function returns right away. Calling one of the
+            functions before the thread has finished simply waits for its
+            compilation to finish.
+
+    OUTPUT::
+
+        thread : threading.Thread or None
+            The thread compiling the functions if background is True, None
+            otherwise.
+
+    """
+
+    names = list(SIGNATURES) if functions is None else list(functions)
+    for name in names:
+        if name not in SIGNATURES:
+            raise ValueError(f'No signatures known for {name}, choose from {list(SIGNATURES)}')
+
+    def compile_all():
+        load_numba()
+        for name in names:
+            for signature in SIGNATURES[name]:
+                globals()[name].compile(signature)
+
+    if not background:
+        compile_all()
+        return None
+
+    thread = threading.Thread(target=compile_all, name='mandelbrot-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+if os.environ.get('MANDELBROT_WARM_UP', '0') not in ('', '0'):
+    warm_up(background=True)
@@ -0,0 +1,510 @@
+"""
+
+This file contains a deep-zoom engine for the Mandelbrot set based on
+perturbation theory.
+
+The other methods compute every value of :math:`c` in float64, which has a
+precision of around :math:`10^{-16}` relative to the values themselves. When
+zooming in further than a width of around :math:`10^{-13}` of the view, the
+neighbouring values of :math:`c` become (almost) the same float64 value and
+the plots turn into blocks. Computing every value of :math:`c` in arbitrary
+precision works, but is thousands of times slower.
+
+Perturbation:
+
+Only one reference orbit :math:`Z_n` (for the centre :math:`C` of the view)
+is computed in arbitrary precision, using Python integers as fixed-point
+numbers (see reference_orbit()). For every other value :math:`c = C + \\delta c`
+in the view, only the difference :math:`\\delta_n = z_n - Z_n` with the
+reference orbit is iterated, in float64 and numba-optimised:
+
+    :math:`\\delta_{n+1} = 2 Z_n \\delta_n + \\delta_n^2 + \\delta c`.
+
+As :math:`\\delta c` and :math:`\\delta_n` are small numbers that are
+represented relative to their own size, float64 is precise enough for them,
+even if :math:`C` needs hundreds of digits. :math:`|z_n| = |Z_n + \\delta_n|`
+is compared to the threshold as usual.
+
+Glitches and rebasing:
+
+When :math:`z_n` gets close to 0 while :math:`\\delta_n` does not (i.e.
+:math:`|z_n| < |\\delta_n|`), the orbit of :math:`c` has moved away from the
+reference orbit and the float64 value of :math:`\\delta_n` no longer has
+enough precision relative to :math:`z_n`: this causes the well-known
+perturbation glitches (blobs of wrong, uniform values). This is detected
+every iteration (comparing the magnitudes in a way that does not underflow
+for the tiny values of :math:`\\delta_n` of deep zooms, see _perturb()), and
+the pixel is then rebased onto the start of the reference orbit:
+:math:`\\delta_n` is set to :math:`z_n` itself and the reference index to 0
+(:math:`Z_0 = 0`), after which the iteration continues.
+The same is done when the reference orbit ends because the reference escaped
+before the pixel did. This way a single reference orbit serves the whole view
+and no pixels have to be recomputed with a new reference.
+
+Series approximation:
+
+For deep zooms, all values of :math:`c` in the view follow the reference
+orbit closely for the first iterations, and :math:`\\delta_n` is then almost
+exactly a polynomial in :math:`\\delta c` (with complex, i.e. bivariate in the
+real and imaginary part, coefficients):
+
+    :math:`\\delta_n = A_{1,n} \\delta c + A_{2,n} \\delta c^2 + ... + A_{K,n} \\delta c^K`,
+
+    :math:`A_{1,n+1} = 2 Z_n A_{1,n} + 1`,
+    :math:`A_{k,n+1} = 2 Z_n A_{k,n} + \\sum_{j=1}^{k-1} A_{j,n} A_{k-j,n}`.
+
+The coefficients only depend on the reference orbit, so they are computed
+once for the whole view (see series_approximation()), after which every value
+of :math:`c` starts at iteration :math:`N` with :math:`\\delta_N` computed
+from the polynomial (see series_tile()). The series is only used up to the
+iteration where the truncation error may matter: the last term has to be
+negligible compared to the first, and the series has to agree with
+perturbation at the corners and the middles of the edges of the view
+(the values of :math:`c` furthest from the reference) within the tolerance.
+For deep zooms this skips most of the iterations of the values of :math:`c`
+that escape (run "python -m mandelbrot.benchmark --series").
+
+render_deep() takes the centre of the view as a string (or Fraction, Decimal
+or float), so that it can be given with as many digits as needed, and the
+width of the view, which can be as small as around :math:`10^{-300}` (the
+smallest float64 values). The 'perturbation' engine of render() (see
+engines.py) uses the same method for views given as float64 regions.
+
+"""
+
+import math
+from fractions import Fraction
+
+import numpy as np
+from mandelbrot.lazy_numba import njit, prange
+
+
+def _to_fixed(value, precision):
+
+    """
+
+    Internal function converting value (str, int, float, Fraction or Decimal)
+    to a fixed-point integer with precision fractional bits.
+
+    """
+
+    return round(Fraction(value) * (1 << precision))
+
+
+def _to_float(value, precision):
+
+    """
+
+    Internal function converting a fixed-point integer with precision
+    fractional bits to the nearest float64 (without overflowing for large
+    precisions).
+
+    """
+
+    shift = max(precision - 60, 0)
+    return math.ldexp(value >> shift, shift - precision)
+
+
+def precision_for(step):
+
+    """
+
+    Returns the number of fractional bits needed for the reference orbit when
+    the distance between neighbouring values of c is step: enough to resolve
+    step, plus 64 bits for the rounding errors that build up while iterating.
+
+    """
+
+    return max(64, math.ceil(-math.log2(step))) + 64
+
+
+def reference_orbit(cr, ci, I = 100, T = 2, precision = 128):
+
+    """
+
+    Computes the orbit :math:`Z_0 = 0, Z_1, ..., Z_n` of :math:`C` = cr +
+    i ci in arbitrary precision, using Python integers as fixed-point numbers
+    with precision fractional bits.
+
+    INPUT::
+
+        cr, ci : str, int, float, Fraction or Decimal
+            Real and imaginary part of C. Strings are converted exactly, e.g.
+            '-0.7436438870371587047521850286'.
+
+        I : int
+            Maximum number of iterations.
+
+        T : float
+            Threshold value.
+
+        precision : int
+            Number of fractional bits (see precision_for()).
+
+    OUTPUT::
+
+        Zr, Zi : Numpy arrays of size (n + 1,)
+            Real and imaginary parts of the orbit, rounded to float64. n is I
+            if C never crosses the threshold, otherwise the iteration at
+            which it does (Z_n is the first value outside the threshold).
+
+    """
+
+    CX = _to_fixed(cr, precision)
+    CY = _to_fixed(ci, precision)
+    T2 = _to_fixed(T * T, precision)
+
+    Zr = np.zeros(I + 1)
+    Zi = np.zeros(I + 1)
+
+    X = 0
+    Y = 0
+    for n in range(1, I + 1):
+        # z = z^2 + c in fixed point: products have 2 * precision bits
+        X, Y = ((X*X - Y*Y) >> precision) + CX, ((X*Y) >> (precision - 1)) + CY
+        Zr[n] = _to_float(X, precision)
+        Zi[n] = _to_float(Y, precision)
+        if (X*X + Y*Y) >> precision > T2:
+            return Zr[:n + 1], Zi[:n + 1]
+
+    return Zr, Zi
+
+
+@njit(cache=True)
+def _perturb(dcr, dci, dx, dy, n0, Zr, Zi, I, T2):
+
+    """
+
+    Internal function iterating the difference dx + i dy with the reference
+    orbit Zr + i Zi for the value c = C + dcr + i dci, starting at iteration
+    n0 (with dx + i dy the difference at iteration n0).
+
+    OUTPUT::
+
+        value : float
+            Ratio of iterations.
+
+        iterations : int
+            Number of iterations that were computed.
+
+        rebases : int
+            Number of times the value of c was rebased.
+
+    """
+
+    last = Zr.shape[0] - 1
+    m = n0
+    value = 1.0
+    iterations = 0
+    rebases = 0
+
+    for n in range(n0, I):
+        # delta = 2 Z delta + delta^2 + dc
+        zr = Zr[m]
+        zi = Zi[m]
+        dx, dy = 2*(zr*dx - zi*dy) + dx*dx - dy*dy + dcr, 2*(zr*dy + zi*dx) + 2*dx*dy + dci
+        m += 1
+        iterations += 1
+
+        # full value of z
+        x = Zr[m] + dx
+        y = Zi[m] + dy
+        z2 = x*x + y*y
+        if z2 > T2:
+            value = (n + 1) / I
+            break
+
+        # glitch (|z| < |delta|) or end of the reference orbit:
+        # continue from the start of the reference orbit. For deep zooms the
+        # squares underflow (below |delta| of around 1e-154), so for tiny
+        # values of |z| the magnitudes are compared with hypot()
+        if z2 < dx*dx + dy*dy or (z2 < 1e-300 and math.hypot(x, y) < math.hypot(dx, dy)) or m == last:
+            dx = x
+            dy = y
+            m = 0
+            rebases += 1
+
+    return value, iterations, rebases
+
+
+@njit(parallel=True, cache=True)
+def perturbation_tile(dr, di, Zr, Zi, res, I = 100, T = 2):
+
+    """
+
+    Computes the ratio of iterations (like njit_par_tile() in
+    optimisation_methods.py) for the values of c = C + dr[r] + i di[i], using
+    the reference orbit Zr + i Zi of C (see reference_orbit()). Pixels are
+    rebased onto the start of the reference orbit when a glitch is detected
+    or the reference orbit ends (see the description at the top of this
+    file).
+
+    INPUT::
+
+        dr : Numpy array of size (n,)
+            Real offsets of the values of c from C.
+
+        di : Numpy array of size (m,)
+            Imaginary offsets of the values of c from C.
+
+        Zr, Zi : Numpy arrays
+            Reference orbit of C, starting with Z_0 = 0.
+
+        res : Numpy array of size (m, n)
+            Matrix that will be filled with the results.
+
+    OUTPUT::
+
+        stats : Numpy array of int64 of size (m, 2)
+            Number of times the pixels of every row were rebased (column 0)
+            and number of iterations computed for every row (column 1).
+
+    """
+
+    T2 = T * T
+    stats = np.zeros((di.shape[0], 2), dtype=np.int64)
+
+    for i in prange(di.shape[0]):
+        for r in range(dr.shape[0]):
+            value, iterations, rebases = _perturb(dr[r], di[i], 0.0, 0.0, 0, Zr, Zi, I, T2)
+            res[i, r] = value
+            stats[i, 0] += rebases
+            stats[i, 1] += iterations
+
+    return stats
+
+
+@njit(cache=True)
+def series_approximation(Zr, Zi, radius, probes_r, probes_i, terms = 8, tol = 1e-10, T = 2):
+
+    """
+
+    Computes the series approximation of the differences with the reference
+    orbit Zr + i Zi for all values of c = C + dc with |dc| <= radius, and the
+    number of iterations it can skip (see the description at the top of this
+    file).
+
+    The coefficients are scaled by powers of radius, i.e. after skip
+    iterations delta = sum(coefficients[k] * (dc / radius)^(k + 1)), so that
+    they neither overflow nor underflow for deep zooms.
+
+    INPUT::
+
+        Zr, Zi : Numpy arrays
+            Reference orbit of C, starting with Z_0 = 0.
+
+        radius : float
+            Largest value of |dc| in the view.
+
+        probes_r, probes_i : Numpy arrays of size (p,)
+            Offsets dc of the values of c at which the series is checked
+            against perturbation, normally the corners and the middles of the
+            edges of the view.
+
+        terms : int
+            Number of terms of the series.
+
+        tol : float
+            Largest allowed relative error of the series at the probes, and
+            of the last term relative to the first.
+
+        T : float
+            Threshold value.
+
+    OUTPUT::
+
+        skip : int
+            Number of iterations that can be skipped.
+
+        coefficients : Numpy array of complex128 of size (terms,)
+            Scaled coefficients of the series at iteration skip.
+
+    """
+
+    last = Zr.shape[0] - 1
+    p = probes_r.shape[0]
+
+    coefficients = np.zeros(terms, dtype=np.complex128)
+    new = np.zeros(terms, dtype=np.complex128)
+    dc = np.empty(p, dtype=np.complex128)
+    delta = np.zeros(p, dtype=np.complex128)
+    for j in range(p):
+        dc[j] = complex(probes_r[j], probes_i[j])
+
+    skip = 0
+    for n in range(last - 1):
+        Z2 = 2 * complex(Zr[n], Zi[n])
+
+        # A_1 = 2 Z A_1 + dc, A_k = 2 Z A_k + sum(A_j A_(k - j))
+        new[0] = Z2 * coefficients[0] + radius
+        for k in range(1, terms):
+            s = 0j
+            for j in range(k):
+                s += coefficients[j] * coefficients[k - 1 - j]
+            new[k] = Z2 * coefficients[k] + s
+
+        # truncation error: the last term has to be negligible
+        if abs(new[terms - 1]) > tol * abs(new[0]):
+            break
+
+        # the probes themselves, with perturbation
+        valid = True
+        Z = complex(Zr[n + 1], Zi[n + 1])
+        for j in range(p):
+            delta[j] = Z2 * delta[j] + delta[j] * delta[j] + dc[j]
+            z = Z + delta[j]
+
+            # the series is not used past a glitch or escape at the probes
+            if abs(z) < abs(delta[j]) or abs(z) > T:
+                valid = False
+                break
+
+            u = dc[j] / radius
+            approx = 0j
+            for k in range(terms - 1, -1, -1):
+                approx = (approx + new[k]) * u
+            if abs(approx - delta[j]) > tol * abs(delta[j]):
+                valid = False
+                break
+
+        if not valid:
+            break
+
+        coefficients[:] = new
+        skip = n + 1
+
+    return skip, coefficients
+
+
+@njit(parallel=True, cache=True)
+def series_tile(dr, di, Zr, Zi, radius, coefficients, skip, res, I = 100, T = 2):
+
+    """
+
+    Same as perturbation_tile(), but starting every value of c at iteration
+    skip, with the difference computed from the (scaled) coefficients of
+    series_approximation().
+
+    """
+
+    T2 = T * T
+    terms = coefficients.shape[0]
+    stats = np.zeros((di.shape[0], 2), dtype=np.int64)
+
+    for i in prange(di.shape[0]):
+        for r in range(dr.shape[0]):
+            u = complex(dr[r], di[i]) / radius
+            delta = 0j
+            for k in range(terms - 1, -1, -1):
+                delta = (delta + coefficients[k]) * u
+
+            value, iterations, rebases = _perturb(dr[r], di[i], delta.real, delta.imag, skip, Zr, Zi, I, T2)
+            res[i, r] = value
+            stats[i, 0] += rebases
+            stats[i, 1] += iterations
+
+    return stats
+
+
+def render_deep(center_r, center_i, scale, width = 1000, height = 1000, max_iter = 1000, threshold = 2,
+                terms = 8, tol = 1e-10, return_rebases = False, return_stats = False):
+
+    """
+
+    Computes a (deep) zoom of the Mandelbrot set using perturbation and
+    series approximation.
+
+    INPUT::
+
+        center_r, center_i : str, int, float, Fraction or Decimal
+            Real and imaginary part of the centre of the view. Use strings to
+            give more digits than a float64 has.
+
+        scale : float
+            Width of the view along the real axis. The values of c are
+            spaced scale / (width - 1) apart in both directions.
+
+        width, height : int
+            Number of values of c along the real and imaginary axis.
+
+        max_iter : int
+            Maximum number of iterations.
+
+        threshold : float
+            Threshold value.
+
+        terms : int
+            Number of terms of the series approximation (see
+            series_approximation()). 0 disables skipping iterations.
+
+        tol : float
+            Tolerance of the series approximation.
+
+        return_rebases : bool
+            Also return the total number of rebases (see perturbation_tile()).
+
+        return_stats : bool
+            Also return a dictionary with the number of iterations skipped by
+            the series approximation ('skip'), the number of iterations
+            computed for all values of c together ('iterations') and the
+            number of rebases ('rebases').
+
+    OUTPUT::
+
+        res : Numpy array of size (height, width)
+            Matrix containing the ratio of iterations, like render(), with the
+            rows from the lowest to the highest imaginary value.
+
+    """
+
+    step = scale / max(width - 1, 1)
+    dr = (np.arange(width) - (width - 1) / 2) * step
+    di = (np.arange(height) - (height - 1) / 2) * step
+    max_iter = int(max_iter)
+    threshold = float(threshold)
+
+    Zr, Zi = reference_orbit(center_r, center_i, max_iter, threshold, precision_for(step))
+
+    res = np.zeros((height, width))
+    skip = 0
+    if terms > 0:
+        # check the series at the corners and the middles of the edges
+        probes_r = np.array([dr[0], dr[-1], dr[0], dr[-1], dr[0], dr[-1], 0.0, 0.0])
+        probes_i = np.array([di[0], di[0], di[-1], di[-1], 0.0, 0.0, di[0], di[-1]])
+        radius = max(math.hypot(dr[0], di[0]), 1e-300)
+        skip, coefficients = series_approximation(Zr, Zi, radius, probes_r, probes_i, int(terms), float(tol),
+                                                  threshold)
+
+    if skip > 0:
+        stats = series_tile(dr, di, Zr, Zi, radius, coefficients, skip, res, max_iter, threshold)
+    else:
+        stats = perturbation_tile(dr, di, Zr, Zi, res, max_iter, threshold)
+
+    rebases = int(stats[:, 0].sum())
+    if return_stats:
+        return res, {'skip' : int(skip), 'iterations' : int(stats[:, 1].sum()), 'rebases' : rebases}
+    if return_rebases:
+        return res, rebases
+    return res
+
+
+def perturbation_engine(rVals, iVals, res, I, T):
+
+    """
+
+    The 'perturbation' engine of render() (see engines.py): computes the view
+    spanned by rVals and iVals using the value of c in the middle of the view
+    as the reference.
+
+    """
+
+    center_r = rVals[(rVals.shape[0] - 1) // 2]
+    center_i = iVals[(iVals.shape[0] - 1) // 2]
+
+    step = max(abs(rVals[-1] - rVals[0]) / max(rVals.shape[0] - 1, 1),
+               abs(iVals[-1] - iVals[0]) / max(iVals.shape[0] - 1, 1), 1e-300)
+    Zr, Zi = reference_orbit(float(center_r), float(center_i), I, T, precision_for(step))
+
+    perturbation_tile(rVals - center_r, iVals - center_i, Zr, Zi, res, I, T)
+
+    return res
@@ -8,14 +8,28 @@ This function allows the number of iterations as well as the threshold to be
 changed from this script.
 
 The data is generated using the jit_save_z() function as this turned out to 
-be the fastest.
+be the fastest. For large values of detail, res and z_res do not fit in 
+memory anymore (2.4 GB at a detail of 10000). Setting tiled to True renders 
+the data in tiles to memory-mapped files in plot_z_values_output/ instead
+(see tiled.py). An interrupted tiled render is resumed when the script is run
+again.
+
+Setting shading to 'smooth' or 'distance' plots the continuous iteration
+count or the distance estimate (see mandelbrot_alg.py) instead of :math:`|z|`.
+These are computed while iterating, so neither z_res nor res is needed: a
+single float matrix takes a third of the memory (or disk space) of res and
+z_res together, and the plot does not need another pass over the whole array
+to compute abs(z_res).
 
 """
 
 
 import numpy as np
 import matplotlib.pyplot as plt
-from mandelbrot.optimisation_methods import jit_save_z
+from mandelbrot.optimisation_methods import jit_save_z, PAR_TILE_FUNCTIONS
+import mandelbrot.optimisation_methods as OM
+from mandelbrot.tiled import render_tiled
+import sys
 import time
 
 # set detail
@@ -27,33 +41,73 @@ I = 100
 # set threshold
 T = 2
 
+# render in tiles to memory-mapped files rather than in memory
+tiled = False
+
+# None plots |z|, 'smooth' the continuous iteration count and 'distance' the
+# distance estimate
+shading = None
+
 # initialise real and imaginary values to iterate over
 rVals = np.linspace(-2.0, 1.0, detail)
 iVals = np.linspace(-1.5, 1.5, detail)
 
-# initialise empty matrices for the mandelbrot result as well as the values for z
-res = np.zeros ((detail, detail))
-z_res = np.zeros ((detail, detail)).astype('complex128')
-
-
-# generate data
-print(f'Computing optimisation_methods.jit_save_z with {detail:d} x {detail:d} values for c...')
-tic = time.time()
-z_res, res = jit_save_z(detail, rVals, iVals, res, z_res, I, T)
-toc = time.time() - tic
-print(f'jit_save_z computed in {toc:3.3} seconds!')
-
-# plot z values in huge figure (for more detail :) )
+if tiled:
+    # generate data tile by tile
+    print(f'Computing tiled.render_tiled with {detail:d} x {detail:d} values for c...')
+    tic = time.time()
+    if shading is None:
+        res, z_res = render_tiled(rVals, iVals, 'plot_z_values_output/plot_z', I, T, save_z = True, verbose = True)
+    else:
+        shade, _ = render_tiled(rVals, iVals, 'plot_z_values_output/plot_' + shading, I, T, 
+                                verbose = True, output = shading)
+    toc = time.time() - tic
+    print(f'render_tiled computed in {toc:3.3} seconds!')
+
+elif shading is not None:
+    # generate the shading directly, without z
+    shade = np.zeros ((detail, detail))
+    function_name = PAR_TILE_FUNCTIONS[shading]
+    print(f'Computing optimisation_methods.{function_name} with {detail:d} x {detail:d} values for c...')
+    tic = time.time()
+    getattr(OM, function_name)(rVals, iVals, shade, I, float(T), False, 0.0)
+    toc = time.time() - tic
+    print(f'{function_name} computed in {toc:3.3} seconds!')
+    
+else:
+    # initialise empty matrices for the mandelbrot result as well as the values for z
+    res = np.zeros ((detail, detail))
+    z_res = np.zeros ((detail, detail)).astype('complex128')
+    
+    
+    # generate data
+    print(f'Computing optimisation_methods.jit_save_z with {detail:d} x {detail:d} values for c...')
+    tic = time.time()
+    z_res, res = jit_save_z(detail, rVals, iVals, res, z_res, I, T)
+    toc = time.time() - tic
+    print(f'jit_save_z computed in {toc:3.3} seconds!')
+
+# plot z values (or the shading) in huge figure (for more detail :) )
 fig = plt.figure(figsize=(100, 100))
 print('Plotting result...')
-plt.imshow (abs(z_res), cmap='hot')
+if shading is None:
+    plt.imshow (abs(z_res), cmap='hot')
+elif shading == 'distance':
+    # the distance varies over orders of magnitude
+    plt.imshow (np.log(shade + 1e-12), cmap='hot')
+else:
+    plt.imshow (shade, cmap='hot')
 plt.axis('off')
 print('Result plotted!')
 
 print('Showing image...')
 plt.show()
 print('Image shown')
-fig.savefig('plot_z_values_output/plot_z.pdf')
+fig.savefig('plot_z_values_output/plot_' + ('z' if shading is None else shading) + '.pdf')
+
+if shading is not None:
+    # there is no result matrix to check
+    sys.exit()
 
 # check whether the Mandelbrot set still looks like it should
 fig = plt.figure(figsize=(10, 10))
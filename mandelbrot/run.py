@@ -1,35 +1,38 @@
 """
 
 This script runs the methods in optimisation_methods.py that generate the
-Mandelbrot sets using different optimisation techniques. The script plots and
+Mandelbrot sets using different optimisation techniques, through the engines
+of mandelbrot.render() (see engines.py). The script plots and
 saves the results of the sets generated by each individual method. As the 
 underlying algorithm is the same (just different optimisations) the plots
 should be identical.
 
 """
 
-import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 import time
+import numpy as np
+import mandelbrot
 import mandelbrot.optimisation_methods as OM
+from mandelbrot.engines import ENGINES
 
 
 # specify the detail of the simulation
 detail = 1000;
-rVals = np.linspace(-2.0, 1.0, detail)
-iVals = np.linspace(-1.5, 1.5, detail)
     
 
-# iniaialise a list with the names of the different methods in 
-# optimisation_methods.py
+# the methods in optimisation_methods.py and numpy_methods.py that this
+# script has always run. naive and vectorised are flagged as slow engines,
+# but are run anyway; gu_jit_vectorised() only works for square grids, so it
+# is not an engine and is called directly
+methods = ['naive', 'jit', 'njit_par', 'vectorised', 'jit_vectorised', 'gu_jit_vectorised', 'numpy']
+
+# the engines of render() (see engines.py) to run: the methods above and the
+# other engines that are not flagged as slow (like 'auto', which leaves out
+# e.g. the perturbation engine)
 
-methods = ['OM.naive(detail, rVals, iVals, res)',
-           'OM.jit_func(detail, rVals, iVals, res)',
-           'OM.njit_par(detail, rVals, iVals, res)',
-           'OM.vectorised(detail, rVals, iVals, res)',
-           'OM.jit_vectorised(detail, rVals, iVals, res)',
-           'OM.gu_jit_vectorised(detail, rVals, iVals, res)']
+engines = [name for name in mandelbrot.available_engines() if name in methods or not ENGINES[name].slow]
+if 'jit_vectorised' in engines:
+    engines.insert(engines.index('jit_vectorised') + 1, 'gu_jit_vectorised')
 
 
 # plot the results?
@@ -38,21 +41,25 @@ plotting = True
 # save the results to pdf?
 saving = False
 
-# run all methods
-for m in methods:
-    
-    # retrieve name of the function from methods
-    function_name = m.replace('OM.', '').replace('(detail, rVals, iVals, res)','')
-    print('Computing optimisation_methods.' + function_name + f' with {detail:d} x {detail:d} values for c...')
+# matplotlib is only imported when the results are plotted
+if plotting:
+    import matplotlib.pyplot as plt
+
+# run all engines
+for engine in engines:
     
-    # reset the result matrix
-    res = np.zeros ((detail, detail))
+    print('Computing the Mandelbrot set with engine ' + engine + f' with {detail:d} x {detail:d} values for c...')
     
-    # time and evaluate the method
+    # time and evaluate the engine
     tic = time.time()
-    res = eval(m)
+    if engine == 'gu_jit_vectorised':
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        res = OM.gu_jit_vectorised(detail, rVals, iVals, np.zeros((detail, detail)))
+    else:
+        res = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), detail, detail, engine = engine)
     toc = time.time() - tic
-    print(function_name + f'computed in {toc:3.3} seconds!')
+    print(engine + f' computed in {toc:3.3} seconds!')
 
     # plot and save the results
     if plotting:
@@ -61,7 +68,7 @@ for m in methods:
         ax = plt.imshow (res, cmap='hot', extent=[-2.0, 1.0, -1.5, 1.5])
         plt.xlabel('$\\mathfrak{R}(c)$')
         plt.ylabel('$\\mathfrak{I}(c)$')
-        plt.title('Mandelbrot set generated using '+function_name+'()')
+        plt.title('Mandelbrot set generated using the '+engine+' engine')
   
         print('Result plotted!')
                 
@@ -69,4 +76,4 @@ for m in methods:
         plt.show()
         print('Image shown')
         if saving:
-            fig.savefig('run_output/' + function_name + '_output.pdf')
+            fig.savefig('run_output/' + engine + '_output.pdf')
@@ -0,0 +1,463 @@
+"""
+
+This file contains an HTTP server (using asyncio) that serves tiles of the
+Mandelbrot set in the XYZ ("slippy map") layout used by web map viewers such
+as Leaflet or OpenLayers:
+
+    GET /{z}/{x}/{y}.png    tile as a PNG image (colour map 'hot', like the
+                            plots of the other scripts)
+    GET /{z}/{x}/{y}.npy    tile as a .npy file of float64 ratios of
+                            iterations (rows from top to bottom, like the
+                            image)
+    GET /stats              counters of the server and its tile cache (JSON)
+
+The number of iterations can be given per request, e.g. /3/2/5.png?max_iter=500
+(max_iter defaults to the one of the server and is limited to MAX_ITER).
+
+Tiles:
+
+Zoom level 0 is a single tile of TILE_SIZE x TILE_SIZE values of :math:`c`
+covering :math:`-2 \\le \\Re(c) < 2` and :math:`-2 < \\Im(c) \\le 2`, and
+every zoom level divides the tiles of the previous level into 2 x 2 tiles,
+with x from left to right and y from top to bottom (0 <= x, y < 2^z). The
+tiles are computed and cached with TileCache (see tile_cache.py), whose
+lattice of values of :math:`c` at zoom level z is the same as the one of the
+XYZ tiles, so neighbouring and repeated tiles never compute a value of
+:math:`c` twice.
+
+Concurrency:
+
+- The event loop only parses requests and sends responses. The tiles are
+  computed (and the PNG images encoded) in an executor: a pool of threads
+  (the default, using the 'threads' engine of render(), see threaded.py, so
+  the threads do not hold the GIL while computing) or a pool of spawned
+  processes (executor = 'process', every process has its own tile cache).
+
+- Requests for a tile that is already being computed (e.g. the same tile
+  requested by many clients at once) do not start a new computation, but
+  wait for the one that is running (request coalescing).
+
+- At most max_pending different tiles are computed or waiting for the
+  executor at the same time. Requests for other tiles get a 503 Service
+  Unavailable response with a Retry-After header right away, instead of
+  piling up in the queue until every client times out (back-pressure).
+
+Run the server with
+
+    python -m mandelbrot.server --port 8000
+
+and open e.g. http://localhost:8000/0/0/0.png, or point a map viewer at
+http://localhost:8000/{z}/{x}/{y}.png. load_test.py measures the latency of
+the tiles under load.
+
+"""
+
+import io
+import sys
+import json
+import zlib
+import struct
+import asyncio
+import argparse
+import multiprocessing as mp
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+
+# number of values of c along the side of a tile, width of zoom level 0 and
+# the deepest zoom level (beyond which float64 cannot tell the values of c
+# apart anymore)
+TILE_SIZE = 256
+BASE_SCALE = 4.0
+MAX_ZOOM = 40
+
+# the largest number of iterations a request can ask for
+MAX_ITER = 100000
+
+# the tile cache of this process (see _tile_data())
+_cache = None
+
+
+def _tile_data(z, x, y, I = 100, T = 2, cache_bytes = 256 * 2**20, engine = 'threads'):
+
+    """
+
+    Internal function computing (or getting from the cache) the XYZ tile
+    (z, x, y), with the rows from top to bottom. Runs in the executor of the
+    server, so it creates the tile cache of the process the first time.
+
+    """
+
+    global _cache
+
+    if _cache is None:
+        from mandelbrot.tile_cache import TileCache
+        _cache = TileCache(cache_bytes, tile_size=TILE_SIZE, base_scale=BASE_SCALE, engine=engine)
+
+    # lattice indices (see tile_cache.py) of the lower left value of c of
+    # the tile: zoom level 0 is centred on c = 0
+    half = TILE_SIZE // 2 * 2**z
+    x0 = x * TILE_SIZE - half
+    y0 = half - (y + 1) * TILE_SIZE
+
+    res = _cache.render(z, x0, y0, TILE_SIZE, TILE_SIZE, I, T)
+    return np.ascontiguousarray(res[::-1])
+
+
+def tile_region(z, x, y):
+
+    """
+
+    Returns the region (see render() in engines.py) of the values of c of
+    the XYZ tile (z, x, y), with the imaginary values from the bottom row to
+    the top row.
+
+    """
+
+    p = BASE_SCALE / (TILE_SIZE * 2**z)
+    half = TILE_SIZE // 2 * 2**z
+    x0 = x * TILE_SIZE - half
+    y0 = half - (y + 1) * TILE_SIZE
+    return (x0 * p, (x0 + TILE_SIZE - 1) * p, y0 * p, (y0 + TILE_SIZE - 1) * p)
+
+
+def colour_map(res):
+
+    """
+
+    Converts a matrix of ratios of iterations (between 0 and 1) to an RGB
+    image of uint8 using the 'hot' colour map of matplotlib (black, red,
+    yellow, white), without importing matplotlib.
+
+    """
+
+    v = np.clip(res, 0, 1)
+    rgb = np.stack([np.clip(v * 3, 0, 1), np.clip(v * 3 - 1, 0, 1), np.clip(v * 3 - 2, 0, 1)], axis=-1)
+    return (rgb * 255 + 0.5).astype(np.uint8)
+
+
+def encode_png(rgb):
+
+    """
+
+    Encodes an RGB image (Numpy array of uint8 of size (height, width, 3))
+    as a PNG file, using only zlib and struct.
+
+    """
+
+    height, width, _ = rgb.shape
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    # every row starts with filter type 0 (none)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            chunk(b'IEND', b''))
+
+
+def _tile_response(z, x, y, I, T, kind, cache_bytes, engine):
+
+    """
+
+    Internal function computing the body of the response for a tile in the
+    executor: the PNG image or the .npy file.
+
+    """
+
+    res = _tile_data(z, x, y, I, T, cache_bytes, engine)
+    if kind == 'png':
+        return encode_png(colour_map(res))
+
+    f = io.BytesIO()
+    np.save(f, res)
+    return f.getvalue()
+
+
+class TileServer:
+
+    """
+
+    Asyncio HTTP server for XYZ tiles of the Mandelbrot set (see the
+    description at the top of this file).
+
+    INPUT::
+
+        host, port : str, int
+            Address to listen on. Port 0 picks a free port (see port after
+            start()).
+
+        max_iter, threshold : int, float
+            Default number of iterations and threshold of the tiles.
+
+        executor : str or concurrent.futures.Executor
+            'thread', 'process' or an executor to compute the tiles with.
+
+        workers : int
+            Number of threads or processes of the executor (the number of
+            cores by default).
+
+        max_pending : int
+            Maximum number of different tiles that are computed or waiting to
+            be computed at the same time (see the description at the top of
+            this file).
+
+        cache_bytes : int
+            Size of the tile cache (per process).
+
+        engine : str
+            Engine of render() used to compute the tiles.
+
+    """
+
+    def __init__(self, host = 'localhost', port = 8000, max_iter = 100, threshold = 2, executor = 'thread',
+                 workers = None, max_pending = 64, cache_bytes = 256 * 2**20, engine = None):
+        self.host = host
+        self.port = port
+        self.max_iter = int(max_iter)
+        self.threshold = float(threshold)
+        self.max_pending = int(max_pending)
+        self.cache_bytes = int(cache_bytes)
+
+        if isinstance(executor, Executor):
+            self.executor = executor
+            self._own_executor = False
+        elif executor == 'thread':
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix='tile')
+            self._own_executor = True
+        elif executor == 'process':
+            # spawned, like in multiprocessing_mandelbrot.py
+            self.executor = ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'))
+            self._own_executor = True
+        else:
+            raise ValueError(f"Unknown executor {executor}, choose from ['thread', 'process'] or give an Executor")
+
+        # the threads of a thread executor release the GIL while computing;
+        # every process of a process executor can use njit_par
+        if engine is None:
+            engine = 'threads' if not isinstance(self.executor, ProcessPoolExecutor) else 'njit_par'
+        self.engine = engine
+
+        self._inflight = {}
+        self._writers = set()
+        self._server = None
+        self.counters = {'requests' : 0, 'tiles' : 0, 'computed' : 0, 'coalesced' : 0, 'rejected' : 0,
+                         'errors' : 0}
+
+    async def start(self):
+
+        """
+
+        Starts listening. The port is updated when it was 0.
+
+        """
+
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+
+        """
+
+        Stops listening, closes the open connections and shuts down the
+        executor (if the server created it).
+
+        """
+
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        if self._own_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def get_tile(self, z, x, y, I, kind):
+
+        """
+
+        Returns the body of tile (z, x, y) of kind 'png' or 'npy', computing
+        it in the executor, waiting for the computation of the same tile that
+        is already running, or returns None if there are too many tiles being
+        computed already.
+
+        """
+
+        key = (z, x, y, I, kind)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+        else:
+            if len(self._inflight) >= self.max_pending:
+                self.counters['rejected'] += 1
+                return None
+
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, _tile_response, z, x, y, I, self.threshold, kind,
+                                          self.cache_bytes, self.engine)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.counters['computed'] += 1
+
+        # shield: a client that goes away does not cancel the computation for
+        # the other clients waiting for it
+        return await asyncio.shield(future)
+
+    def _route(self, target):
+
+        """
+
+        Internal function parsing the target of a request. Returns (status,
+        content type, body) for requests that can be answered right away,
+        or ('tile', (z, x, y, I, kind)).
+
+        """
+
+        url = urlsplit(target)
+        if url.path == '/stats':
+            stats = dict(self.counters, inflight=len(self._inflight))
+            if _cache is not None:
+                stats['cache'] = _cache.stats()
+            return 200, 'application/json', json.dumps(stats).encode()
+
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 3 or '.' not in parts[2]:
+            return 404, 'text/plain', b'not found\n'
+        y, kind = parts[2].rsplit('.', 1)
+        if kind not in ('png', 'npy'):
+            return 404, 'text/plain', b'not found\n'
+
+        try:
+            z, x, y = int(parts[0]), int(parts[1]), int(y)
+            I = int(parse_qs(url.query).get('max_iter', [self.max_iter])[0])
+        except ValueError:
+            return 400, 'text/plain', b'z, x, y and max_iter must be integers\n'
+
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2**z or not 0 <= y < 2**z:
+            return 404, 'text/plain', b'no such tile\n'
+        if not 1 <= I <= MAX_ITER:
+            return 400, 'text/plain', f'max_iter must be between 1 and {MAX_ITER}\n'.encode()
+
+        return 'tile', (z, x, y, I, kind)
+
+    async def _handle(self, reader, writer):
+
+        """
+
+        Internal function handling one connection (HTTP/1.1 with keep-alive,
+        GET and HEAD only).
+
+        """
+
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, 'text/plain', b'bad request\n', False)
+                    break
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                self.counters['requests'] += 1
+
+                extra = {}
+                if method not in ('GET', 'HEAD'):
+                    status, content_type, body = 405, 'text/plain', b'method not allowed\n'
+                else:
+                    route = self._route(target)
+                    if route[0] == 'tile':
+                        self.counters['tiles'] += 1
+                        try:
+                            body = await self.get_tile(*route[1])
+                        except Exception as error:
+                            self.counters['errors'] += 1
+                            body = f'{type(error).__name__}: {error}\n'.encode()
+                            status, content_type = 500, 'text/plain'
+                        else:
+                            if body is None:
+                                status, content_type, body = 503, 'text/plain', b'too many tiles in progress\n'
+                                extra['Retry-After'] = '1'
+                            else:
+                                status = 200
+                                content_type = 'image/png' if route[1][4] == 'png' else 'application/octet-stream'
+                                extra['Cache-Control'] = 'public, max-age=86400'
+                    else:
+                        status, content_type, body = route
+
+                await self._respond(writer, status, content_type, body if method == 'GET' else b'',
+                                    keep_alive, extra, len(body))
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # the server is closing
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, body, keep_alive, extra = None, length = None):
+        reasons = {200 : 'OK', 400 : 'Bad Request', 404 : 'Not Found', 405 : 'Method Not Allowed',
+                   500 : 'Internal Server Error', 503 : 'Service Unavailable'}
+        headers = [f'HTTP/1.1 {status} {reasons[status]}',
+                   f'Content-Type: {content_type}',
+                   f'Content-Length: {len(body) if length is None else length}',
+                   f'Connection: {"keep-alive" if keep_alive else "close"}']
+        headers += [f'{name}: {value}' for name, value in (extra or {}).items()]
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+async def _main(args):
+    server = TileServer(args.host, args.port, args.max_iter, executor=args.executor, workers=args.workers,
+                        max_pending=args.max_pending)
+    await server.start()
+    print(f'serving tiles on http://{args.host}:{server.port}/{{z}}/{{x}}/{{y}}.png')
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='HTTP server for XYZ tiles of the Mandelbrot set')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-iter', type=int, default=100, help='default number of iterations')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int, default=None, help='threads or processes computing tiles')
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='maximum number of tiles in progress before answering 503')
+
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        sys.exit()
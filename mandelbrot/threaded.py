@@ -0,0 +1,128 @@
+"""
+
+This file renders views of the Mandelbrot set with a pool of Python threads
+in one process, for programs that serve several (small) renders at the same
+time, such as web workers.
+
+multiprocessing_mandelbrot.py divides the work over processes: every process
+has to be spawned, load numba and the compiled functions, and the tasks and
+values of :math:`c` have to be sent to it. That pays off for large views, but
+not for many small ones. njit_par (numba's parallel=True) runs in one process,
+but uses numba's threading layer, which can only run one parallel region at a
+time with the default workqueue layer, so concurrent calls from different
+threads of a server either wait for each other or fail.
+
+render_threaded() uses a concurrent.futures.ThreadPoolExecutor instead. The
+rows of the view are divided into bands, and every band is computed by
+jit_nogil_tile() (see optimisation_methods.py), which is compiled with
+nogil=True: numba releases the GIL while it runs, so the bands really run at
+the same time on different cores. All renders share one pool of threads
+(get_executor()), so any number of threads can call render_threaded() (or
+render(..., engine = 'threads'), see engines.py) at the same time, and their
+bands are interleaved in the queue of the pool. A render called from one of
+the threads of the pool itself is computed in that thread, so that it does
+not wait for threads that are waiting for it.
+
+Run "python -m mandelbrot.benchmark --threads" to compare the number of
+concurrent renders per second to the other engines.
+
+"""
+
+import os
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import mandelbrot.optimisation_methods as OM
+
+
+# the shared pool of threads, created by get_executor()
+_executor = None
+_executor_lock = threading.Lock()
+
+# set in the threads of the pool
+_local = threading.local()
+
+
+def _init_thread():
+    _local.in_pool = True
+
+
+def get_executor(max_workers = None):
+
+    """
+
+    Returns the ThreadPoolExecutor shared by all renders, creating it the
+    first time with max_workers threads (the number of cores by default).
+
+    """
+
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers or os.cpu_count() or 1, thread_name_prefix='mandelbrot',
+                                           initializer=_init_thread)
+        return _executor
+
+
+def render_threaded(rVals, iVals, res, I = 100, T = 2, interior = False, cycle_tol = 0.0, output = 'ratio',
+                    band = None, executor = None):
+
+    """
+
+    Computes the grid spanned by rVals and iVals with jit_nogil_tile(), in
+    bands of rows computed by a pool of threads (see the description at the
+    top of this file).
+
+    INPUT::
+
+        rVals, iVals, res, I, T, interior, cycle_tol :
+            See njit_par_tile() in optimisation_methods.py.
+
+        output : str
+            'ratio', 'smooth', 'distance' or 'count' (see render()), res has
+            to be a matrix of unsigned integers for 'count'.
+
+        band : int
+            Number of rows per task, by default chosen so that there are
+            around 4 tasks per core.
+
+        executor : concurrent.futures.Executor
+            Pool of threads to use, get_executor() by default.
+
+    OUTPUT::
+
+        res : Numpy array of size (len(iVals), len(rVals))
+            The result.
+
+    """
+
+    if output not in OM.NOGIL_OUTPUTS:
+        raise ValueError(f'Unknown output {output}, choose from {list(OM.NOGIL_OUTPUTS)}')
+
+    rVals = np.ascontiguousarray(rVals, dtype=np.float64)
+    iVals = np.ascontiguousarray(iVals, dtype=np.float64)
+    args = (int(I), float(T), bool(interior), float(cycle_tol), OM.NOGIL_OUTPUTS[output])
+
+    # already in a thread of the pool: compute it right here
+    if getattr(_local, 'in_pool', False):
+        return OM.jit_nogil_tile(rVals, iVals, res, *args)
+
+    executor = get_executor() if executor is None else executor
+    n_rows = iVals.shape[0]
+    if band is None:
+        band = max(1, math.ceil(n_rows / (4 * (os.cpu_count() or 1))))
+
+    # the bands are contiguous rows, so every task writes into a C-contiguous
+    # part of res
+    futures = [executor.submit(OM.jit_nogil_tile, rVals, iVals[start:start + band], res[start:start + band],
+                               *args)
+               for start in range(0, n_rows, band)]
+
+    # wait for all bands, raising the first error
+    for future in futures:
+        future.result()
+
+    return res
@@ -0,0 +1,301 @@
+"""
+
+This file contains a cache of rendered tiles of the Mandelbrot set, so that
+overlapping or identical views (e.g. when panning and zooming) do not have to
+be computed again.
+
+Tiles:
+
+At zoom level :math:`z`, the values of :math:`c` lie on a fixed lattice with
+a distance of
+
+    :math:`p = s / (t 2^z)`
+
+between neighbouring values, where :math:`s` is the width of a tile at zoom
+level 0 (base_scale, 4 by default, so that one tile covers the whole set) and
+:math:`t` is the number of values of :math:`c` along the side of a tile
+(tile_size). The value of :math:`c` with lattice indices (x, y) is
+:math:`c = x p + i y p`, and tile (tx, ty) contains the indices
+:math:`tx t \\le x < (tx + 1) t` and :math:`ty t \\le y < (ty + 1) t`
+(tile indices can be negative). Because the lattice does not depend on the
+view, every view at the same zoom level shares the tiles it overlaps with
+other views, and a view that is panned only needs the tiles that have come
+into view.
+
+Every tile is identified by its key (zoom, tx, ty, I, T, output, engine,
+options), and is computed by the engine (see render() in engines.py) from the
+values of :math:`c` on the lattice the first time it is needed. The engine
+and its options are part of the key (and of the file names of the tiles on
+disk), because some of them do not give exactly the same result (e.g.
+njit_lanes with single = True, or a cycle_tol), so caches that share a
+directory but use other engines or options never share tiles. For
+output = 'count', the counts are cached (so tiles take 1 or 2 bytes per value
+of :math:`c`, see engines.py) and the results are returned as a CountArray.
+
+Cache:
+
+Tiles are kept in memory in a least recently used (LRU) cache of at most
+max_bytes bytes: when a new tile does not fit, the tiles that have been used
+the longest ago are evicted. If a directory is given, every computed tile is
+also saved there as a .npy file (a second, slower tier that survives
+restarts and is shared between processes). Tiles that are not in memory are
+loaded from there before they are computed. The numbers of hits (memory and
+disk), misses and evictions are counted (see TileCache.stats()).
+
+TileCache can be used from several threads at once; tiles that are missing
+are computed outside the lock, so two threads may compute the same tile at
+the same time.
+
+"""
+
+import os
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from mandelbrot.engines import _prepare, CountArray, DEFAULT_REGION
+
+
+class TileCache:
+
+    """
+
+    Cache of tiles of the Mandelbrot set (see the description at the top of
+    this file).
+
+    INPUT::
+
+        max_bytes : int
+            Maximum number of bytes of the tiles kept in memory.
+
+        directory : str
+            Directory in which the tiles are saved as .npy files, or None to
+            only keep them in memory.
+
+        tile_size : int
+            Number of values of c along the side of a tile.
+
+        base_scale : float
+            Width of a tile at zoom level 0.
+
+        engine : str
+            Engine used to compute the tiles (see render()).
+
+        options :
+            Passed on to the engine (see render()), e.g. interior = True, or
+            the data type of the tiles as dtype.
+
+    """
+
+    def __init__(self, max_bytes = 256 * 2**20, directory = None, tile_size = 256, base_scale = 4.0,
+                 engine = 'auto', **options):
+        self.max_bytes = int(max_bytes)
+        self.directory = directory
+        self.tile_size = int(tile_size)
+        self.base_scale = float(base_scale)
+        self.engine = engine
+        self.options = options
+
+        # the options in a fixed order (with the values as text, so the key is
+        # always hashable), and a short digest of them for the file names
+        self._options_key = tuple(sorted((name, repr(value)) for name, value in options.items()))
+        self._options_digest = hashlib.sha1(repr(self._options_key).encode()).hexdigest()[:12]
+
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counts = {'hits' : 0, 'disk_hits' : 0, 'misses' : 0, 'evictions' : 0}
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def pixel_size(self, zoom):
+
+        """
+
+        Returns the distance between neighbouring values of c at zoom level
+        zoom.
+
+        """
+
+        return self.base_scale / (self.tile_size * 2.0**zoom)
+
+    def view_region(self, zoom, x0, y0, width, height):
+
+        """
+
+        Returns the region (see render()) of the view of width x height
+        values of c at zoom level zoom, starting at lattice indices (x0, y0).
+
+        """
+
+        p = self.pixel_size(zoom)
+        return (x0 * p, (x0 + width - 1) * p, y0 * p, (y0 + height - 1) * p)
+
+    def locate(self, region = DEFAULT_REGION, width = 1000):
+
+        """
+
+        Returns the zoom level and lattice indices (zoom, x0, y0) of the view
+        closest to region with width values of c along the real axis: the
+        zoom level is the one of which the distance between values of c is
+        closest to the one of region (on a log scale).
+
+        """
+
+        re_min, re_max, im_min, _ = region
+        step = (re_max - re_min) / max(width - 1, 1)
+        zoom = max(round(math.log2(self.base_scale / (self.tile_size * step))), 0)
+        p = self.pixel_size(zoom)
+        return zoom, round(re_min / p), round(im_min / p)
+
+    def _file_name(self, key):
+        zoom, tx, ty, I, T, output, engine, _ = key
+        return os.path.join(self.directory, f'{output}_I{I}_T{T!r}_s{self.tile_size}_b{self.base_scale!r}'
+                                            f'_{engine}_o{self._options_digest}_z{zoom}_{tx}_{ty}.npy')
+
+    def _compute(self, key):
+
+        """
+
+        Computes the tile with key (zoom, tx, ty, I, T, output, engine,
+        options).
+
+        """
+
+        zoom, tx, ty, I, T, output, engine, _ = key
+        t = self.tile_size
+        p = self.pixel_size(zoom)
+        region = self.view_region(zoom, tx * t, ty * t, t, t)
+        options = dict(self.options)
+        dtype = options.pop('dtype', np.float64)
+        func, _, _, tile, options = _prepare(region, t, t, I, T, engine, dtype, output, options)
+
+        # the values of c are computed from their lattice indices (rather
+        # than with linspace(), like render()), so the values at the edges of
+        # neighbouring tiles are exactly those of one view over both tiles
+        rVals = (tx * t + np.arange(t)) * p
+        iVals = (ty * t + np.arange(t)) * p
+        func(rVals, iVals, tile, I, T, **options)
+        return tile
+
+    def get_tile(self, zoom, tx, ty, I = 100, T = 2, output = 'ratio'):
+
+        """
+
+        Returns tile (tx, ty) at zoom level zoom, from memory, from disk or
+        computed, as a Numpy array of size (tile_size, tile_size) (the counts
+        for output = 'count'). The array must not be modified.
+
+        """
+
+        key = (int(zoom), int(tx), int(ty), int(I), float(T), output, self.engine, self._options_key)
+
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self._counts['hits'] += 1
+                return tile
+
+        file_name = self._file_name(key) if self.directory is not None else None
+        if file_name is not None and os.path.exists(file_name):
+            tile = np.load(file_name)
+            counter = 'disk_hits'
+        else:
+            tile = self._compute(key)
+            counter = 'misses'
+            if file_name is not None:
+                # write to a temporary file first, so other processes never
+                # load a partially written tile
+                tmp_name = file_name[:-4] + f'.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+                np.save(tmp_name, tile)
+                os.replace(tmp_name, file_name)
+
+        tile.setflags(write=False)
+        with self._lock:
+            self._counts[counter] += 1
+            if key not in self._tiles:
+                self._tiles[key] = tile
+                self._bytes += tile.nbytes
+            self._tiles.move_to_end(key)
+
+            # evict the least recently used tiles (but always keep this one)
+            while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                _, old = self._tiles.popitem(last=False)
+                self._bytes -= old.nbytes
+                self._counts['evictions'] += 1
+
+        return tile
+
+    def render(self, zoom, x0, y0, width = 1000, height = 1000, I = 100, T = 2, output = 'ratio'):
+
+        """
+
+        Computes the view of width x height values of c at zoom level zoom,
+        starting at lattice indices (x0, y0) (i.e. the region returned by
+        view_region()), from the tiles it overlaps.
+
+        OUTPUT::
+
+            res : Numpy array of size (height, width)
+                Like render() in engines.py: the rows are the imaginary values
+                of c from the minimum to the maximum. A CountArray for output
+                = 'count'.
+
+        """
+
+        t = self.tile_size
+        res = None
+
+        for ty in range(y0 // t, (y0 + height - 1) // t + 1):
+            for tx in range(x0 // t, (x0 + width - 1) // t + 1):
+                tile = self.get_tile(zoom, tx, ty, I, T, output)
+                if res is None:
+                    res = np.empty((height, width), dtype=tile.dtype)
+
+                # overlap of the tile and the view, in lattice indices
+                x_start, x_stop = max(x0, tx * t), min(x0 + width, (tx + 1) * t)
+                y_start, y_stop = max(y0, ty * t), min(y0 + height, (ty + 1) * t)
+                res[y_start - y0:y_stop - y0, x_start - x0:x_stop - x0] = \
+                    tile[y_start - ty * t:y_stop - ty * t, x_start - tx * t:x_stop - tx * t]
+
+        if output == 'count':
+            return CountArray(res, int(I))
+        return res
+
+    def stats(self):
+
+        """
+
+        Returns a dictionary with the number of hits (in memory), disk hits,
+        misses (computed tiles) and evictions, and the number of tiles and
+        bytes in memory.
+
+        """
+
+        with self._lock:
+            return dict(self._counts, tiles = len(self._tiles), bytes = self._bytes)
+
+    def clear(self):
+
+        """
+
+        Removes all tiles from memory (not from disk) and resets the
+        counters.
+
+        """
+
+        with self._lock:
+            self._tiles.clear()
+            self._bytes = 0
+            for name in self._counts:
+                self._counts[name] = 0
+
+    def __repr__(self):
+        stats = self.stats()
+        return (f'<TileCache {stats["tiles"]} tiles, {stats["bytes"]} / {self.max_bytes} bytes, '
+                f'{stats["hits"]} hits, {stats["disk_hits"]} disk hits, {stats["misses"]} misses, '
+                f'{stats["evictions"]} evictions>')
@@ -0,0 +1,226 @@
+"""
+
+This file renders the Mandelbrot set in tiles to memory-mapped files on disk,
+so that views can be rendered that do not fit in memory. For example,
+plot_z_values.py needs around 2.4 GB for res and z_res at a detail of 10000,
+and a detail of 50000 would need 60 GB.
+
+The grid is divided into tiles of tile_size x tile_size values of :math:`c`.
+Only one tile is computed in memory at a time (using njit_par_tile() or
+jit_save_z_tile() from optimisation_methods.py, so the tile itself is still
+computed in parallel) after which it is written to a numpy.memmap and flushed
+to disk. The results are saved as .npy files, so they can be opened again
+later using
+
+    numpy.load(path + '_res.npy', mmap_mode='r')
+
+Which tiles have been completed is saved to disk as well (in path +
+'_tiles.npy'), so a render that has been interrupted is resumed where it left
+off when render_tiled() is called again with the same path and parameters.
+
+Instead of the ratio of iterations, the tiles can contain the continuous
+iteration count or the distance estimate (output argument, see
+mandelbrot_alg.py), which are computed while iterating, so the values of
+:math:`z` do not have to be saved to shade the result. With output = 'count'
+the numbers of iterations are saved as unsigned integers instead of float64
+ratios, and the values of :math:`z` can be saved as complex64 (z_dtype), 
+which makes the files 4 to 8 times smaller.
+
+"""
+
+import os
+import json
+
+import numpy as np
+import mandelbrot.optimisation_methods as OM
+from mandelbrot.engines import count_dtype, CountArray, check_threshold
+
+
+def tile_bounds(n, tile_size):
+
+    """
+
+    Returns a list of (start, stop) index pairs dividing n values into tiles
+    of (at most) tile_size values.
+
+    """
+
+    return [(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+
+def _open_output(file_name, shape, dtype, resume):
+
+    """
+
+    Internal function to be used by render_tiled(). Opens the .npy file
+    file_name as a memory-mapped array if it exists and resume is True, and
+    creates it otherwise.
+
+    """
+
+    if resume and os.path.exists(file_name):
+        array = np.lib.format.open_memmap(file_name, mode='r+')
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError(f'{file_name} has shape {array.shape} and dtype {array.dtype}, '
+                             f'expected shape {shape} and dtype {np.dtype(dtype)}')
+        return array
+
+    return np.lib.format.open_memmap(file_name, mode='w+', dtype=dtype, shape=shape)
+
+
+def render_tiled(rVals, iVals, path, I = 100, T = 2, tile_size = 2048, save_z = False,
+                 z_dtype = np.complex128, interior = False, cycle_tol = 0.0, resume = True,
+                 verbose = False, output = 'ratio'):
+
+    """
+
+    Renders the Mandelbrot set tile by tile to memory-mapped .npy files.
+
+    INPUT::
+
+        rVals : Numpy array of size (n,)
+            The values for the real component of c to iterate over.
+
+        iVals : Numpy array of size (m,)
+            The values for the imaginary component of c to iterate over.
+
+        path : str
+            Path (without extension) of the output files. The result is saved
+            to path + '_res.npy', the values of z to path + '_z.npy' (if
+            save_z is True) and the completed tiles to path + '_tiles.npy'.
+
+        I : int
+            Maximum number of iterations.
+
+        T : float
+            Threshold value, larger than 1 for output = 'smooth'.
+
+        tile_size : int
+            Number of rows and columns of a tile. At most one tile (of
+            tile_size x tile_size values) is kept in memory at a time.
+
+        save_z : bool
+            Whether to save the last value of z as well (like jit_save_z()).
+
+        z_dtype : numpy dtype
+            Data type used to save the values of z.
+
+        interior, cycle_tol :
+            See njit_par() in optimisation_methods.py.
+
+        resume : bool
+            If True and the output files exist, only the tiles that have not
+            been completed yet are computed. If False, the output files are
+            overwritten.
+
+        verbose : bool
+            Print progress after every tile.
+
+        output : str
+            What to save to path + '_res.npy': 'ratio', 'smooth' or 
+            'distance' or 'count' (see render() in engines.py). With 
+            'smooth' or 'distance' the shading is computed while iterating, 
+            so there is no need to save the values of z (save_z must be 
+            False). With 'count' the numbers of iterations are saved in the
+            smallest unsigned integer type that fits I, and the values of z 
+            (if save_z is True) are computed in z_dtype (e.g. complex64) 
+            directly.
+
+    OUTPUT::
+
+        res : numpy.memmap of size (m, n)
+            Matrix containing the result of the function generating the
+            Mandelbrot set. For output = 'count', a CountArray (see 
+            engines.py) of the memory-mapped counts, which computes the 
+            ratios only for the parts that are read.
+
+        z_res : numpy.memmap of size (m, n) or None
+            Matrix containing the last values of z, or None if save_z is
+            False.
+
+    """
+
+    shape = (iVals.shape[0], rVals.shape[0])
+
+    # the parameters are passed with the types of the signatures in
+    # optimisation_methods.SIGNATURES, so the functions compiled by warm_up()
+    # (or loaded from the numba cache) are used
+    I, T, interior, cycle_tol = int(I), float(T), bool(interior), float(cycle_tol)
+
+    if output not in OM.PAR_TILE_FUNCTIONS:
+        raise ValueError(f'Unknown output {output}, choose from {list(OM.PAR_TILE_FUNCTIONS)}')
+    if save_z and output not in ('ratio', 'count'):
+        raise ValueError(f"save_z can only be used with output 'ratio' or 'count', not '{output}'")
+    check_threshold(T, output)
+
+    # numbers of iterations are saved in the smallest unsigned integer type 
+    # that fits I
+    res_dtype = count_dtype(I) if output == 'count' else np.float64
+
+    row_tiles = tile_bounds(shape[0], tile_size)
+    col_tiles = tile_bounds(shape[1], tile_size)
+
+    # the parameters of the render are saved so that a render is never
+    # resumed with different parameters
+    params = {'shape' : list(shape), 'I' : int(I), 'T' : float(T), 'tile_size' : tile_size,
+              'save_z' : bool(save_z), 'z_dtype' : np.dtype(z_dtype).name,
+              'interior' : bool(interior), 'cycle_tol' : float(cycle_tol), 'output' : output,
+              'rVals' : [float(rVals[0]), float(rVals[-1])],
+              'iVals' : [float(iVals[0]), float(iVals[-1])]}
+
+    # a render can only be resumed if all its files are there
+    params_file = path + '_params.json'
+    files = [params_file, path + '_res.npy', path + '_tiles.npy'] + ([path + '_z.npy'] if save_z else [])
+    if resume and all(os.path.exists(f) for f in files):
+        with open(params_file) as f:
+            if json.load(f) != params:
+                raise ValueError(f'Cannot resume render in {path}: it was started with different parameters')
+    else:
+        resume = False
+
+    with open(params_file, 'w') as f:
+        json.dump(params, f)
+
+    # open (or create) the memory-mapped outputs
+    res = _open_output(path + '_res.npy', shape, res_dtype, resume)
+    z_res = _open_output(path + '_z.npy', shape, z_dtype, resume) if save_z else None
+    tiles_done = _open_output(path + '_tiles.npy', (len(row_tiles), len(col_tiles)), np.bool_, resume)
+
+    # buffers for a single tile (jit_save_z_count_tile() writes z in z_dtype
+    # directly)
+    res_tile = np.zeros((min(tile_size, shape[0]), min(tile_size, shape[1])), dtype=res_dtype)
+    if save_z:
+        z_tile = np.zeros(res_tile.shape, dtype=z_dtype if output == 'count' else np.complex128)
+
+    for ti, (i0, i1) in enumerate(row_tiles):
+        for tr, (r0, r1) in enumerate(col_tiles):
+            if tiles_done[ti, tr]:
+                continue
+
+            # compute the tile in memory...
+            res_view = res_tile[:i1 - i0, :r1 - r0]
+            if save_z:
+                z_view = z_tile[:i1 - i0, :r1 - r0]
+                save_z_function = OM.jit_save_z_count_tile if output == 'count' else OM.jit_save_z_tile
+                save_z_function(rVals[r0:r1], iVals[i0:i1], res_view, z_view, I, T, interior, cycle_tol)
+                z_res[i0:i1, r0:r1] = z_view
+            else:
+                tile_function = getattr(OM, OM.PAR_TILE_FUNCTIONS[output])
+                tile_function(rVals[r0:r1], iVals[i0:i1], res_view, I, T, interior, cycle_tol)
+
+            # ... write it to disk and only then mark it as completed
+            res[i0:i1, r0:r1] = res_view
+            res.flush()
+            if save_z:
+                z_res.flush()
+
+            tiles_done[ti, tr] = True
+            tiles_done.flush()
+
+            if verbose:
+                print(f'Tile ({ti:d}, {tr:d}) of ({len(row_tiles):d}, {len(col_tiles):d}) done')
+
+    if output == 'count':
+        return CountArray(res, I), z_res
+
+    return res, z_res
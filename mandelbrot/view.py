@@ -0,0 +1,281 @@
+"""
+
+This file contains View, a view of the Mandelbrot set that is updated
+incrementally when it is panned or zoomed, for interactive use.
+
+When a view is panned by a whole number of values of :math:`c` (pixels), or
+zoomed in or out by an integer factor around one of its pixels, most of the
+values of :math:`c` of the new view are values of :math:`c` of the previous
+view:
+
+- Panning by (dx, dy) pixels: all values of :math:`c` except for the strips of
+  dx columns and dy rows that come into view. Panning a 3840 x 2160 view by 20
+  pixels horizontally only computes 20 x 2160 values, around 0.5% of a full
+  render.
+
+- Zooming in by a factor k: every k-th row and column of the new view (around
+  the pixel that stays in place) are values of the previous view, i.e.
+  :math:`1 / k^2` of the values; the values between them are new.
+
+- Zooming out by a factor k: every k-th row and column of the previous view
+  are in the new view (again :math:`1 / k^2` of the new values), and the
+  border around them is new.
+
+View keeps the values of :math:`c` (rVals and iVals) and the result (res,
+and z_res if the values of :math:`z` are saved) of the current view. For
+every new view, it finds for every row and column of the new view the
+row or column of the previous view with the same value of :math:`c` (if any),
+copies the result for the values of :math:`c` that are in both views, and
+only computes the others, on two grids: the new rows (all columns) and the
+new columns of the rows that are in both views. The values of :math:`c` that
+are reused are copied into rVals and iVals as they are, so res is always the
+result for exactly the values in rVals and iVals.
+
+The new values are computed with the engines of render() (see engines.py),
+or with jit_save_z_tile() (optimisation_methods.py) if the values of
+:math:`z` are saved.
+
+"""
+
+import numpy as np
+import mandelbrot.optimisation_methods as OM
+from mandelbrot.engines import DEFAULT_REGION, CountArray, _prepare
+
+
+class View:
+
+    """
+
+    A view of the Mandelbrot set that is updated incrementally by pan(),
+    zoom_in() and zoom_out() (see the description at the top of this file).
+
+    INPUT::
+
+        region, width, height, max_iter, threshold, engine, dtype, output,
+        options :
+            See render() in engines.py.
+
+        save_z : bool
+            Also save the values of z right before the iteration stopped in
+            z_res (like jit_save_z_tile() in optimisation_methods.py). Only
+            for output = 'ratio' or 'count', and of the options only
+            interior and cycle_tol can be given (they are passed on to
+            jit_save_z_tile()).
+
+    ATTRIBUTES::
+
+        rVals, iVals : Numpy arrays of size (width,) and (height,)
+            Values of c of the current view.
+
+        res : Numpy array of size (height, width)
+            Result for the current view (a CountArray for output = 'count').
+
+        z_res : Numpy array of size (height, width)
+            Values of z for the current view, if save_z is True.
+
+        computed : int
+            Number of values of c computed for the last update.
+
+    """
+
+    def __init__(self, region = DEFAULT_REGION, width = 1000, height = 1000, max_iter = 100, threshold = 2,
+                 engine = 'auto', dtype = np.float64, output = 'ratio', save_z = False, **options):
+        if save_z and output not in ('ratio', 'count'):
+            raise ValueError(f'Values of z can only be saved for output ratio or count, not {output}')
+        unsupported = [o for o in options if o not in ('interior', 'cycle_tol')]
+        if save_z and unsupported:
+            raise ValueError(f'Values of z are saved with jit_save_z_tile(), which does not support the '
+                             f'option(s) {unsupported}')
+
+        self._func, rVals, iVals, self._res, self._options = _prepare(region, width, height, max_iter, threshold,
+                                                                      engine, dtype, output, options)
+        self.width = width
+        self.height = height
+        self.max_iter = int(max_iter)
+        self.threshold = float(threshold)
+        self.output = output
+        self.save_z = save_z
+
+        # distance between neighbouring values of c
+        self.step_r = (rVals[-1] - rVals[0]) / max(width - 1, 1)
+        self.step_i = (iVals[-1] - iVals[0]) / max(height - 1, 1)
+
+        self.rVals = rVals
+        self.iVals = iVals
+        self.z_res = np.zeros((height, width), dtype=np.complex128) if save_z else None
+        self.computed = self._compute(self._res, self.z_res, np.arange(height), np.arange(width))
+
+    @property
+    def res(self):
+        if self.output == 'count':
+            return CountArray(self._res, self.max_iter)
+        return self._res
+
+    @property
+    def region(self):
+
+        """
+
+        The region (see render()) of the current view.
+
+        """
+
+        return (self.rVals[0], self.rVals[-1], self.iVals[0], self.iVals[-1])
+
+    def _compute(self, res, z_res, rows, cols):
+
+        """
+
+        Internal function computing the grid of values of c rows x cols of
+        the current view into res (and z_res), returning the number of values
+        computed.
+
+        """
+
+        if len(rows) == 0 or len(cols) == 0:
+            return 0
+
+        rVals = self.rVals[cols]
+        iVals = self.iVals[rows]
+        sub = np.zeros((len(rows), len(cols)), dtype=res.dtype)
+        if self.save_z:
+            z_sub = np.zeros((len(rows), len(cols)), dtype=np.complex128)
+            interior = bool(self._options.get('interior', False))
+            cycle_tol = float(self._options.get('cycle_tol', 0.0))
+            if self.output == 'count':
+                OM.jit_save_z_count_tile(rVals, iVals, sub, z_sub, self.max_iter, self.threshold, interior,
+                                         cycle_tol)
+            else:
+                OM.jit_save_z_tile(rVals, iVals, sub, z_sub, self.max_iter, self.threshold, interior, cycle_tol)
+            z_res[np.ix_(rows, cols)] = z_sub
+        else:
+            self._func(rVals, iVals, sub, self.max_iter, self.threshold, **self._options)
+        res[np.ix_(rows, cols)] = sub
+
+        return len(rows) * len(cols)
+
+    def _update(self, rVals, iVals, r_old, i_old):
+
+        """
+
+        Internal function moving the view to the values of c rVals and
+        iVals. r_old and i_old contain for every column and row of the new
+        view the index of the column or row of the current view with the same
+        value of c, or -1 if there is none.
+
+        """
+
+        # the values of c in both views are copied as they are
+        rVals[r_old >= 0] = self.rVals[r_old[r_old >= 0]]
+        iVals[i_old >= 0] = self.iVals[i_old[i_old >= 0]]
+
+        res = np.zeros_like(self._res)
+        z_res = np.zeros_like(self.z_res) if self.save_z else None
+
+        old_rows = np.nonzero(i_old >= 0)[0]
+        old_cols = np.nonzero(r_old >= 0)[0]
+        reused = np.ix_(old_rows, old_cols)
+        res[reused] = self._res[np.ix_(i_old[old_rows], r_old[old_cols])]
+        if self.save_z:
+            z_res[reused] = self.z_res[np.ix_(i_old[old_rows], r_old[old_cols])]
+
+        self.rVals = rVals
+        self.iVals = iVals
+
+        # the new rows, and the new columns of the other rows
+        self.computed = self._compute(res, z_res, np.nonzero(i_old < 0)[0], np.arange(self.width))
+        self.computed += self._compute(res, z_res, old_rows, np.nonzero(r_old < 0)[0])
+
+        self._res = res
+        self.z_res = z_res
+
+        return self.res
+
+    def pan(self, dx = 0, dy = 0):
+
+        """
+
+        Moves the view by dx columns (towards larger real values of c for
+        dx > 0) and dy rows (towards larger imaginary values for dy > 0), and
+        returns the new result.
+
+        """
+
+        dx = int(dx)
+        dy = int(dy)
+
+        cols = np.arange(self.width) + dx
+        rows = np.arange(self.height) + dy
+        rVals = self.rVals[0] + cols * self.step_r
+        iVals = self.iVals[0] + rows * self.step_i
+        r_old = np.where((cols >= 0) & (cols < self.width), cols, -1)
+        i_old = np.where((rows >= 0) & (rows < self.height), rows, -1)
+
+        return self._update(rVals, iVals, r_old, i_old)
+
+    def _zoom(self, factor, x, y, zoom_in):
+
+        """
+
+        Internal function zooming in or out by the integer factor, keeping the
+        value of c of column x and row y in place.
+
+        """
+
+        factor = int(factor)
+        if factor < 1:
+            raise ValueError(f'The zoom factor must be a positive integer, got {factor}')
+        x = self.width // 2 if x is None else int(x)
+        y = self.height // 2 if y is None else int(y)
+
+        cols = np.arange(self.width) - x
+        rows = np.arange(self.height) - y
+        if zoom_in:
+            # column x + k * j of the new view is column x + j of the old one
+            step_r = self.step_r / factor
+            step_i = self.step_i / factor
+            r_old = np.where(cols % factor == 0, x + cols // factor, -1)
+            i_old = np.where(rows % factor == 0, y + rows // factor, -1)
+        else:
+            # column x + j of the new view is column x + k * j of the old one
+            step_r = self.step_r * factor
+            step_i = self.step_i * factor
+            r_old = x + cols * factor
+            i_old = y + rows * factor
+        r_old = np.where((r_old >= 0) & (r_old < self.width), r_old, -1)
+        i_old = np.where((i_old >= 0) & (i_old < self.height), i_old, -1)
+
+        rVals = self.rVals[x] + cols * step_r
+        iVals = self.iVals[y] + rows * step_i
+        self.step_r = step_r
+        self.step_i = step_i
+
+        return self._update(rVals, iVals, r_old, i_old)
+
+    def zoom_in(self, factor = 2, x = None, y = None):
+
+        """
+
+        Zooms in by the integer factor, keeping the value of c of column x and
+        row y (by default the middle of the view) in place, and returns the
+        new result.
+
+        """
+
+        return self._zoom(factor, x, y, True)
+
+    def zoom_out(self, factor = 2, x = None, y = None):
+
+        """
+
+        Zooms out by the integer factor, keeping the value of c of column x and
+        row y (by default the middle of the view) in place, and returns the
+        new result.
+
+        """
+
+        return self._zoom(factor, x, y, False)
+
+    def __repr__(self):
+        re_min, re_max, im_min, im_max = self.region
+        return f'<View {self.width} x {self.height} of ({re_min!r}, {re_max!r}, {im_min!r}, {im_max!r})>'
@@ -12,19 +12,35 @@ import sys
 sys.path.append('../')
 
 
+import io
+import os
+import time
+import tempfile
+import subprocess
+import mandelbrot
 import mandelbrot.optimisation_methods as OM
+from mandelbrot.tiled import render_tiled
+import mandelbrot.multiprocessing_mandelbrot as MM
 import h5py
 
 class TestMandelbrot(unittest.TestCase):
 
     def setUp(self):
         # This will contain a list of the methods we will test
-        self.methods = ['OM.naive(detail, rVals, iVals, res)',
-                        'OM.jit_func(detail, rVals, iVals, res)',
-                        'OM.njit_par(detail, rVals, iVals, res)',
-                        'OM.vectorised(detail, rVals, iVals, res)',
-                        'OM.jit_vectorised(detail, rVals, iVals, res)',
-                        'OM.gu_jit_vectorised(detail, rVals, iVals, res)' ]
+        self.methods = [OM.naive,
+                        OM.jit_func,
+                        OM.njit_par,
+                        OM.vectorised,
+                        OM.jit_vectorised,
+                        OM.gu_jit_vectorised,
+                        OM.numpy_masked ]
+        
+        # The methods that can skip the values of c in the main cardioid and
+        # the period-2 bulb. Their output should be bit-identical to naive().
+        self.interior_methods = [OM.naive,
+                                 OM.jit_func,
+                                 OM.njit_par,
+                                 OM.numpy_masked ]
 
         
     def test_optimisation_methods(self):
@@ -47,10 +63,708 @@ class TestMandelbrot(unittest.TestCase):
             # initialise / reset results matrix
             res = np.zeros((detail, detail))
 
-            print('Testing ' + m + '...')
-            res = eval(m)
+            print('Testing ' + m.__name__ + '...')
+            res = m(detail, rVals, iVals, res)
             self.assertTrue(np.allclose(res, true_data))
             print('Done!')
+            
+    def test_interior_check(self):
+        
+        # load data 
+        data_file = h5py.File('naive_output_100x100.hdf5', 'r')
+        true_data = data_file['mandelbrot'][...]
+        data_file.close()
+        
+        # specify (low) detail 
+        detail = 100
+        
+        # initialise real and imaginary values to iterate over
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        
+        # run all methods with the interior check and check that their 
+        # outputs are identical to the 'true' data
+        for m in self.interior_methods:
+            # initialise / reset results matrix
+            res = np.zeros((detail, detail))
+
+            print('Testing ' + m.__name__ + ' with the interior check...')
+            res = m(detail, rVals, iVals, res, interior=True)
+            self.assertTrue(np.array_equal(res, true_data))
+            print('Done!')
+
+        # below T = 2 values in the cardioid or bulb can cross the threshold
+        # (e.g. c = -1 for T = 0.5), so the interior check is skipped
+        M = mandelbrot.mandelbrot_alg.M
+        self.assertEqual(M(-1, 100, 0.5, check_interior=True), M(-1, 100, 0.5))
+        self.assertLess(M(-1, 100, 0.5, check_interior=True), 1)
+        for m in self.interior_methods:
+            true_res = m(detail, rVals, iVals, np.zeros((detail, detail)), 100, 0.5)
+            res = m(detail, rVals, iVals, np.zeros((detail, detail)), 100, 0.5, interior=True)
+            self.assertTrue(np.array_equal(res, true_res))
+
+        region = (-2.0, 1.0, -1.5, 1.5)
+        for engine in mandelbrot.available_engines():
+            if 'interior' in mandelbrot.engines.ENGINES[engine].options:
+                true_res = mandelbrot.render(region, 40, 30, 100, 0.5, engine=engine)
+                res = mandelbrot.render(region, 40, 30, 100, 0.5, engine=engine, interior=True)
+                self.assertTrue(np.array_equal(res, true_res))
+
+    def test_render(self):
+        
+        # load data 
+        data_file = h5py.File('naive_output_100x100.hdf5', 'r')
+        true_data = data_file['mandelbrot'][...]
+        data_file.close()
+        
+        # all engines give the 'true' data for the default view
+        for engine in mandelbrot.available_engines():
+            res = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), 100, 100, engine=engine)
+            self.assertTrue(np.allclose(res, true_data))
+        
+        # non-square views are identical for all engines
+        region = (-0.8, -0.7, 0.05, 0.2)
+        true_res = mandelbrot.render(region, 30, 20, 200, engine='naive')
+        self.assertEqual(true_res.shape, (20, 30))
+        for engine in mandelbrot.available_engines() + ['auto']:
+            res = mandelbrot.render(region, 30, 20, 200, engine=engine)
+            self.assertTrue(np.allclose(res, true_res))
+        
+        # 'auto' picks the fastest recorded engine for the closest size
+        timings = [{'engine' : 'numpy', 'pixels' : 100, 'I' : 100, 'time' : 1.0},
+                   {'engine' : 'jit', 'pixels' : 100, 'I' : 100, 'time' : 2.0},
+                   {'engine' : 'numpy', 'pixels' : 10**6, 'I' : 100, 'time' : 2.0},
+                   {'engine' : 'jit', 'pixels' : 10**6, 'I' : 100, 'time' : 1.0}]
+        self.assertEqual(mandelbrot.choose_engine(10, 10, 100, timings), 'numpy')
+        self.assertEqual(mandelbrot.choose_engine(2000, 2000, 100, timings), 'jit')
+        
+        # 'auto' only picks engines that support the options, other engines
+        # raise a ValueError naming the option
+        self.assertEqual(mandelbrot.choose_engine(10, 10, 100, timings, options=['cycle_tol']), 'jit')
+        res = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), 100, 100, schedule='cyclic')
+        self.assertTrue(np.allclose(res, true_data))
+        with self.assertRaisesRegex(ValueError, "jit_vectorised.*'interior'"):
+            mandelbrot.render(width=10, height=10, engine='jit_vectorised', interior=True)
+        with self.assertRaisesRegex(ValueError, "'interor'"):
+            mandelbrot.render(width=10, height=10, interor=True)
+        
+        self.assertEqual(mandelbrot.render(width=3, height=2, dtype=np.float32).dtype, np.float32)
+        with self.assertRaises(ValueError):
+            mandelbrot.render(engine='unknown')
+
+    def test_progressive(self):
+        
+        region = (-0.8, -0.7, 0.05, 0.2)
+        true_res = mandelbrot.render(region, 45, 31, 200, engine='njit_par')
+        
+        # every pass is a full-size preview, the last one is exact and every
+        # value of c is computed exactly once
+        passes = list(mandelbrot.render_progressive(region, 45, 31, 200, engine='njit_par'))
+        self.assertEqual([step for step, _, _ in passes], [8, 4, 2, 1])
+        self.assertEqual(passes[0][2], 6 * 4)
+        for _, res, _ in passes:
+            self.assertEqual(res.shape, (31, 45))
+        self.assertTrue(np.array_equal(passes[-1][1], true_res))
+        self.assertEqual(passes[-1][2], 45 * 31)
+        
+        # skipping uniform values computes fewer values of c
+        *_, (_, res, computed) = mandelbrot.render_progressive(region, 45, 31, 200, engine='njit_par',
+                                                               skip_uniform=True)
+        self.assertLess(computed, 45 * 31)
+        self.assertLess(np.mean(res != true_res), 0.05)
+        
+        # callback with every pass
+        steps = []
+        res = mandelbrot.render(region, 45, 31, 200, engine='numpy', callback=lambda step, res: steps.append(step))
+        self.assertEqual(steps, [8, 4, 2, 1])
+        self.assertTrue(np.array_equal(res, true_res))
+        
+        with self.assertRaises(ValueError):
+            next(mandelbrot.render_progressive(steps=(8, 3, 1)))
+
+    def test_tile_cache(self):
+        
+        import tempfile
+        from mandelbrot.tile_cache import TileCache
+        
+        cache = TileCache(tile_size=32, engine='njit_par')
+        zoom, x0, y0 = cache.locate((-0.8, -0.7, 0.05, 0.15), 50)
+        
+        # the values of c of the view on the lattice
+        p = cache.pixel_size(zoom)
+        rVals = (x0 + np.arange(50)) * p
+        iVals = (y0 + np.arange(40)) * p
+        true_res = OM.njit_par_tile(rVals, iVals, np.zeros((40, 50)), 200, 2.0, False, 0.0)
+        
+        # the view overlaps 3 x 3 tiles (or less), which are computed once
+        # and give exactly the same result as the whole view
+        res = cache.render(zoom, x0, y0, 50, 40, 200)
+        self.assertTrue(np.array_equal(res, true_res))
+        misses = cache.stats()['misses']
+        self.assertLessEqual(misses, 9)
+        self.assertEqual(cache.stats()['hits'], 0)
+        
+        # identical and panned views reuse the tiles
+        self.assertTrue(np.array_equal(cache.render(zoom, x0, y0, 50, 40, 200), res))
+        cache.render(zoom, x0 + 5, y0 - 3, 20, 20, 200)
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], misses)
+        self.assertGreaterEqual(stats['hits'], misses + 1)
+        
+        # other parameters are other tiles
+        cache.render(zoom, x0, y0, 50, 40, 100)
+        self.assertEqual(cache.stats()['misses'], 2 * misses)
+        
+        # memory limit, and the tiles on disk
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TileCache(2 * 32 * 32, directory, tile_size=32, engine='njit_par')
+            counts = cache.render(zoom, x0, y0, 50, 40, 200, output='count')
+            self.assertEqual(counts.counts.dtype, np.uint8)
+            self.assertTrue(np.array_equal(counts[...], res))
+            stats = cache.stats()
+            self.assertEqual(stats['tiles'], 2)
+            self.assertEqual(stats['evictions'], misses - 2)
+            
+            cache = TileCache(directory=directory, tile_size=32, engine='njit_par')
+            counts = cache.render(zoom, x0, y0, 50, 40, 200, output='count')
+            self.assertTrue(np.array_equal(counts[...], res))
+            self.assertEqual(cache.stats()['disk_hits'], misses)
+            self.assertEqual(cache.stats()['misses'], 0)
+
+            # caches with other engines or options do not share the tiles
+            for engine, options in [('threads', {}), ('njit_par', {'cycle_tol' : 1e-12})]:
+                cache = TileCache(directory=directory, tile_size=32, engine=engine, **options)
+                cache.render(zoom, x0, y0, 50, 40, 200, output='count')
+                self.assertEqual(cache.stats()['disk_hits'], 0)
+                self.assertEqual(cache.stats()['misses'], misses)
+
+    def test_view(self):
+        
+        from mandelbrot.view import View
+        
+        view = View((-0.8, -0.7, 0.05, 0.15), 48, 30, 200, engine='njit_par')
+        self.assertEqual(view.computed, 48 * 30)
+        
+        # every update gives the same result as rendering the new view, but
+        # only computes the values of c that were not in the previous view
+        for update, computed in [(lambda: view.pan(5, -2), 5 * 30 + 2 * 43),
+                                 (lambda: view.zoom_in(2), 48 * 30 - 24 * 15),
+                                 (lambda: view.zoom_out(3, 10, 20), 48 * 30 - 16 * 10),
+                                 (lambda: view.pan(-100, 0), 48 * 30)]:
+            res = update()
+            self.assertEqual(view.computed, computed)
+            true_res = mandelbrot.render(view.region, 48, 30, 200, engine='njit_par')
+            self.assertTrue(np.array_equal(res, true_res))
+        
+        # the values of z are kept as well
+        view = View(width=31, height=21, save_z=True, output='count')
+        view.zoom_in(3, 4, 5)
+        res = np.zeros((21, 31))
+        z_res = np.zeros((21, 31), dtype=np.complex128)
+        OM.jit_save_z_tile(view.rVals, view.iVals, res, z_res, 100, 2.0, False, 0.0)
+        self.assertTrue(np.array_equal(view.res[...], res))
+        self.assertTrue(np.array_equal(view.z_res, z_res))
+        
+        # with the values of z, the interior check and cycle detection are
+        # passed on to jit_save_z_tile() (the values of z in the set differ)
+        view = View(width=31, height=21, max_iter=500, save_z=True, interior=True, cycle_tol=1e-12)
+        view.pan(3, 2)
+        OM.jit_save_z_tile(view.rVals, view.iVals, res, z_res, 500, 2.0, True, 1e-12)
+        self.assertTrue(np.array_equal(view.res, res))
+        self.assertTrue(np.array_equal(view.z_res, z_res))
+        OM.jit_save_z_tile(view.rVals, view.iVals, res, z_res, 500, 2.0, False, 0.0)
+        self.assertFalse(np.array_equal(view.z_res, z_res))
+        with self.assertRaises(ValueError):
+            View(width=31, height=21, save_z=True, engine='njit_lanes', lanes=8)
+
+    def test_lanes(self):
+        
+        rVals = np.linspace(-2.0, 1.0, 53)
+        iVals = np.linspace(-1.5, 1.5, 41)
+        true_res = OM.njit_par_tile(rVals, iVals, np.zeros((41, 53)), 200, 2.0, False, 0.0)
+        
+        # identical for any number of lanes (also more lanes than values of c
+        # in a row) and iterations between refilling the lanes
+        for lanes, chunk in [(1, 1), (4, 8), (16, 8), (64, 3)]:
+            res = OM.njit_par_lanes_tile(rVals, iVals, np.zeros((41, 53)), 200, 2.0, lanes, chunk)
+            self.assertTrue(np.array_equal(res, true_res))
+        
+        # float32 differs only near the boundary
+        res = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), 53, 41, 200, engine='njit_lanes', single=True)
+        self.assertLess(np.mean(res != true_res), 0.01)
+        
+        # the interior check and the cycle detection give the same result as
+        # njit_par_tile(), also through render() with the default engine
+        for interior, cycle_tol in [(True, 0.0), (False, 1e-12), (True, 1e-12)]:
+            res = OM.njit_par_lanes_tile(rVals, iVals, np.zeros((41, 53)), 200, 2.0, 4, 8, interior, cycle_tol)
+            self.assertTrue(np.array_equal(res, OM.njit_par_tile(rVals, iVals, np.zeros((41, 53)), 200, 2.0,
+                                                                 interior, cycle_tol)))
+        for width in [10, 100]:
+            res = mandelbrot.render(width=width, height=width, interior=True)
+            self.assertTrue(np.array_equal(res, mandelbrot.render(width=width, height=width, engine='njit_par')))
+            res = mandelbrot.render(width=width, height=width, max_iter=2000, cycle_tol=1e-12)
+            self.assertTrue(np.array_equal(res, mandelbrot.render(width=width, height=width, max_iter=2000,
+                                                                  engine='njit_par')))
+
+    def test_schedule(self):
+        
+        rVals = np.linspace(-2.0, 1.0, 60)
+        iVals = np.linspace(-1.5, 1.5, 40)
+        true_res = OM.njit_par_tile(rVals, iVals, np.zeros((40, 60)), 200, 2.0, False, 0.0)
+        
+        # every schedule computes every row exactly once
+        works = {}
+        for schedule in ['static', 'cyclic', 'lpt']:
+            order, offsets = OM.schedule_rows(40, 8, schedule, np.arange(40.0))
+            self.assertEqual(sorted(order), list(range(40)))
+            self.assertEqual(offsets[-1], 40)
+            
+            res, work = OM.njit_par_balanced_tile(rVals, iVals, np.zeros((40, 60)), 200, 2.0,
+                                                  schedule=schedule, n_threads=8)
+            self.assertTrue(np.array_equal(res, true_res))
+            works[schedule] = work
+        
+        # the same work, divided more evenly than contiguous blocks
+        self.assertEqual(works['static'].sum(), works['cyclic'].sum())
+        self.assertLess(OM.imbalance(works['cyclic']), OM.imbalance(works['static']))
+        self.assertLess(OM.imbalance(works['lpt']), OM.imbalance(works['static']))
+        
+        res = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), 60, 40, 200, engine='njit_par', schedule='lpt')
+        self.assertTrue(np.array_equal(res, true_res))
+
+    def test_threaded(self):
+        
+        from concurrent.futures import ThreadPoolExecutor
+        from mandelbrot.threaded import render_threaded, get_executor
+        
+        region = (-0.8, -0.7, 0.05, 0.2)
+        self.assertTrue(OM.jit_nogil_tile.targetoptions['nogil'])
+        
+        # identical to njit_par for every output
+        for output in ['ratio', 'smooth', 'distance', 'count']:
+            true_res = mandelbrot.render(region, 37, 29, 200, engine='njit_par', output=output)
+            res = mandelbrot.render(region, 37, 29, 200, engine='threads', output=output)
+            self.assertTrue(np.array_equal(res[...], true_res[...]))
+        
+        # concurrent renders from several threads, and renders from the
+        # threads of the pool itself (which must not wait for the pool)
+        true_res = mandelbrot.render(region, 37, 29, 200, engine='njit_par')
+        render = lambda _: mandelbrot.render(region, 37, 29, 200, engine='threads')
+        with ThreadPoolExecutor(4) as clients:
+            for res in clients.map(render, range(8)):
+                self.assertTrue(np.array_equal(res, true_res))
+        for res in get_executor().map(render, range(8)):
+            self.assertTrue(np.array_equal(res, true_res))
+        
+        rVals = np.linspace(*region[:2], 37)
+        iVals = np.linspace(*region[2:], 29)
+        res = render_threaded(rVals, iVals, np.zeros((29, 37)), 200, band=1)
+        self.assertTrue(np.array_equal(res, true_res))
+
+    def test_distributed(self):
+        
+        from mandelbrot.distributed import render_distributed
+        
+        rVals = np.linspace(-2.0, 1.0, 90)
+        iVals = np.linspace(-1.5, 1.5, 70)
+        true_res = OM.njit_par_tile(rVals, iVals, np.zeros((70, 90)), 200, 2.0, False, 0.0)
+        
+        # three workers on localhost: one dies on its first tile and one is
+        # slow, their tiles are given to the other workers
+        workers = [{'crash_after' : 1}, {'delay' : 1.0}, {}]
+        res, stats = render_distributed(rVals, iVals, np.zeros((70, 90)), 200, tile_size=32, local_workers=3,
+                                        worker_options=workers, slow_after=0.5, timeout=120, return_stats=True)
+        self.assertTrue(np.array_equal(res, true_res))
+        self.assertEqual(stats['workers'], 3)
+        self.assertGreaterEqual(stats['reissued_dead'], 1)
+        self.assertEqual(sum(stats['tiles_per_worker'].values()), 9 + stats['duplicates'])
+        
+        # without workers
+        with self.assertRaises(TimeoutError):
+            render_distributed(rVals, iVals, np.zeros((70, 90)), 200, timeout=0.5)
+        
+        # one dictionary of worker options per local worker
+        with self.assertRaises(ValueError):
+            render_distributed(rVals, iVals, np.zeros((70, 90)), 200, local_workers=2, worker_options=[{}])
+
+    def test_server(self):
+        
+        import zlib
+        import asyncio
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from mandelbrot.server import TileServer, tile_region, colour_map
+        from mandelbrot.load_test import fetch
+        
+        async def run():
+            
+            # one thread, blocked until release is set, so that all requests
+            # are waiting for the executor at the same time
+            release = threading.Event()
+            executor = ThreadPoolExecutor(1)
+            executor.submit(release.wait)
+            server = await TileServer('localhost', 0, 100, executor=executor, max_pending=2).start()
+            try:
+                # concurrent requests for one tile are computed once, a third
+                # tile is rejected while two tiles are pending
+                pending = [asyncio.ensure_future(fetch('localhost', server.port, '/1/0/1.npy')) for _ in range(8)]
+                pending.append(asyncio.ensure_future(fetch('localhost', server.port, '/0/0/0.png')))
+                await asyncio.sleep(0.5)
+                status, _ = await fetch('localhost', server.port, '/1/1/1.npy')
+                self.assertEqual(status, 503)
+                release.set()
+                responses = await asyncio.gather(*pending)
+                self.assertEqual((server.counters['computed'], server.counters['coalesced']), (2, 7))
+                
+                # the tile is identical to rendering its region
+                self.assertTrue(all(response == responses[0] for response in responses[:8]))
+                status, body = responses[0]
+                self.assertEqual(status, 200)
+                res = np.load(io.BytesIO(body))
+                true_res = mandelbrot.render(tile_region(1, 0, 1), 256, 256, 100, engine='njit_par')[::-1]
+                self.assertTrue(np.array_equal(res, true_res))
+                
+                # the PNG image is the colour map of the tile
+                status, png = responses[8]
+                self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+                self.assertEqual(png[16:24], bytes([0, 0, 1, 0, 0, 0, 1, 0]))
+                raw = np.frombuffer(zlib.decompress(png[41:-16]), dtype=np.uint8).reshape(256, 1 + 256 * 3)
+                self.assertTrue(np.array_equal(raw[:, 1:].reshape(256, 256, 3),
+                                               colour_map(mandelbrot.render(tile_region(0, 0, 0), 256, 256,
+                                                                            100)[::-1])))
+                
+                for path, status in [('/2/4/0.png', 404), ('/1/0/a.png', 400), ('/1/0/0.gif', 404),
+                                     ('/1/0/0.png?max_iter=0', 400)]:
+                    self.assertEqual((await fetch('localhost', server.port, path))[0], status)
+            finally:
+                release.set()
+                await server.close()
+                executor.shutdown()
+        
+        asyncio.run(run())
+
+    def test_shading(self):
+        
+        # initialise a non-square grid
+        rVals = np.linspace(-2.0, 1.0, 60)
+        iVals = np.linspace(-1.5, 1.5, 40)
+        I = 100
+        
+        # the continuous iteration count follows from the values of z saved by
+        # jit_save_z_tile()
+        res = np.zeros((40, 60))
+        z_res = np.zeros((40, 60), dtype=np.complex128)
+        OM.jit_save_z_tile(rVals, iVals, res, z_res, I, 2.0, False, 0.0)
+        smooth = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), 60, 40, I, output='smooth')
+        escaped = res < 1
+        # |z| of the values that have not escaped is clamped to the threshold,
+        # so the logarithms stay defined
+        abs_z = np.maximum(np.abs(z_res), 2.0)
+        nu = np.maximum(res * I - np.log2(np.log(abs_z) / np.log(2.0)), 0) / I
+        self.assertTrue(np.allclose(smooth[escaped], nu[escaped]))
+        self.assertTrue(np.all(smooth[~escaped] == 1))
+        
+        # the distance estimate is 0 in the set, and the distance from 
+        # c = -2.1 to the set (0.1) lies between 1/4 of the estimate and the 
+        # estimate
+        distance = mandelbrot.render((-2.0, 1.0, -1.5, 1.5), 60, 40, I, 1000.0, output='distance',
+                                     interior=True)
+        self.assertTrue(np.all(distance[smooth == 1] == 0))
+        self.assertTrue(np.all(distance[smooth < 1] > 0))
+        b = mandelbrot.render((-2.1, -2.1, 0.0, 0.0), 1, 1, 1000, 1e10, output='distance')[0, 0]
+        self.assertTrue(b / 4 <= 0.1 <= b)
+        
+        # tiled renders give the same shading
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tiled_smooth, z_res = render_tiled(rVals, iVals, os.path.join(tmp_dir, 'smooth'), I,
+                                               tile_size=16, output='smooth')
+            self.assertIsNone(z_res)
+            self.assertTrue(np.array_equal(tiled_smooth, smooth))
+            del tiled_smooth
+        
+        with self.assertRaises(ValueError):
+            mandelbrot.render(engine='numpy', output='smooth')
+        
+        # the continuous iteration count divides by log(T), so T must be 
+        # larger than 1
+        for T in (1.0, 0.5):
+            with self.assertRaisesRegex(ValueError, 'larger than 1'):
+                mandelbrot.render(width=10, height=10, threshold=T, output='smooth')
+            with self.assertRaisesRegex(ValueError, 'larger than 1'):
+                render_tiled(rVals, iVals, 'unused', I, T, output='smooth')
+
+    def test_counts(self):
+        
+        # the ratios read from the counts are identical to the ratios
+        region = (-2.0, 1.0, -1.5, 1.5)
+        for I in [100, 300]:
+            res = mandelbrot.render(region, 60, 40, I, engine='njit_par')
+            counts = mandelbrot.render(region, 60, 40, I, output='count')
+            self.assertEqual(counts.counts.dtype, np.uint8 if I < 256 else np.uint16)
+            self.assertTrue(np.array_equal(np.asarray(counts), res))
+            self.assertTrue(np.array_equal(counts[10:20, ::3], res[10:20, ::3]))
+        
+        # tiled renders save the counts and values of z as complex64
+        rVals = np.linspace(-2.0, 1.0, 60)
+        iVals = np.linspace(-1.5, 1.5, 40)
+        res = np.zeros((40, 60))
+        z_res = np.zeros((40, 60), dtype=np.complex128)
+        OM.jit_save_z_tile(rVals, iVals, res, z_res, 100, 2.0, False, 0.0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counts, z_counts = render_tiled(rVals, iVals, os.path.join(tmp_dir, 'counts'), 100, tile_size=16,
+                                            save_z=True, z_dtype=np.complex64, output='count')
+            self.assertEqual(counts.counts.dtype, np.uint8)
+            self.assertEqual(z_counts.dtype, np.complex64)
+            self.assertTrue(np.array_equal(np.asarray(counts), res))
+            self.assertTrue(np.array_equal(z_counts, z_res.astype(np.complex64)))
+            del counts, z_counts
+
+    def test_perturbation(self):
+        
+        from fractions import Fraction
+        from mandelbrot.perturbation import reference_orbit, _perturb
+        
+        # deep zoom around the Misiurewicz point c = i, far beyond float64
+        width, height, I, scale = 41, 31, 2000, 1e-30
+        res, rebases = mandelbrot.render_deep('0', '1', scale, width, height, I, return_rebases=True)
+        self.assertGreater(len(np.unique(res)), 10)
+        self.assertGreater(rebases, 0)
+        
+        # compare some of the pixels to computing them in arbitrary precision
+        step = scale / (width - 1)
+        for i in range(0, height, 6):
+            for r in range(0, width, 8):
+                cr = Fraction((r - (width - 1) / 2) * step)
+                ci = 1 + Fraction((i - (height - 1) / 2) * step)
+                Zr, Zi = reference_orbit(cr, ci, I, 2, 250)
+                exact = (len(Zr) - 1) / I if len(Zr) <= I else 1.0
+                self.assertEqual(res[i, r], exact)
+        
+        # the same far below the range where the squares of the differences
+        # underflow (around 1e-154)
+        scale = 1e-290
+        res = mandelbrot.render_deep('0', '1', scale, width, height, I)
+        self.assertGreater(len(np.unique(res)), 10)
+        step = scale / (width - 1)
+        for i in range(0, height, 6):
+            for r in range(0, width, 8):
+                cr = Fraction((r - (width - 1) / 2) * step)
+                ci = 1 + Fraction((i - (height - 1) / 2) * step)
+                Zr, Zi = reference_orbit(cr, ci, I, 2, 1200)
+                exact = (len(Zr) - 1) / I if len(Zr) <= I else 1.0
+                self.assertEqual(res[i, r], exact)
+        
+        # glitches are still detected there (|z| = 1e-170 < |delta| = 3e-170)
+        _, _, rebases = _perturb(3e-170, 0.0, 0.0, 0.0, 0, np.array([0.0, -2e-170, 0.0]), np.zeros(3), 1, 4.0)
+        self.assertEqual(rebases, 1)
+        
+        # series approximation skips iterations without changing the result
+        scale = 1e-30
+        res_no_skip, stats_no_skip = mandelbrot.render_deep('0', '1', scale, width, height, I, terms=0,
+                                                            return_stats=True)
+        res_skip, stats = mandelbrot.render_deep('0', '1', scale, width, height, I, return_stats=True)
+        self.assertEqual(stats_no_skip['skip'], 0)
+        self.assertGreater(stats['skip'], 0)
+        self.assertLess(stats['iterations'], stats_no_skip['iterations'])
+        self.assertTrue(np.array_equal(res_skip, res_no_skip))
+        
+        # for shallow views almost all values are identical to njit_par (the
+        # others are values near the boundary where float64 itself is off)
+        region = (-0.7486, -0.7386, 0.1268, 0.1368)
+        res = mandelbrot.render(region, 101, 101, 1000, engine='perturbation')
+        true_res = mandelbrot.render(region, 101, 101, 1000, engine='njit_par')
+        self.assertLess(np.mean(res != true_res), 0.01)
+
+    def test_cycle_detection(self):
+        
+        # specify (low) detail and a large number of iterations, so that the
+        # cycle detection actually skips iterations
+        detail = 100
+        I = 2000
+        
+        # initialise real and imaginary values to iterate over
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        
+        # compute the set without and with cycle detection
+        res = OM.njit_par(detail, rVals, iVals, np.zeros((detail, detail)), I, 2)
+        res_cycle = OM.njit_par(detail, rVals, iVals, np.zeros((detail, detail)), I, 2, cycle_tol=1e-12)
+        res_jit = OM.jit_func(detail, rVals, iVals, np.zeros((detail, detail)), I, 2, cycle_tol=1e-12)
+        
+        # the outputs should be identical
+        self.assertTrue(np.array_equal(res, res_cycle))
+        self.assertTrue(np.array_equal(res, res_jit))
+
+    def test_mariani_silver(self):
+        
+        # load data 
+        data_file = h5py.File('naive_output_100x100.hdf5', 'r')
+        true_data = data_file['mandelbrot'][...]
+        data_file.close()
+        
+        # specify (low) detail 
+        detail = 100
+        
+        # initialise real and imaginary values to iterate over
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        
+        # use small blocks so that the subdivision is actually tested
+        res = OM.mariani_silver(detail, rVals, iVals, np.zeros((detail, detail)), block_size=32)
+        self.assertTrue(np.allclose(res, true_data))
+        
+        # compare against njit_par() and check that pixels have been skipped
+        mismatches, fraction_iterated = OM.check_mariani_silver(detail, rVals, iVals, block_size=32)
+        self.assertEqual(mismatches, 0)
+        self.assertLess(fraction_iterated, 1)
+
+    def test_tiled(self):
+        
+        # load data 
+        data_file = h5py.File('naive_output_100x100.hdf5', 'r')
+        true_data = data_file['mandelbrot'][...]
+        data_file.close()
+        
+        # specify (low) detail 
+        detail = 100
+        
+        # initialise real and imaginary values to iterate over
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'tiled')
+            
+            # render with tiles that do not divide the grid evenly
+            res, z_res = render_tiled(rVals, iVals, path, tile_size=30, save_z=True)
+            self.assertTrue(np.allclose(res, true_data))
+            
+            # mark some tiles as not completed and resume the render
+            tiles_done = np.load(path + '_tiles.npy', mmap_mode='r+')
+            tiles_done[2:, :] = False
+            tiles_done.flush()
+            del tiles_done, res, z_res
+            
+            res, z_res = render_tiled(rVals, iVals, path, tile_size=30, save_z=True)
+            self.assertTrue(np.allclose(res, true_data))
+            del res, z_res
+
+    def test_warm_up(self):
+        
+        # compile the tile functions in a background thread
+        thread = OM.warm_up(['njit_par_tile', 'jit_save_z_tile'], background=True)
+        thread.join()
+        for name in ['njit_par_tile', 'jit_save_z_tile']:
+            self.assertEqual(len(getattr(OM, name).signatures), len(OM.SIGNATURES[name]))
+        
+        # a render calling the functions like tiled.py uses the compiled versions
+        rVals = np.linspace(-2.0, 1.0, 10)
+        res = np.zeros((10, 10))
+        OM.njit_par_tile(rVals, rVals, res, 100, 2.0, False, 0.0)
+        self.assertEqual(len(OM.njit_par_tile.signatures), len(OM.SIGNATURES['njit_par_tile']))
+        
+        with self.assertRaises(ValueError):
+            OM.warm_up(['naive'])
+
+    def test_lazy_import(self):
+        
+        # importing the compute modules in a new process does not import the
+        # heavy dependencies, calling a numba-optimised function does
+        script = ('import sys, numpy as np; import mandelbrot, mandelbrot.optimisation_methods as OM; '
+                  'import mandelbrot.tiled, mandelbrot.multiprocessing_mandelbrot, mandelbrot.benchmark; '
+                  'print(sorted(m for m in ["numba", "matplotlib", "pandas", "h5py"] if m in sys.modules)); '
+                  'r = np.linspace(-2.0, 1.0, 10); OM.njit_par(10, r, r, np.zeros((10, 10))); '
+                  'print("numba" in sys.modules)')
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        env = dict(os.environ, PYTHONPATH=root)
+        output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                                capture_output=True, text=True).stdout.split('\n')
+        self.assertEqual(output[0], '[]')
+        self.assertEqual(output[1], 'True')
+
+    def test_multiprocessing(self):
+        
+        # load data 
+        data_file = h5py.File('naive_output_100x100.hdf5', 'r')
+        true_data = data_file['mandelbrot'][...]
+        data_file.close()
+        
+        # specify (low) detail 
+        detail = 100
+        
+        # initialise real and imaginary values to iterate over
+        rVals = np.linspace(-2.0, 1.0, detail)
+        iVals = np.linspace(-1.5, 1.5, detail)
+        
+        # test both synchronous and asynchronous multiprocessing
+        for calc_async in [False, True]:
+            res = MM.multiprocessing_render(rVals, iVals, np.zeros((detail, detail)), 1, calc_async)
+            self.assertTrue(np.allclose(res, true_data))
+            
+        # test writing directly into a result matrix in shared memory
+        with MM.SharedArray((detail, detail)) as res_shared:
+            MM.multiprocessing_render(rVals, iVals, res_shared, 1)
+            self.assertTrue(np.allclose(res_shared.array, true_data))
+            
+    def test_multiprocessing_failure(self):
+        
+        rVals = np.linspace(-2.0, 1.0, 10)
+        iVals = np.linspace(-1.5, 1.5, 10)
+        res = np.zeros((10, 10))
+        
+        # the shared memory should be removed when a worker fails (here 
+        # because the maximum number of iterations is not a number)
+        shm_before = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+        with self.assertRaises(Exception):
+            MM.multiprocessing_render(rVals, iVals, res, 1, I='100')
+        shm_after = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+        self.assertEqual(shm_before, shm_after)
+
+    def test_multiprocessing_worker_killed(self):
+        
+        import gc
+        import signal
+        import threading
+        import multiprocessing as mp
+        
+        # a render that takes far longer than the test (the whole view in
+        # one process, with many iterations)
+        rVals = np.linspace(-2.0, 1.0, 1000)
+        iVals = np.linspace(-1.5, 1.5, 1000)
+        
+        # kill the worker during the render in both modes: the render should
+        # raise instead of waiting forever, and remove its shared memory
+        for calc_async in [False, True]:
+            shm_before = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+            children = set(mp.active_children())
+            errors = []
+            
+            def render():
+                try:
+                    MM.multiprocessing_render(rVals, iVals, np.zeros((1000, 1000)), 1, calc_async, I=100000)
+                except Exception as error:
+                    errors.append(error)
+            
+            thread = threading.Thread(target=render)
+            thread.start()
+            while not [p for p in mp.active_children() if p not in children] and thread.is_alive():
+                time.sleep(0.05)
+            time.sleep(0.5)
+            for p in mp.active_children():
+                if p not in children:
+                    os.kill(p.pid, signal.SIGKILL)
+            thread.join(60)
+            
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(len(errors), 1)
+            self.assertIsInstance(errors[0], RuntimeError)
+            
+            # the semaphores of the pool are removed once the pool (which the
+            # traceback of the error refers to) is garbage collected
+            del errors
+            gc.collect()
+            shm_after = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+            self.assertEqual(shm_before, shm_after)
 
 if __name__ == '__main__':
     unittest.main()